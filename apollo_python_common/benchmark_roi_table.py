@@ -0,0 +1,62 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import argparse
+import logging
+import multiprocessing
+import resource
+import time
+
+import apollo_python_common.log_util as log_util
+import apollo_python_common.proto_api as proto_api
+from apollo_python_common.roi_table import read_roi_table
+
+
+def load_metadata_dictionary(rois_file):
+    '''
+    :return: the loaded rois and their number
+    '''
+    rois_dict = proto_api.create_metadata_dictionary(proto_api.read_metadata(rois_file), False)
+    return rois_dict, sum([len(rois) for rois in rois_dict.values()])
+
+
+def load_roi_table(rois_file):
+    roi_table = read_roi_table(rois_file)
+    return roi_table, len(roi_table)
+
+
+def measure_load(load_function, rois_file, results):
+    start = time.time()
+    _, nr_rois = load_function(rois_file)
+    load_time = time.time() - start
+    # ru_maxrss is in kilobytes on linux
+    results.put((load_time, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, nr_rois))
+
+
+def benchmark(rois_file):
+    '''
+    Loads the rois file in a new process for each loader, and logs the load time and the peak memory of the process
+    '''
+    logger = logging.getLogger(__name__)
+    context = multiprocessing.get_context("spawn")
+    for name, load_function in [("protobuf dictionary", load_metadata_dictionary), ("roi table", load_roi_table)]:
+        results = context.Queue()
+        process = context.Process(target=measure_load, args=(load_function, rois_file, results))
+        process.start()
+        load_time, peak_memory, nr_rois = results.get()
+        process.join()
+        logger.info("{}: {} rois loaded in {:.2f} s, peak memory {:.0f} MB".format(name, nr_rois, load_time,
+                                                                                  peak_memory))
+
+
+if __name__ == "__main__":
+    log_util.config(__file__)
+    parser = argparse.ArgumentParser(description='Load time and memory of a rois file as protobuf dictionary and as '
+                                                 'RoiTable.')
+    parser.add_argument("-i", "--rois_file", type=str, required=True)
+    args = parser.parse_args()
+    benchmark(args.rois_file)
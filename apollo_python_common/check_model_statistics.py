@@ -0,0 +1,88 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import argparse
+import logging
+import sys
+import time
+
+import apollo_python_common.log_util as log_util
+import apollo_python_common.proto_api as proto_api
+from apollo_python_common.generate_model_statistics import get_model_statistics, match_image_rois, \
+    match_image_rois_by_pairs
+
+
+def get_values(statistics):
+    return statistics.true_positives, statistics.false_positives, statistics.false_negatives, \
+           statistics.miss_classified, statistics.iou
+
+
+def get_statistics_differences(statistics_dict, reference_statistics_dict):
+    '''
+    :return: list of (key, statistics, reference statistics) which are not identical, the keys being compared in order
+    '''
+    differences = list()
+    keys = list(statistics_dict.keys())
+    reference_keys = list(reference_statistics_dict.keys())
+    if keys != reference_keys:
+        differences.append(("keys", keys, reference_keys))
+    for key in reference_keys:
+        statistics = statistics_dict.get(key)
+        reference_statistics = reference_statistics_dict[key]
+        if statistics is None or get_values(statistics) != get_values(reference_statistics):
+            differences.append((key, statistics, reference_statistics))
+    return differences
+
+
+def check_model_statistics(expected_rois_file, actual_rois_file, min_size, nr_processes):
+    '''
+    Computes the statistics with the matrix matching and with the pair by pair matching, and with the matrix matching
+    in nr_processes processes, and logs their differences
+    :return: number of differences
+    '''
+    logger = logging.getLogger(__name__)
+    expected_dictionary = proto_api.create_metadata_dictionary(proto_api.read_metadata(expected_rois_file), True)
+    actual_dictionary = proto_api.create_metadata_dictionary(proto_api.read_metadata(actual_rois_file), False)
+
+    start = time.time()
+    reference_statistics_dict = get_model_statistics(expected_dictionary, actual_dictionary, None, min_size,
+                                                     match_image_rois_by_pairs)
+    pairs_time = time.time() - start
+    start = time.time()
+    statistics_dict = get_model_statistics(expected_dictionary, actual_dictionary, None, min_size, match_image_rois)
+    matrix_time = time.time() - start
+
+    start = time.time()
+    parallel_statistics_dict = get_model_statistics(expected_dictionary, actual_dictionary, None, min_size,
+                                                    match_image_rois, nr_processes)
+    parallel_time = time.time() - start
+
+    differences = get_statistics_differences(statistics_dict, reference_statistics_dict)
+    for key, statistics, reference_statistics in differences:
+        logger.error("{}: {} pair by pair: {}".format(key, statistics, reference_statistics))
+    parallel_differences = get_statistics_differences(parallel_statistics_dict, statistics_dict)
+    for key, statistics, reference_statistics in parallel_differences:
+        logger.error("{}: {} processes: {} one process: {}".format(key, nr_processes, statistics,
+                                                                   reference_statistics))
+    logger.info("images = {} pair by pair = {:.2f} s matrix = {:.2f} s matrix with {} processes = {:.2f} s "
+                "differences = {}".format(len(expected_dictionary), pairs_time, matrix_time, nr_processes,
+                                          parallel_time, len(differences) + len(parallel_differences)))
+    return len(differences) + len(parallel_differences)
+
+
+if __name__ == "__main__":
+    log_util.config(__file__)
+    parser = argparse.ArgumentParser(description='Checks that the matrix matching of generate_model_statistics gives '
+                                                 'the same statistics as the pair by pair matching, in one or '
+                                                 'several processes.')
+    parser.add_argument("-e", "--expected_rois_file", type=str, required=True)
+    parser.add_argument("-a", "--actual_rois_file", type=str, required=True)
+    parser.add_argument("--min_size", type=int, required=False, default=25)
+    parser.add_argument("-p", "--nr_processes", type=int, required=False, default=4)
+    args = parser.parse_args()
+    sys.exit(1 if check_model_statistics(args.expected_rois_file, args.actual_rois_file, args.min_size,
+                                         args.nr_processes) > 0 else 0)
@@ -6,23 +6,74 @@ License, v. 2.0. If a copy of the MPL was not distributed with this
 file, You can obtain one at http://mozilla.org/MPL/2.0/.
 """
 import argparse
+import math
 import os
 import cv2
 from collections import defaultdict
+from multiprocessing import Pool
 import random
+import numpy as np
 
-import apollo_python_common.proto_api as proto_api
+import apollo_python_common.io_utils as io_utils
+from apollo_python_common.roi_table import read_metadata_dictionary
 import orbb_definitions_pb2
 import apollo_python_common.rectangle as rectangle
 
+# each process of the pool evaluates several shards, so that a slow shard does not keep the other processes idle
+SHARDS_PER_PROCESS = 4
+
+# the dictionaries evaluated by the processes of the pool, inherited from the parent process
+_shard_data = None
+
+
+def add_to_partials(partials, value):
+    '''
+    Adds a value to a list of non overlapping partial sums whose exact sum is the sum of all the values added, so that
+    the sum does not depend on the order of the values, see math.fsum
+    '''
+    i = 0
+    for partial in partials:
+        if abs(value) < abs(partial):
+            value, partial = partial, value
+        high = value + partial
+        low = partial - (high - value)
+        if low:
+            partials[i] = low
+            i += 1
+        value = high
+    partials[i:] = [value]
+
 
 class Statistics(object):
+    '''
+    Counts of a class. The iou is the sum of the ious of the true positives for a class and their mean for the Total.
+    The sum of the ious is kept exactly, so that statistics merged in any order give the same iou.
+    '''
     def __init__(self):
         self.true_positives = 0
         self.false_positives = 0
         self.false_negatives = 0
         self.miss_classified = 0
         self.iou = 0
+        self.iou_partials = list()
+
+    def add_iou(self, iou):
+        add_to_partials(self.iou_partials, iou)
+
+    def iou_sum(self):
+        return math.fsum(self.iou_partials)
+
+    def merge(self, other):
+        '''
+        Adds the counts and the ious of other statistics
+        '''
+        self.true_positives += other.true_positives
+        self.false_positives += other.false_positives
+        self.false_negatives += other.false_negatives
+        self.miss_classified += other.miss_classified
+        for partial in other.iou_partials:
+            self.add_iou(partial)
+        return self
 
     def recall(self):
         if self.true_positives + self.false_negatives > 0:
@@ -98,7 +149,7 @@ def select_true_positives(actual_roi, expected_roi, statistics_dict, min_size, i
         rect_e = rectangle.Rectangle(expected_roi.rect.tl.col, expected_roi.rect.tl.row, expected_roi.rect.br.col,
                            expected_roi.rect.br.row)
         iou = rect_a.intersection_over_union(rect_e)
-        statistics_dict[type_string].iou += iou
+        statistics_dict[type_string].add_iou(iou)
         copy_image_roi_to_folder(images_folder, "tp", file_name, actual_roi)
 
 
@@ -129,40 +180,206 @@ def select_false_positives(actual_rois, expected_rois, statistics_dict, min_size
             copy_image_roi_to_folder(images_folder, "fp", file_name, rois_a)
 
 
-def get_model_statistics(expected_dictionary, actual_dictionary, images_folder, min_size):
+def match_image_rois_by_pairs(expected_rois, actual_rois, statistics_dict, min_size, images_folder, file_name):
+    '''
+    Adds the statistics of an image comparing the rois pair by pair
+    '''
+    for expected_roi in expected_rois:
+        actual_roi = select_best_area_match(actual_rois, expected_roi)
+        if actual_roi:
+            select_true_positives(actual_roi, expected_roi, statistics_dict, min_size, images_folder, file_name)
+            select_miss_classified(actual_roi, expected_roi, statistics_dict, min_size, images_folder, file_name)
+        else:
+            select_false_negative(expected_roi, statistics_dict, min_size, images_folder, file_name)
+    select_false_positives(actual_rois, expected_rois, statistics_dict, min_size, images_folder, file_name)
+
+
+def get_rects(rois):
+    '''
+    :return: n x 4 array with the xmin, ymin, xmax, ymax of the rois
+    '''
+    return np.array([[roi.rect.tl.col, roi.rect.tl.row, roi.rect.br.col, roi.rect.br.row] for roi in rois],
+                    dtype=np.int64).reshape(-1, 4)
+
+
+def get_areas(rects):
+    return (rects[:, 2] - rects[:, 0]).astype(np.float64) * (rects[:, 3] - rects[:, 1]).astype(np.float64)
+
+
+def get_intersection_areas(rects_a, rects_b):
+    '''
+    :return: len(rects_a) x len(rects_b) matrix with the areas of the overlapped rectangles, as computed by
+    Rectangle.get_overlapped_rect
+    '''
+    x_min = np.maximum(rects_a[:, None, 0], rects_b[None, :, 0])
+    y_min = np.maximum(rects_a[:, None, 1], rects_b[None, :, 1])
+    x_max = np.minimum(rects_a[:, None, 2], rects_b[None, :, 2])
+    y_max = np.minimum(rects_a[:, None, 3], rects_b[None, :, 3])
+    areas = (x_max - x_min).astype(np.float64) * (y_max - y_min).astype(np.float64)
+    return np.where((x_min <= x_max) & (y_min <= y_max), areas, 0.0)
+
+
+def get_overlaps(intersection_areas, actual_areas):
+    '''
+    :return: matrix with the intersection areas relative to the area of the actual rois, as computed by rois_intersect,
+    0 where the rois do not intersect
+    '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        overlaps = intersection_areas / actual_areas[None, :]
+    return np.where(intersection_areas != 0, overlaps, 0.0)
+
+
+def get_valid_sizes(rects, min_size):
+    '''
+    :return: boolean array, see valid_size
+    '''
+    return np.minimum(rects[:, 2] - rects[:, 0], rects[:, 3] - rects[:, 1]) >= min_size
+
+
+def match_image_rois(expected_rois, actual_rois, statistics_dict, min_size, images_folder, file_name):
+    '''
+    Adds the statistics of an image with the same criteria as match_image_rois_by_pairs, computing the intersections
+    of all the rois of the image at once
+    '''
+    expected_rects = get_rects(expected_rois)
+    actual_rects = get_rects(actual_rois)
+    intersection_areas = get_intersection_areas(expected_rects, actual_rects)
+    expected_valid = get_valid_sizes(expected_rects, min_size)
+    actual_valid = get_valid_sizes(actual_rects, min_size)
+    expected_types = [orbb_definitions_pb2.Mark.Name(roi.type) for roi in expected_rois]
+    actual_types = [orbb_definitions_pb2.Mark.Name(roi.type) for roi in actual_rois]
+
+    if len(actual_rois) > 0:
+        actual_areas = get_areas(actual_rects)
+        overlaps = get_overlaps(intersection_areas, actual_areas)
+        # the first actual roi with the highest overlap is the best match
+        best_matches = np.argmax(overlaps, axis=1)
+        has_match = overlaps[np.arange(len(expected_rois)), best_matches] > 0
+        matched_intersection_areas = intersection_areas[np.arange(len(expected_rois)), best_matches]
+        union_areas = actual_areas[best_matches] + get_areas(expected_rects) - matched_intersection_areas
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ious = np.where(union_areas != 0, matched_intersection_areas / union_areas, 0.0)
+    else:
+        best_matches = np.zeros(len(expected_rois), dtype=np.int64)
+        has_match = np.zeros(len(expected_rois), dtype=bool)
+        ious = np.zeros(len(expected_rois))
+
+    for expected_index, expected_roi in enumerate(expected_rois):
+        type_string = expected_types[expected_index]
+        if has_match[expected_index]:
+            actual_index = best_matches[expected_index]
+            if not (actual_valid[actual_index] or expected_valid[expected_index]):
+                continue
+            if actual_types[actual_index] == type_string:
+                statistics_dict[type_string].true_positives += 1
+                statistics_dict[type_string].add_iou(float(ious[expected_index]))
+                copy_image_roi_to_folder(images_folder, "tp", file_name, actual_rois[actual_index])
+            else:
+                statistics_dict[type_string].miss_classified += 1
+                copy_image_roi_to_folder(images_folder, "mc", file_name, expected_roi)
+        elif expected_valid[expected_index]:
+            statistics_dict[type_string].false_negatives += 1
+            copy_image_roi_to_folder(images_folder, "fn", file_name, expected_roi)
+
+    found = np.any(intersection_areas != 0, axis=0)
+    for actual_index in np.nonzero(~found & actual_valid)[0]:
+        statistics_dict[actual_types[actual_index]].false_positives += 1
+        copy_image_roi_to_folder(images_folder, "fp", file_name, actual_rois[actual_index])
+
+
+def get_files_statistics(expected_dictionary, actual_dictionary, file_names, images_folder, min_size,
+                         match_image=match_image_rois):
+    '''
+    :return: dictionary with the Statistics of each class for some files of the expected dictionary, without the Total
+    '''
     statistics_dict = defaultdict(Statistics)
-    for expected_file in expected_dictionary.keys():
+    for expected_file in file_names:
         if expected_file not in actual_dictionary.keys():
             print("Error miss match file " + expected_file)
             actual_rois = list()
         else:
             actual_rois = actual_dictionary[expected_file]
         expected_rois = expected_dictionary[expected_file]
-        for expected_roi in expected_rois:
-            actual_roi = select_best_area_match(actual_rois, expected_roi)
-            if actual_roi:
-                select_true_positives(actual_roi, expected_roi, statistics_dict, min_size, images_folder, expected_file)
-                select_miss_classified(actual_roi, expected_roi, statistics_dict, min_size, images_folder, expected_file)
-            else:
-                select_false_negative(expected_roi, statistics_dict, min_size, images_folder, expected_file)
-        select_false_positives(actual_rois, expected_rois, statistics_dict, min_size, images_folder, expected_file)
+        match_image(expected_rois, actual_rois, statistics_dict, min_size, images_folder, expected_file)
+    return statistics_dict
+
+
+def merge_statistics(statistics_dicts):
+    '''
+    Merges the statistics of shards of the files. When the shards are given in the order of the files, the classes are
+    in the same order as when the files are evaluated together.
+    '''
+    merged_statistics_dict = defaultdict(Statistics)
+    for statistics_dict in statistics_dicts:
+        for key, statistic in statistics_dict.items():
+            merged_statistics_dict[key].merge(statistic)
+    return merged_statistics_dict
+
 
+def add_total_statistics(statistics_dict):
+    '''
+    Sets the iou of each class to the sum of its true positive ious and adds the Total of the classes except INVALID
+    '''
     total_statistic = Statistics()
     for key, statistic in statistics_dict.items():
+        statistic.iou = statistic.iou_sum()
         if key not in ['INVALID']:
-            total_statistic.true_positives += statistic.true_positives
-            total_statistic.false_positives += statistic.false_positives
-            total_statistic.false_negatives += statistic.false_negatives
-            total_statistic.miss_classified += statistic.miss_classified
-            total_statistic.iou += statistic.iou
+            total_statistic.merge(statistic)
     if total_statistic.true_positives > 0:
-        total_statistic.iou = total_statistic.iou / total_statistic.true_positives
+        total_statistic.iou = total_statistic.iou_sum() / total_statistic.true_positives
     else:
         total_statistic.iou = 0
     statistics_dict["Total"] = total_statistic
     return statistics_dict
 
 
+def get_shards(file_names, nr_shards):
+    '''
+    :return: list of nr_shards consecutive slices of the file names
+    '''
+    shard_size = int(math.ceil(len(file_names) / max(nr_shards, 1)))
+    return [file_names[start:start + shard_size] for start in range(0, len(file_names), max(shard_size, 1))]
+
+
+def init_shard_process(expected_dictionary, actual_dictionary, images_folder, min_size, match_image):
+    global _shard_data
+    _shard_data = (expected_dictionary, actual_dictionary, images_folder, min_size, match_image)
+
+
+def get_shard_statistics(file_names):
+    expected_dictionary, actual_dictionary, images_folder, min_size, match_image = _shard_data
+    return get_files_statistics(expected_dictionary, actual_dictionary, file_names, images_folder, min_size,
+                                match_image)
+
+
+def get_classes_statistics(expected_dictionary, actual_dictionary, file_names, images_folder, min_size,
+                           match_image=match_image_rois, nr_processes=1):
+    '''
+    :return: dictionary with the Statistics of each class for some files of the expected dictionary, without the
+    Total, evaluated by nr_processes processes
+    '''
+    if nr_processes <= 1 or len(file_names) <= 1:
+        return get_files_statistics(expected_dictionary, actual_dictionary, file_names, images_folder, min_size,
+                                    match_image)
+    # the processes are forked, so the dictionaries are not copied to each process
+    with Pool(nr_processes, initializer=init_shard_process,
+              initargs=(expected_dictionary, actual_dictionary, images_folder, min_size, match_image)) as pool:
+        return merge_statistics(pool.map(get_shard_statistics,
+                                         get_shards(file_names, nr_processes * SHARDS_PER_PROCESS)))
+
+
+def get_model_statistics(expected_dictionary, actual_dictionary, images_folder, min_size,
+                         match_image=match_image_rois, nr_processes=1):
+    '''
+    :param match_image: function adding the statistics of the rois of an image, match_image_rois or
+    match_image_rois_by_pairs
+    :param nr_processes: number of processes evaluating shards of the files, the result does not depend on it
+    '''
+    return add_total_statistics(get_classes_statistics(expected_dictionary, actual_dictionary,
+                                                       list(expected_dictionary.keys()), images_folder, min_size,
+                                                       match_image, nr_processes))
+
+
 def output_statistics(statistics_dict, result_file):
     with open(result_file, "w") as file:
         for key, statistics_element in statistics_dict.items():
@@ -174,31 +391,54 @@ def output_statistics(statistics_dict, result_file):
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-e", "--expected_rois_file",
-                        type=str, required=True)
+                        type=str, required=False)
     parser.add_argument("-a", "--actual_rois_file",
-                        type=str, required=True)
+                        type=str, required=False)
     parser.add_argument("-i", "--images_folder",
                         type=str, required=False)
     parser.add_argument("-o", "--result_file",
                         type=str, required=False)
+    parser.add_argument("-p", "--nr_processes",
+                        type=int, required=False, default=1)
+    parser.add_argument("--nr_shards", type=int, required=False, default=1,
+                        help="number of separate invocations the expected files are split in")
+    parser.add_argument("--shard_index", type=int, required=False, default=0,
+                        help="shard of the expected files evaluated by this invocation")
+    parser.add_argument("--shard_file", type=str, required=False,
+                        help="pickle file where the statistics of the shard are saved, instead of the result file")
+    parser.add_argument("--merge_shard_files", type=str, nargs="+", required=False,
+                        help="shard files to merge in the result file, in the order of their shard index")
     args = parser.parse_args()
 
+    if args.merge_shard_files is not None:
+        statistics_dict = add_total_statistics(merge_statistics([io_utils.pickle_load(shard_file)
+                                                                 for shard_file in args.merge_shard_files]))
+        output_statistics(statistics_dict, args.result_file)
+        return
+    if args.expected_rois_file is None or args.actual_rois_file is None:
+        parser.error("the expected and actual rois files are required")
+
     expected_rois_file = args.expected_rois_file
     actual_rois_file = args.actual_rois_file
     images_folder = args.images_folder
 
-    expected_metadata = proto_api.read_metadata(expected_rois_file)
-    actual_metadata = proto_api.read_metadata(actual_rois_file)
-
     random.seed(1337)
 
-    expected_dictionary = proto_api.create_metadata_dictionary(expected_metadata, True)
-    actual_dictionary = proto_api.create_metadata_dictionary(actual_metadata, False)
+    # the rois files are parsed once, the next runs read their cached tables
+    expected_dictionary = read_metadata_dictionary(expected_rois_file, True)
+    actual_dictionary = read_metadata_dictionary(actual_rois_file, False)
     min_size = 25
-    statistics_dict = get_model_statistics(expected_dictionary, actual_dictionary, images_folder, min_size)
-    output_statistics(statistics_dict, args.result_file)
+    file_names = list(expected_dictionary.keys())
+    if args.nr_shards > 1:
+        shards = get_shards(file_names, args.nr_shards)
+        file_names = shards[args.shard_index] if args.shard_index < len(shards) else list()
+    statistics_dict = get_classes_statistics(expected_dictionary, actual_dictionary, file_names, images_folder,
+                                             min_size, nr_processes=args.nr_processes)
+    if args.shard_file is not None:
+        io_utils.pickle_dump(statistics_dict, os.path.abspath(args.shard_file))
+        return
+    output_statistics(add_total_statistics(statistics_dict), args.result_file)
 
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,141 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import grpc
+
+import apollo_python_common.image
+import apollo_python_common.io_utils as io_utils
+import apollo_python_common.log_util as log_util
+import apollo_python_common.shared_memory as shared_memory
+from apollo_python_common.protobuf import inference_service_pb2
+from apollo_python_common.protobuf import inference_service_pb2_grpc
+
+TRANSPORTS = ['path', 'bytes', 'shm']
+SEGMENT_NAME = 'inference_benchmark'
+NR_CONCURRENT_REQUESTS = 8
+MAX_MESSAGE_LENGTH = 256 * 1024 * 1024
+
+
+def get_path_requests(image_paths):
+    return [inference_service_pb2.DetectionRequest(images_path=image_path) for image_path in image_paths]
+
+
+def get_bytes_requests(image_paths, images_per_request):
+    requests = list()
+    for start in range(0, len(image_paths), images_per_request):
+        request = inference_service_pb2.ImageBytesRequest()
+        for image_path in image_paths[start:start + images_per_request]:
+            with open(image_path, 'rb') as image_file:
+                request.images.add(image_path=os.path.basename(image_path), data=image_file.read())
+        requests.append(request)
+    return requests
+
+
+def write_shared_memory_frames(image_paths):
+    '''
+    Decodes the images in a shared memory segment, as a producer keeping decoded frames would
+    :return: list of SharedMemoryFrame, one for each image
+    '''
+    images = [apollo_python_common.image.get_bgr(image_path) for image_path in image_paths]
+    segment = shared_memory.create_segment(SEGMENT_NAME, sum([image.size for image in images]))
+    frames = list()
+    offset = 0
+    for image_path, image in zip(image_paths, images):
+        frames.append(inference_service_pb2.SharedMemoryFrame(image_path=os.path.basename(image_path), offset=offset,
+                                                              width=image.shape[1], height=image.shape[0]))
+        offset = shared_memory.write_frame(segment, offset, image)
+    segment.close()
+    return frames
+
+
+def get_shared_memory_requests(frames, images_per_request):
+    requests = list()
+    for start in range(0, len(frames), images_per_request):
+        request = inference_service_pb2.SharedMemoryRequest(segment_name=SEGMENT_NAME)
+        request.frames.extend(frames[start:start + images_per_request])
+        requests.append(request)
+    return requests
+
+
+def run_requests(method, requests, nr_concurrent_requests):
+    '''
+    :return: number of images in the responses, elapsed time in seconds
+    '''
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=nr_concurrent_requests) as executor:
+        nr_images = sum([len(response.images) for response in executor.map(method, requests)])
+    return nr_images, time.time() - start
+
+
+def benchmark(host, port, input_path, transports, images_per_request, nr_concurrent_requests, max_number_of_images):
+    logger = logging.getLogger(__name__)
+    channel = grpc.insecure_channel(host + ":" + str(port),
+                                    options=[('grpc.max_receive_message_length', MAX_MESSAGE_LENGTH)])
+    stub = inference_service_pb2_grpc.InferenceServiceStub(channel)
+    image_paths = sorted(io_utils.get_images_from_folder(input_path))[:max_number_of_images]
+    if len(image_paths) == 0:
+        logger.warning("No images to benchmark")
+        return
+
+    # the first request initializes the server caches, it is not timed
+    stub.process(inference_service_pb2.DetectionRequest(images_path=image_paths[0]))
+    for transport in transports:
+        if transport == 'path':
+            method, requests = stub.process, get_path_requests(image_paths)
+        elif transport == 'bytes':
+            method, requests = stub.process_images, get_bytes_requests(image_paths, images_per_request)
+        else:
+            start = time.time()
+            frames = write_shared_memory_frames(image_paths)
+            logger.info("shm    producer decoding {:.1f} ms/image, not included below".format(
+                1000 * (time.time() - start) / len(image_paths)))
+            method, requests = stub.process_shared_memory, get_shared_memory_requests(frames, images_per_request)
+        try:
+            nr_images, elapsed_time = run_requests(method, requests, nr_concurrent_requests)
+        finally:
+            if transport == 'shm':
+                shared_memory.remove_segment(SEGMENT_NAME)
+        logger.info("{:6s} images = {} requests = {} {:.2f} images/sec {:.1f} ms/image".format(
+            transport, nr_images, len(requests), nr_images / elapsed_time, 1000 * elapsed_time / max(nr_images, 1)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares the throughput of the inference requests with image paths, '
+                                                 'encoded image bytes and shared memory frames.')
+    parser.add_argument(
+        "-i", "--input_path", type=str, required=True)
+    parser.add_argument(
+        "-t", "--host", type=str, required=False, default="localhost")
+    parser.add_argument(
+        "-p", "--port", type=int, required=False, default=31338)
+    parser.add_argument(
+        "--transports", type=str, nargs='+', choices=TRANSPORTS, required=False, default=TRANSPORTS)
+    parser.add_argument(
+        "--images_per_request", type=int, required=False, default=1,
+        help="images in a bytes or shm request, path requests always have one image")
+    parser.add_argument(
+        "-c", "--nr_concurrent_requests", type=int, required=False, default=NR_CONCURRENT_REQUESTS)
+    parser.add_argument(
+        "--max_number_of_images", type=int, required=False, default=200)
+    args = parser.parse_args()
+    benchmark(args.host, args.port, args.input_path, args.transports, args.images_per_request,
+              args.nr_concurrent_requests, args.max_number_of_images)
+
+
+if __name__ == "__main__":
+    log_util.config(__file__)
+    logger = logging.getLogger(__name__)
+    try:
+        main()
+    except Exception as err:
+        logger.error(err, exc_info=True)
@@ -0,0 +1,93 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import argparse
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import grpc
+import numpy as np
+
+import apollo_python_common.io_utils as io_utils
+import apollo_python_common.log_util as log_util
+import apollo_python_common.proto_api as proto_api
+from apollo_python_common.protobuf import inference_service_pb2
+from apollo_python_common.protobuf import inference_service_pb2_grpc
+
+NR_CONCURRENT_REQUESTS = 8
+
+
+def send_request(stub, images_path):
+    '''
+    :return: images path, response metadata or None when the request failed, latency in seconds
+    '''
+    logger = logging.getLogger(__name__)
+    start = time.time()
+    try:
+        metadata = stub.process(inference_service_pb2.DetectionRequest(images_path=images_path))
+    except grpc.RpcError as err:
+        logger.error('Request {} failed: {} {}'.format(images_path, err.code(), err.details()))
+        metadata = None
+    return images_path, metadata, time.time() - start
+
+
+def start_client(host, port, input_path, output_path, nr_concurrent_requests):
+    '''
+    Sends one request for each image of the input folder, keeping nr_concurrent_requests requests in flight, and
+    saves all the responses in one metadata file
+    '''
+    logger = logging.getLogger(__name__)
+    io_utils.create_folder(output_path)
+    channel = grpc.insecure_channel(host + ":" + str(port))
+    stub = inference_service_pb2_grpc.InferenceServiceStub(channel)
+    image_paths = sorted(io_utils.get_images_from_folder(input_path))
+
+    output_metadata = proto_api.get_new_metadata_file()
+    latencies = list()
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=nr_concurrent_requests) as executor:
+        for images_path, metadata, latency in executor.map(lambda path: send_request(stub, path), image_paths):
+            if metadata is not None:
+                output_metadata.images.extend(metadata.images)
+                latencies.append(latency)
+    elapsed_time = time.time() - start
+
+    proto_api.serialize_metadata(output_metadata, output_path, 'rois')
+    if len(latencies) > 0:
+        logger.info('requests = {} failed = {} requests/sec = {:.2f} latency p50 = {:.1f} ms p95 = {:.1f} ms '
+                    'max = {:.1f} ms'.format(len(image_paths), len(image_paths) - len(latencies),
+                                             len(latencies) / elapsed_time,
+                                             1000 * np.percentile(latencies, 50), 1000 * np.percentile(latencies, 95),
+                                             1000 * max(latencies)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sends concurrent requests, one per image, to an inference server.')
+    parser.add_argument(
+        "-i", "--input_path", type=str, required=True)
+    parser.add_argument(
+        "-o", "--output_path", type=str, required=False, default="./out")
+    parser.add_argument(
+        "-t", "--host", type=str, required=False, default="localhost")
+    parser.add_argument(
+        "-p", "--port", type=int, required=False, default=31338)
+    parser.add_argument(
+        "-c", "--nr_concurrent_requests", type=int, required=False, default=NR_CONCURRENT_REQUESTS)
+    args = parser.parse_args()
+    start_client(args.host, args.port, args.input_path, args.output_path, args.nr_concurrent_requests)
+
+
+if __name__ == "__main__":
+    log_util.config(__file__)
+    logger = logging.getLogger(__name__)
+    logger.info("Processing with concurrent GRPC client...")
+    try:
+        main()
+    except Exception as err:
+        logger.error(err, exc_info=True)
+    logger.info("Concurrent GRPC client finalised.")
@@ -6,19 +6,42 @@ License, v. 2.0. If a copy of the MPL was not distributed with this
 file, You can obtain one at http://mozilla.org/MPL/2.0/.
 """
 import argparse
+import os
 import grpc
 from apollo_python_common.protobuf import inference_service_pb2_grpc
 from apollo_python_common.protobuf import inference_service_pb2
-from apollo_python_common.proto_api import serialize_metadata
+from apollo_python_common.proto_api import serialize_metadata, write_delimited_image
 import apollo_python_common.log_util as log_util
 import logging
 import apollo_python_common.io_utils as io_utils
 
 
-def start_client(host, port, input_path, output_path):
+def write_stream(stub, input_path, output_path, group_size):
+    '''
+    Writes the images of the streamed results to output_path/rois.delimited as soon as they are received, each one
+    prefixed by its size, see proto_api.read_delimited_images
+    '''
+    logger = logging.getLogger(__name__)
+    nr_images = 0
+    with open(os.path.join(output_path, "rois.delimited"), "wb") as delimited_file:
+        for result in stub.process_stream(inference_service_pb2.DetectionRequest(images_path=input_path,
+                                                                                 group_size=group_size)):
+            for image_proto in result.images:
+                write_delimited_image(image_proto, delimited_file)
+            delimited_file.flush()
+            nr_images += len(result.images)
+            logger.debug('Received {} images starting from index {}'.format(len(result.images),
+                                                                           result.first_image_index))
+    logger.info('Received {} images'.format(nr_images))
+
+
+def start_client(host, port, input_path, output_path, stream=False, group_size=1):
     io_utils.create_folder(output_path)
     channel = grpc.insecure_channel(host + ":" + str(port))
     stub = inference_service_pb2_grpc.InferenceServiceStub(channel)
+    if stream:
+        write_stream(stub, input_path, output_path, group_size)
+        return
     metadata = stub.process(inference_service_pb2.DetectionRequest(
         images_path=input_path))
     if metadata is not None:
@@ -37,12 +60,16 @@ def main():
         "-t", "--host", type=str, required=False, default="localhost")
     parser.add_argument(
         "-p", "--port", type=int, required=False, default=31338)
+    parser.add_argument(
+        "-s", "--stream", action="store_true", help="write the images incrementally in a length delimited file")
+    parser.add_argument(
+        "-g", "--group_size", type=int, required=False, default=1, help="number of images in a streamed result")
     args = parser.parse_args()
     input_path = args.input_path
     output_path = args.output_path
     host = args.host
     port = args.port
-    start_client(host, port, input_path, output_path)
+    start_client(host, port, input_path, output_path, args.stream, args.group_size)
 
 
 if __name__ == "__main__":
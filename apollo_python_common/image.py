@@ -6,6 +6,7 @@ License, v. 2.0. If a copy of the MPL was not distributed with this
 file, You can obtain one at http://mozilla.org/MPL/2.0/.
 """
 import cv2
+import numpy as np
 from PIL import Image
 import os
 from os.path import splitext
@@ -39,6 +40,18 @@ def get_bgr(image_path):
         raise Exception("Image {} is missing.".format(image_path))
 
 
+def get_bgr_from_bytes(data, image_name):
+    '''
+    :param data: encoded image file content
+    :param image_name: name of the image, for the error message
+    :return: decoded BGR image
+    '''
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise Exception("Image {} is invalid.".format(image_name))
+    return image
+
+
 def get_rgb(image_path):
     image_bgr = get_bgr(image_path)
     return cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
@@ -0,0 +1,77 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+from queue import Queue, Empty
+from threading import Lock, Thread
+
+import amqpstorm
+
+from apollo_python_common.ml_pipeline.broker import Broker, Delivery
+from apollo_python_common.ml_pipeline.config_api import MQ_Param, get_config_param
+
+MQ_PORT = 5672
+
+
+class AmqpBroker(Broker):
+    '''
+    RabbitMQ broker. The messages are consumed by a background thread, the prefetch limit is applied by the server.
+    '''
+
+    def __init__(self, host, port, username, password):
+        self.connection = amqpstorm.Connection(host, username, password, port=port)
+        self.consume_channel = self.connection.channel()
+        self.publish_channel = self.connection.channel()
+        self.publish_lock = Lock()
+        self.deliveries = Queue()
+        self.consumer = None
+
+    def start_consuming(self, queue_name, prefetch_count, no_ack=False):
+        self.consume_channel.basic.qos(prefetch_count=prefetch_count)
+        self.consume_channel.basic.consume(self.__on_message, queue=queue_name, no_ack=no_ack)
+        # the bodies are serialized protobufs, they are not decoded to text
+        self.consumer = Thread(target=self.consume_channel.start_consuming, kwargs={"auto_decode": False},
+                               daemon=True)
+        self.consumer.start()
+
+    def __on_message(self, message):
+        self.deliveries.put(Delivery(message.delivery_tag, message.body, message))
+
+    def set_prefetch_count(self, prefetch_count):
+        # RabbitMQ applies a new per consumer limit only to the consumers started after it, a channel wide limit
+        # applies at once and the server enforces both
+        self.consume_channel.basic.qos(prefetch_count=prefetch_count, global_=True)
+
+    def get(self, timeout):
+        try:
+            return self.deliveries.get(timeout=timeout)
+        except Empty:
+            return None
+
+    def ack(self, delivery):
+        delivery.message.ack()
+
+    def reject(self, delivery, requeue=False):
+        delivery.message.reject(requeue=requeue)
+
+    def publish(self, queue_name, body):
+        with self.publish_lock:
+            amqpstorm.Message.create(self.publish_channel, body).publish(routing_key=queue_name)
+
+    def close(self):
+        if self.consumer is not None:
+            self.consume_channel.stop_consuming()
+        self.connection.close()
+
+
+def get_amqp_broker(config):
+    '''
+    :param config: dictionary with the MQ_Param connection settings, overridden by the environment variables
+    '''
+    return AmqpBroker(get_config_param(MQ_Param.MQ_HOST, config),
+                      int(get_config_param(MQ_Param.MQ_PORT, config, MQ_PORT)),
+                      get_config_param(MQ_Param.MQ_USERNAME, config),
+                      get_config_param(MQ_Param.MQ_PASSWORD, config))
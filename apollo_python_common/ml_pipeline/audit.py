@@ -0,0 +1,270 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import datetime
+import json
+import logging
+import os
+import time
+from threading import Condition, Lock, Thread
+
+import apollo_python_common.io_utils as io_utils
+from apollo_python_common.ml_pipeline.config_api import MQ_Param, get_config_param
+
+MAX_BUFFERED_RECORDS = 10000
+FLUSH_SIZE = 500
+FLUSH_INTERVAL = 5.0
+
+# records which do not fit in the buffer or fail to be written are dropped
+OVERFLOW_DROP = "drop"
+# records which do not fit in the buffer or fail to be written are appended to the spill file
+OVERFLOW_SPILL = "spill"
+
+STATUS_PUBLISHED = "published"
+STATUS_ERROR = "error"
+
+
+def get_audit_record(envelope, status, error=None):
+    '''
+    :param envelope: MessageEnvelope whose processing ended
+    :param status: STATUS_PUBLISHED or STATUS_ERROR
+    :param error: exception which made the processing fail
+    :return: dictionary with the outcome and the stage times of the message
+    '''
+    record = {"timestamp": datetime.datetime.utcnow().isoformat(),
+              "input_id": str(envelope.input_id),
+              "status": status,
+              "latency": envelope.stage_end_time - envelope.received_time,
+              "stages": [stage_time._asdict() for stage_time in envelope.processing_time]}
+    if error is not None:
+        record["error"] = str(error)
+    return record
+
+
+class AuditBackend:
+    '''
+    Storage of the audit records, written in bulk by the flushing thread of an AuditSink
+    '''
+
+    def write(self, records):
+        '''
+        :param records: list of json serializable dictionaries
+        '''
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class NdjsonAuditBackend(AuditBackend):
+    '''
+    Appends the records to a local file, one json document per line
+    '''
+
+    def __init__(self, file_name):
+        io_utils.create_folder(os.path.dirname(os.path.abspath(file_name)))
+        self.file_name = file_name
+
+    def write(self, records):
+        with open(self.file_name, 'a') as outfile:
+            outfile.write("".join([json.dumps(record) + "\n" for record in records]))
+
+
+class ElasticsearchAuditBackend(AuditBackend):
+    '''
+    Indexes the records with the elasticsearch bulk api
+    '''
+
+    def __init__(self, host, index_name):
+        # the elasticsearch client is needed only by the pipelines auditing to elasticsearch
+        from elasticsearch import Elasticsearch, helpers
+
+        self.client = Elasticsearch([host])
+        self.bulk = helpers.bulk
+        self.index_name = index_name
+
+    def write(self, records):
+        self.bulk(self.client, [{"_index": self.index_name, "_source": record} for record in records])
+
+
+def read_ndjson_records(file_name):
+    with open(file_name) as infile:
+        return [json.loads(line) for line in infile if line.strip() != ""]
+
+
+class AuditSink:
+    '''
+    Buffers audit records in memory and writes them to a backend in bulk from a background thread, when FLUSH_SIZE
+    records are buffered or every FLUSH_INTERVAL seconds. Adding a record never blocks, the memory is bounded by
+    max_buffered_records. When the buffer is full, the drop policy drops the record and counts it, the spill policy
+    puts it in a second buffer of the same size, appended to a local ndjson spill file by another thread. With the
+    spill policy the bulks the backend fails to write are spilled too. A spill file can be replayed with
+    replay_spill_file.
+    '''
+
+    def __init__(self, backend, max_buffered_records=MAX_BUFFERED_RECORDS, flush_size=FLUSH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, overflow_policy=OVERFLOW_DROP, spill_file=None):
+        '''
+        :param backend: AuditBackend
+        :param overflow_policy: OVERFLOW_DROP or OVERFLOW_SPILL
+        :param spill_file: ndjson file, required by the spill policy
+        '''
+        if overflow_policy not in [OVERFLOW_DROP, OVERFLOW_SPILL]:
+            raise ValueError("Unknown audit overflow policy {}".format(overflow_policy))
+        if overflow_policy == OVERFLOW_SPILL and spill_file is None:
+            raise ValueError("The audit spill policy needs a spill file")
+        self.backend = backend
+        self.max_buffered_records = max_buffered_records
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.spill_backend = NdjsonAuditBackend(spill_file) if overflow_policy == OVERFLOW_SPILL else None
+        self.lock = Lock()
+        self.flush_condition = Condition(self.lock)
+        self.spill_condition = Condition(self.lock)
+        self.records = list()
+        self.spill_records = list()
+        self.stopped = False
+        self.nr_written = 0
+        self.nr_dropped = 0
+        self.nr_spilled = 0
+        self.threads = [Thread(target=self.__run_flusher, name="audit", daemon=True)]
+        if self.spill_backend is not None:
+            self.threads.append(Thread(target=self.__run_spiller, name="audit-spill", daemon=True))
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def add(self, record):
+        '''
+        Buffers a record, when the buffer is full it is spilled or dropped
+        '''
+        with self.lock:
+            if len(self.records) < self.max_buffered_records:
+                self.records.append(record)
+                if len(self.records) == self.flush_size:
+                    self.flush_condition.notify()
+            elif self.spill_backend is not None and len(self.spill_records) < self.max_buffered_records:
+                self.spill_records.append(record)
+                if len(self.spill_records) == 1:
+                    self.spill_condition.notify()
+            else:
+                self.nr_dropped += 1
+
+    def stop(self):
+        '''
+        Stops the background threads after they wrote the buffered records
+        '''
+        with self.lock:
+            self.stopped = True
+            self.flush_condition.notify()
+            self.spill_condition.notify()
+        for thread in self.threads:
+            if thread.is_alive():
+                thread.join()
+        self.backend.close()
+
+    def __take_records(self):
+        # waits until there is a full bulk, the flush interval expired or the sink was stopped
+        deadline = time.monotonic() + self.flush_interval
+        with self.lock:
+            while len(self.records) < self.flush_size and not self.stopped:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.flush_condition.wait(remaining)
+            records = self.records
+            self.records = list()
+            return records, self.stopped
+
+    def __take_spill_records(self):
+        with self.lock:
+            while len(self.spill_records) == 0 and not self.stopped:
+                self.spill_condition.wait()
+            records = self.spill_records
+            self.spill_records = list()
+            return records, self.stopped
+
+    def __count(self, nr_written=0, nr_spilled=0, nr_dropped=0):
+        with self.lock:
+            self.nr_written += nr_written
+            self.nr_spilled += nr_spilled
+            self.nr_dropped += nr_dropped
+
+    def __spill(self, records):
+        try:
+            self.spill_backend.write(records)
+        except Exception as err:
+            logging.getLogger(__name__).error("Dropping {} audit records, spill failed: {}".format(len(records), err))
+            self.__count(nr_dropped=len(records))
+            return
+        self.__count(nr_spilled=len(records))
+
+    def __flush(self, records):
+        logger = logging.getLogger(__name__)
+        for start in range(0, len(records), self.flush_size):
+            bulk = records[start:start + self.flush_size]
+            try:
+                self.backend.write(bulk)
+            except Exception as err:
+                if self.spill_backend is not None:
+                    logger.warning("Spilling {} audit records: {}".format(len(bulk), err))
+                    self.__spill(bulk)
+                else:
+                    logger.error("Dropping {} audit records: {}".format(len(bulk), err))
+                    self.__count(nr_dropped=len(bulk))
+                continue
+            self.__count(nr_written=len(bulk))
+
+    def __run_flusher(self):
+        is_stopped = False
+        while not is_stopped:
+            records, is_stopped = self.__take_records()
+            if len(records) > 0:
+                self.__flush(records)
+
+    def __run_spiller(self):
+        is_stopped = False
+        while not is_stopped:
+            records, is_stopped = self.__take_spill_records()
+            if len(records) > 0:
+                self.__spill(records)
+
+    def __str__(self):
+        with self.lock:
+            return "audit records written = {} spilled = {} dropped = {} buffered = {}".format(
+                self.nr_written, self.nr_spilled, self.nr_dropped, len(self.records) + len(self.spill_records))
+
+
+def replay_spill_file(spill_file, backend, bulk_size=FLUSH_SIZE):
+    '''
+    Writes the records of a spill file to a backend, then removes the file
+    '''
+    records = read_ndjson_records(spill_file)
+    for start in range(0, len(records), bulk_size):
+        backend.write(records[start:start + bulk_size])
+    os.remove(spill_file)
+    return len(records)
+
+
+def get_audit_sink(config):
+    '''
+    :param config: dictionary with the MQ_Param audit settings, overridden by the environment variables
+    :return: AuditSink writing to elasticsearch or to a local ndjson file, None when auditing is not configured
+    '''
+    elasticsearch_host = get_config_param(MQ_Param.ELASTICSEARCH_HOST, config)
+    audit_file = get_config_param(MQ_Param.AUDIT_FILE, config)
+    if elasticsearch_host is not None:
+        backend = ElasticsearchAuditBackend(elasticsearch_host,
+                                            get_config_param(MQ_Param.ELASTICSEARCH_AUDIT_INDEX_NAME, config))
+    elif audit_file is not None:
+        backend = NdjsonAuditBackend(audit_file)
+    else:
+        return None
+    return AuditSink(backend,
+                     overflow_policy=get_config_param(MQ_Param.AUDIT_OVERFLOW_POLICY, config, OVERFLOW_DROP),
+                     spill_file=get_config_param(MQ_Param.AUDIT_SPILL_FILE, config))
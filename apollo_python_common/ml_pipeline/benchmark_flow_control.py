@@ -0,0 +1,95 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import argparse
+import logging
+import random
+import time
+
+import apollo_python_common.log_util as log_util
+from apollo_python_common.ml_pipeline.broker import InProcessBroker
+from apollo_python_common.ml_pipeline.config_api import MQ_Param
+from apollo_python_common.ml_pipeline.pipeline import MultiStagePipeline, PipelineComponent, PREDICT_BATCH_SIZE
+
+INPUT_QUEUE_NAME = "input"
+OUTPUT_QUEUE_NAME = "output"
+
+
+class SimulatedComponent(PipelineComponent):
+    '''
+    Component whose prediction takes a fixed time per batch plus a time per message, like a model on a gpu
+    '''
+
+    def __init__(self, batch_time_ms, message_time_ms):
+        self.batch_time_ms = batch_time_ms
+        self.message_time_ms = message_time_ms
+
+    def predict(self, envelopes):
+        time.sleep((self.batch_time_ms + self.message_time_ms * len(envelopes)) / 1000.0)
+        return envelopes
+
+
+def run_load(config, component, messages_per_second, duration):
+    '''
+    Publishes messages at random times with the given mean rate for duration seconds and waits for the pipeline to
+    process all of them
+    :return: latency summary of the pipeline, mean batch size
+    '''
+    broker = InProcessBroker()
+    pipeline = MultiStagePipeline(component, broker, config)
+    pipeline.start()
+    end_time = time.time() + duration
+    while time.time() < end_time:
+        broker.publish(INPUT_QUEUE_NAME, b"")
+        time.sleep(random.expovariate(messages_per_second))
+    while broker.get_queue_size(INPUT_QUEUE_NAME) > 0 or broker.get_nr_unacked() > 0:
+        time.sleep(0.05)
+    pipeline.stop()
+    batch_size = pipeline.batch_size
+    return pipeline.latency_statistics.get_summary(), batch_size.nr_items / max(batch_size.nr_batches, 1)
+
+
+def benchmark(rates, duration, batch_time_ms, message_time_ms, fixed_batch_sizes, max_batch_size):
+    logger = logging.getLogger(__name__)
+    component = SimulatedComponent(batch_time_ms, message_time_ms)
+    logger.info("capacity messages/sec: {}".format(", ".join([
+        "batch size {} = {:.0f}".format(size, 1000.0 * size / (batch_time_ms + message_time_ms * size))
+        for size in sorted(set(fixed_batch_sizes + [max_batch_size]))])))
+    policies = [("fixed {}".format(size), size, size) for size in fixed_batch_sizes] + \
+               [("adaptive 1-{}".format(max_batch_size), 1, max_batch_size)]
+    for rate in rates:
+        for name, min_batch_size, max_batch_size in policies:
+            config = {MQ_Param.MQ_INPUT_QUEUE_NAME: INPUT_QUEUE_NAME,
+                      MQ_Param.MQ_OUTPUT_QUEUE_NAME: OUTPUT_QUEUE_NAME,
+                      MQ_Param.MIN_PREDICT_BATCH_SIZE: min_batch_size,
+                      MQ_Param.PREDICT_BATCH_SIZE: max_batch_size,
+                      MQ_Param.STATISTICS_INTERVAL: 3600}
+            summary, mean_batch_size = run_load(config, component, rate, duration)
+            latency = summary["latency"]
+            logger.info("offered {} messages/sec {}: processed {:.1f} messages/sec mean batch size {:.2f} "
+                        "latency p50 = {:.1f} ms p99 = {:.1f} ms".format(
+                            rate, name, summary["messages_per_second"], mean_batch_size, 1000 * latency["p50"],
+                            1000 * latency["p99"]))
+
+
+if __name__ == "__main__":
+    log_util.config(__file__)
+    parser = argparse.ArgumentParser(description='Latency and throughput of the adaptive predict batch size compared '
+                                                 'to fixed batch sizes, on a simulated load.')
+    parser.add_argument("--rates", type=float, nargs="+", default=[10, 50, 150],
+                        help="offered loads, in messages per second")
+    parser.add_argument("--duration", type=float, default=5, help="seconds of load for each run")
+    parser.add_argument("--batch_time_ms", type=float, default=20, help="simulated prediction time of a batch")
+    parser.add_argument("--message_time_ms", type=float, default=4,
+                        help="simulated prediction time of each message of a batch")
+    parser.add_argument("--fixed_batch_sizes", type=int, nargs="+", default=[1, 4, PREDICT_BATCH_SIZE])
+    parser.add_argument("--max_batch_size", type=int, default=PREDICT_BATCH_SIZE)
+    args = parser.parse_args()
+    # the statistics of each run are only reported by this script
+    logging.getLogger("apollo_python_common.ml_pipeline.latency_statistics").setLevel(logging.WARNING)
+    benchmark(args.rates, args.duration, args.batch_time_ms, args.message_time_ms, args.fixed_batch_sizes,
+              args.max_batch_size)
@@ -0,0 +1,148 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import itertools
+import time
+from collections import deque, OrderedDict
+from threading import Condition
+
+
+class Delivery:
+    '''
+    Message received from a broker, it is acknowledged or rejected through the same broker
+    '''
+    def __init__(self, delivery_tag, body, message=None):
+        '''
+        :param delivery_tag: identifier of the delivery, unique for the consumer
+        :param body: message body
+        :param message: broker specific message object
+        '''
+        self.delivery_tag = delivery_tag
+        self.body = body
+        self.message = message
+        # monotonic time when the broker received the delivery, it may wait in a local buffer until it is taken by get
+        self.received_time = time.monotonic()
+
+
+class Broker:
+    '''
+    Message broker used by the ml pipeline. It consumes one input queue, with at most prefetch_count deliveries not
+    yet acknowledged, and publishes to any queue. The methods can be called from several threads.
+    '''
+
+    def start_consuming(self, queue_name, prefetch_count, no_ack=False):
+        '''
+        :param prefetch_count: maximum number of deliveries not acknowledged, 0 for no limit
+        :param no_ack: when True the deliveries are acknowledged when they are received
+        '''
+        raise NotImplementedError()
+
+    def set_prefetch_count(self, prefetch_count):
+        raise NotImplementedError()
+
+    def get(self, timeout):
+        '''
+        :return: next Delivery of the consumed queue, or None when there was none for timeout seconds
+        '''
+        raise NotImplementedError()
+
+    def ack(self, delivery):
+        raise NotImplementedError()
+
+    def reject(self, delivery, requeue=False):
+        raise NotImplementedError()
+
+    def publish(self, queue_name, body):
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class InProcessBroker(Broker):
+    '''
+    Broker keeping its queues in memory, to run a pipeline without a message queue server, e.g. in tests
+    '''
+
+    def __init__(self):
+        self.condition = Condition()
+        self.queues = dict()
+        self.unacked = OrderedDict()
+        self.delivery_tags = itertools.count(1)
+        self.queue_name = None
+        self.prefetch_count = 0
+        self.no_ack = False
+
+    def __get_queue(self, queue_name):
+        if queue_name not in self.queues:
+            self.queues[queue_name] = deque()
+        return self.queues[queue_name]
+
+    def start_consuming(self, queue_name, prefetch_count, no_ack=False):
+        with self.condition:
+            self.queue_name = queue_name
+            self.prefetch_count = prefetch_count
+            self.no_ack = no_ack
+            self.condition.notify_all()
+
+    def set_prefetch_count(self, prefetch_count):
+        with self.condition:
+            self.prefetch_count = prefetch_count
+            self.condition.notify_all()
+
+    def __can_deliver(self):
+        return self.queue_name is not None and len(self.__get_queue(self.queue_name)) > 0 and \
+               (self.prefetch_count <= 0 or len(self.unacked) < self.prefetch_count)
+
+    def get(self, timeout):
+        deadline = time.time() + timeout
+        with self.condition:
+            while not self.__can_deliver():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+            delivery = Delivery(next(self.delivery_tags), self.__get_queue(self.queue_name).popleft())
+            if not self.no_ack:
+                self.unacked[delivery.delivery_tag] = delivery
+            return delivery
+
+    def ack(self, delivery):
+        with self.condition:
+            del self.unacked[delivery.delivery_tag]
+            self.condition.notify_all()
+
+    def reject(self, delivery, requeue=False):
+        with self.condition:
+            del self.unacked[delivery.delivery_tag]
+            if requeue:
+                self.__get_queue(self.queue_name).appendleft(delivery.body)
+            self.condition.notify_all()
+
+    def publish(self, queue_name, body):
+        with self.condition:
+            self.__get_queue(queue_name).append(body)
+            self.condition.notify_all()
+
+    def get_queue_size(self, queue_name):
+        with self.condition:
+            return len(self.__get_queue(queue_name))
+
+    def get_nr_unacked(self):
+        with self.condition:
+            return len(self.unacked)
+
+    def pop_messages(self, queue_name):
+        '''
+        :return: list with the bodies of the messages of a queue, which is emptied
+        '''
+        with self.condition:
+            queue = self.__get_queue(queue_name)
+            messages = list(queue)
+            queue.clear()
+            self.condition.notify_all()
+            return messages
@@ -20,12 +20,20 @@ class MQ_Param:
     MQ_OUTPUT_QUEUE_NAME = "mq_output_queue_name"
     MAX_INTERNAL_QUEUE_SIZE = "max_internal_queue_size"
     PREDICT_BATCH_SIZE = "predict_batch_size"
+    MIN_PREDICT_BATCH_SIZE = "min_predict_batch_size"
+    MAX_BATCH_WAIT_MS = "max_batch_wait_ms"
+    TARGET_BATCH_LATENCY_MS = "target_batch_latency_ms"
     ELASTICSEARCH_HOST = "elasticsearch_host"
     ELASTICSEARCH_AUDIT_INDEX_NAME = "elasticsearch_audit_index_name"
+    AUDIT_FILE = "audit_file"
+    AUDIT_OVERFLOW_POLICY = "audit_overflow_policy"
+    AUDIT_SPILL_FILE = "audit_spill_file"
     NO_ACK = "no_ack"
     MQ_PREFETCH_COUNT = "mq_prefetch_count"
     MQ_NR_PREPROCESS_THREADS = "nr_preprocess_threads"
     MQ_NR_PREDICT_THREADS = "nr_predict_threads"
+    STATISTICS_PATH = "statistics_path"
+    STATISTICS_INTERVAL = "statistics_interval"
 
 
 def get_config_param(key, config_dict, default_value=None):
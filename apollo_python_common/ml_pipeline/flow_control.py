@@ -0,0 +1,146 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import logging
+import time
+from queue import Empty
+from threading import Lock
+
+MIN_PREDICT_BATCH_SIZE = 1
+MAX_BATCH_WAIT_MS = 20
+# the prefetch count is lowered when an internal queue is this full, and raised back when all are at most this full
+HIGH_WATERMARK = 1.0
+LOW_WATERMARK = 0.5
+# minimum time between two changes of the prefetch count
+PREFETCH_UPDATE_INTERVAL = 1.0
+
+
+class AdaptiveBatchSize:
+    '''
+    Batch size of the predict threads, adapted to the load. The size grows up to the backlog of the predict queue
+    after a full batch, it shrinks by one when a batch could not be filled before the max wait deadline, and
+    it is halved when a batch takes longer than the target latency. A batch is predicted as soon as it has the current
+    size, or when its first message waited max_wait_ms, so under light load the messages are not delayed waiting for
+    a batch to fill. The methods can be called from several threads.
+    '''
+
+    def __init__(self, min_batch_size, max_batch_size, max_wait_ms=MAX_BATCH_WAIT_MS, target_latency_ms=None):
+        '''
+        :param min_batch_size: smallest batch size, it is also the initial size
+        :param max_batch_size: largest batch size, equal to min_batch_size for a fixed size
+        :param max_wait_ms: maximum time a batch waits for more messages after receiving its first one
+        :param target_latency_ms: optional maximum prediction time of a batch
+        '''
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max(min_batch_size, max_batch_size)
+        self.max_wait_ms = max_wait_ms
+        self.target_latency_ms = target_latency_ms
+        self.batch_size = min_batch_size
+        self.lock = Lock()
+        self.nr_batches = 0
+        self.nr_items = 0
+        self.nr_resizes = 0
+
+    def get_batch(self, queue, sentinel):
+        '''
+        Waits for the first message of a batch, then for more messages until the batch has the current size or the
+        deadline expires
+        :param queue: queue of the messages, the sentinel ends it
+        :return: list of messages, True when the sentinel was received
+        '''
+        item = queue.get()
+        if item is sentinel:
+            return [], True
+        batch = [item]
+        target_size = self.batch_size
+        deadline = time.monotonic() + self.max_wait_ms / 1000.0
+        while len(batch) < target_size:
+            try:
+                # the messages already queued are taken even after the deadline
+                item = queue.get_nowait()
+            except Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = queue.get(timeout=remaining)
+                except Empty:
+                    break
+            if item is sentinel:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def update(self, batch_size, latency, queue_depth):
+        '''
+        Adapts the batch size after a batch was predicted
+        :param batch_size: size of the predicted batch
+        :param latency: prediction time of the batch, in seconds
+        :param queue_depth: number of messages waiting for prediction
+        '''
+        with self.lock:
+            self.nr_batches += 1
+            self.nr_items += batch_size
+            previous_size = self.batch_size
+            if self.target_latency_ms is not None and 1000 * latency > self.target_latency_ms:
+                self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+            elif batch_size >= self.batch_size and queue_depth > 0:
+                # the next batch can take all the messages which queued up during this one
+                self.batch_size = min(self.max_batch_size, max(self.batch_size + 1, queue_depth))
+            elif batch_size < self.batch_size:
+                self.batch_size = max(self.min_batch_size, self.batch_size - 1)
+            if self.batch_size != previous_size:
+                self.nr_resizes += 1
+
+    def __str__(self):
+        with self.lock:
+            return "batch size = {} mean batch size = {:.2f} resizes = {}".format(
+                self.batch_size, self.nr_items / max(self.nr_batches, 1), self.nr_resizes)
+
+
+class PrefetchController:
+    '''
+    Pushes back on the broker when the internal queues of a pipeline fill: the prefetch count is halved while an
+    internal queue is full, so that fewer messages wait in this pipeline and the broker keeps the rest for the other
+    consumers, and it is doubled back up to its configured value once the queues drain
+    '''
+
+    def __init__(self, broker, max_prefetch_count, min_prefetch_count, update_interval=PREFETCH_UPDATE_INTERVAL):
+        '''
+        :param broker: Broker consuming the input queue
+        :param max_prefetch_count: configured prefetch count
+        :param min_prefetch_count: lowest prefetch count, e.g. the largest predict batch size
+        :param update_interval: minimum time between two changes, in seconds
+        '''
+        self.broker = broker
+        self.max_prefetch_count = max_prefetch_count
+        self.min_prefetch_count = min(min_prefetch_count, max_prefetch_count)
+        self.update_interval = update_interval
+        self.prefetch_count = max_prefetch_count
+        self.last_update_time = 0
+        self.nr_updates = 0
+
+    def update(self, queues):
+        '''
+        :param queues: bounded internal queues of the pipeline
+        '''
+        now = time.monotonic()
+        if self.max_prefetch_count <= 0 or now - self.last_update_time < self.update_interval:
+            return
+        fill_ratio = max([queue.qsize() / queue.maxsize for queue in queues])
+        prefetch_count = self.prefetch_count
+        if fill_ratio >= HIGH_WATERMARK:
+            prefetch_count = max(self.min_prefetch_count, self.prefetch_count // 2)
+        elif fill_ratio <= LOW_WATERMARK:
+            prefetch_count = min(self.max_prefetch_count, self.prefetch_count * 2)
+        if prefetch_count != self.prefetch_count:
+            logging.getLogger(__name__).info("Internal queues {:.0%} full, prefetch count {} -> {}".format(
+                fill_ratio, self.prefetch_count, prefetch_count))
+            self.broker.set_prefetch_count(prefetch_count)
+            self.prefetch_count = prefetch_count
+            self.last_update_time = now
+            self.nr_updates += 1
@@ -0,0 +1,167 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import json
+import logging
+import os
+from collections import deque, OrderedDict
+from threading import Lock, Thread, Event
+
+import numpy as np
+
+import apollo_python_common.io_utils as io_utils
+
+# number of most recent messages the percentiles and the throughput are computed on
+WINDOW_SIZE = 1000
+PERCENTILES = [50, 95, 99]
+STATISTICS_INTERVAL = 60
+JSON_FILE_NAME = "latency.json"
+PROMETHEUS_FILE_NAME = "latency.prom"
+PROMETHEUS_PREFIX = "ml_pipeline"
+
+
+def get_percentiles(values):
+    '''
+    :return: dictionary with the PERCENTILES of the values, in seconds, empty when there are no values
+    '''
+    if len(values) == 0:
+        return dict()
+    return OrderedDict([("p{}".format(percentile), value)
+                        for percentile, value in zip(PERCENTILES, np.percentile(list(values), PERCENTILES))])
+
+
+class LatencyStatistics:
+    '''
+    Rolling latency statistics of the messages processed by a pipeline, computed from the StageTime records of their
+    envelopes. The methods can be called from several threads.
+    '''
+
+    def __init__(self, window_size=WINDOW_SIZE):
+        self.window_size = window_size
+        self.lock = Lock()
+        self.service_times = OrderedDict()
+        self.queue_waits = OrderedDict()
+        self.total_times = deque(maxlen=window_size)
+        self.end_times = deque(maxlen=window_size)
+        self.nr_messages = 0
+
+    def add(self, envelope):
+        '''
+        Adds the stage times of a message whose processing ended
+        '''
+        end_time = envelope.stage_end_time
+        with self.lock:
+            for stage_time in envelope.processing_time:
+                if stage_time.stage not in self.service_times:
+                    self.service_times[stage_time.stage] = deque(maxlen=self.window_size)
+                    self.queue_waits[stage_time.stage] = deque(maxlen=self.window_size)
+                self.service_times[stage_time.stage].append(stage_time.service_time)
+                if stage_time.queue_wait is not None:
+                    self.queue_waits[stage_time.stage].append(stage_time.queue_wait)
+            self.total_times.append(end_time - envelope.received_time)
+            self.end_times.append(end_time)
+            self.nr_messages += 1
+
+    def get_summary(self):
+        '''
+        :return: dictionary with the number of messages, the recent throughput, the percentiles of the total latency
+        and the percentiles of the queue wait and of the service time of each stage
+        '''
+        with self.lock:
+            duration = self.end_times[-1] - self.end_times[0] if len(self.end_times) > 1 else 0
+            stages = OrderedDict()
+            for stage, service_times in self.service_times.items():
+                stages[stage] = OrderedDict([("count", len(service_times)),
+                                             ("queue_wait", get_percentiles(self.queue_waits[stage])),
+                                             ("service_time", get_percentiles(service_times))])
+            return OrderedDict([("messages", self.nr_messages),
+                                ("messages_per_second", (len(self.end_times) - 1) / duration if duration > 0 else 0),
+                                ("latency", get_percentiles(self.total_times)),
+                                ("stages", stages)])
+
+
+def get_summary_lines(summary):
+    lines = ["messages = {} messages/sec = {:.2f} latency {}".format(
+        summary["messages"], summary["messages_per_second"], get_percentiles_text(summary["latency"]))]
+    for stage, stage_summary in summary["stages"].items():
+        lines.append("{} queue wait {} service time {}".format(
+            stage, get_percentiles_text(stage_summary["queue_wait"]),
+            get_percentiles_text(stage_summary["service_time"])))
+    return lines
+
+
+def get_percentiles_text(percentiles):
+    if len(percentiles) == 0:
+        return "-"
+    return " ".join(["{} = {:.1f} ms".format(name, 1000 * value) for name, value in percentiles.items()])
+
+
+def get_prometheus_text(summary):
+    '''
+    :return: the summary in the Prometheus text exposition format
+    '''
+    lines = ["# TYPE {}_messages_total counter".format(PROMETHEUS_PREFIX),
+             "{}_messages_total {}".format(PROMETHEUS_PREFIX, summary["messages"]),
+             "# TYPE {}_messages_per_second gauge".format(PROMETHEUS_PREFIX),
+             "{}_messages_per_second {}".format(PROMETHEUS_PREFIX, summary["messages_per_second"]),
+             "# TYPE {}_latency_seconds gauge".format(PROMETHEUS_PREFIX)]
+    lines.extend(["{}_latency_seconds{{quantile=\"{}\"}} {}".format(PROMETHEUS_PREFIX, name[1:], value)
+                  for name, value in summary["latency"].items()])
+    for metric in ["queue_wait", "service_time"]:
+        lines.append("# TYPE {}_stage_{}_seconds gauge".format(PROMETHEUS_PREFIX, metric))
+        for stage, stage_summary in summary["stages"].items():
+            lines.extend(["{}_stage_{}_seconds{{stage=\"{}\",quantile=\"{}\"}} {}".format(
+                PROMETHEUS_PREFIX, metric, stage, name[1:], value) for name, value in stage_summary[metric].items()])
+    return "\n".join(lines) + "\n"
+
+
+def write_file_atomically(file_name, text):
+    # the file is replaced at once, so that a reader never sees it half written
+    temporary_file_name = file_name + ".tmp"
+    with open(temporary_file_name, 'w') as outfile:
+        outfile.write(text)
+    os.replace(temporary_file_name, file_name)
+
+
+class StatisticsReporter(Thread):
+    '''
+    Subclass of Thread which periodically logs the latency statistics and, when an output path is given, writes them
+    to a json file and to a Prometheus text file
+    '''
+
+    def __init__(self, statistics, interval=STATISTICS_INTERVAL, output_path=None):
+        super().__init__(name="statistics", daemon=True)
+        self.statistics = statistics
+        self.interval = interval
+        self.output_path = output_path
+        self.stop_event = Event()
+
+    def report(self):
+        summary = self.statistics.get_summary()
+        logger = logging.getLogger(__name__)
+        for line in get_summary_lines(summary):
+            logger.info(line)
+        if self.output_path is not None:
+            io_utils.create_folder(self.output_path)
+            write_file_atomically(os.path.join(self.output_path, JSON_FILE_NAME), json.dumps(summary, indent=4))
+            write_file_atomically(os.path.join(self.output_path, PROMETHEUS_FILE_NAME), get_prometheus_text(summary))
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.report()
+            except Exception as err:
+                logging.getLogger(__name__).error(err, exc_info=True)
+
+    def stop(self):
+        '''
+        Stops the thread and reports the final statistics
+        '''
+        self.stop_event.set()
+        if self.is_alive():
+            self.join()
+        self.report()
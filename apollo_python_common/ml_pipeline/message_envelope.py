@@ -5,17 +5,26 @@ This Source Code Form is subject to the terms of the Mozilla Public
 License, v. 2.0. If a copy of the MPL was not distributed with this
 file, You can obtain one at http://mozilla.org/MPL/2.0/.
 """
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+# queue_wait is the time between the end of the previous stage and the start of the stage, it is None for the steps
+# measured inside a stage
+StageTime = namedtuple('StageTime', ['stage', 'queue_wait', 'service_time'])
+
 
 class MessageEnvelope:
     '''
     Envelope for message queue messages received
     '''
-    def __init__(self, input_id, input_body, body, **kwargs):
+    def __init__(self, input_id, input_body, body, received_time=None, **kwargs):
         '''
 
         :param input_id: unique identifier in the message queue
         :param input_body: message as it was received from MQ
         :param body: current message body
+        :param received_time: monotonic time when the message was received, by default the current time
         :param kwargs: helper optional arguments
         '''
         self.input_id = input_id
@@ -23,8 +32,36 @@ class MessageEnvelope:
         self.body = body
         self.args = kwargs
         self.processing_time = list()
+        # monotonic time when the message was received, then when its last stage ended
+        self.received_time = received_time if received_time is not None else time.monotonic()
+        self.stage_end_time = self.received_time
 
     def get_with_new_body(self, body):
         msg = MessageEnvelope(self.input_id, self.input_body, body, **self.args)
         msg.processing_time = self.processing_time
+        msg.received_time = self.received_time
+        msg.stage_end_time = self.stage_end_time
         return msg
+
+    def add_stage_time(self, stage, start, end):
+        '''
+        Records a pipeline stage, the message waited in a queue since the previous stage ended
+        :param start: monotonic time when the stage started processing the message
+        :param end: monotonic time when the stage finished processing the message
+        '''
+        self.processing_time.append(StageTime(stage, max(0.0, start - self.stage_end_time), end - start))
+        self.stage_end_time = end
+
+    def add_step_time(self, step, service_time):
+        '''
+        Records a step of a stage, e.g. the image decoding done by the preprocess stage
+        '''
+        self.processing_time.append(StageTime(step, None, service_time))
+
+    @contextmanager
+    def step_timer(self, step):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_step_time(step, time.monotonic() - start)
@@ -0,0 +1,329 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import logging
+import time
+from queue import Queue, Full
+from threading import Thread, Event, Lock
+
+import apollo_python_common.io_utils as io_utils
+from apollo_python_common.ml_pipeline.audit import get_audit_sink, get_audit_record, STATUS_PUBLISHED, STATUS_ERROR
+from apollo_python_common.ml_pipeline.config_api import MQ_Param, get_config_param
+from apollo_python_common.ml_pipeline.flow_control import AdaptiveBatchSize, PrefetchController, \
+    MIN_PREDICT_BATCH_SIZE, MAX_BATCH_WAIT_MS
+from apollo_python_common.ml_pipeline.latency_statistics import LatencyStatistics, StatisticsReporter, \
+    STATISTICS_INTERVAL
+from apollo_python_common.ml_pipeline.message_envelope import MessageEnvelope
+
+PREDICT_BATCH_SIZE = 8
+MAX_INTERNAL_QUEUE_SIZE = 64
+MQ_PREFETCH_COUNT = 64
+NR_PREPROCESS_THREADS = 4
+NR_PREDICT_THREADS = 1
+# the consumer checks the stop request at least this often
+CONSUME_TIMEOUT = 0.5
+# a thread blocked on a full internal queue checks if the pipeline failed at least this often
+PUT_TIMEOUT = 0.5
+
+# marks the end of the messages in an internal queue
+_SENTINEL = None
+
+
+class PipelineComponent:
+    '''
+    Algorithm run by a MultiStagePipeline. Each method is called from several threads of its stage.
+    '''
+
+    def init_predict_thread(self):
+        '''
+        Called once by each predict thread before its first batch, e.g. to load a model used by the thread which
+        loaded it
+        '''
+        pass
+
+    def preprocess(self, envelope):
+        '''
+        :param envelope: MessageEnvelope with the received message as body
+        :return: MessageEnvelope with the input of predict as body
+        '''
+        return envelope
+
+    def predict(self, envelopes):
+        '''
+        :param envelopes: list of at most PREDICT_BATCH_SIZE preprocessed envelopes
+        :return: list with one MessageEnvelope with the prediction as body for each input envelope
+        '''
+        raise NotImplementedError()
+
+    def serialize(self, envelope):
+        '''
+        :return: message published in the output queue for a predicted envelope
+        '''
+        return envelope.body
+
+
+class MultiStagePipeline:
+    '''
+    Consumes the input queue of a broker and publishes the predictions in the output queue:
+    consumer -> preprocess threads -> predict threads (batches) -> publisher
+    The stages are connected by bounded queues, so that a slow stage stops the consumer, and the broker stops
+    delivering after MQ_PREFETCH_COUNT messages not acknowledged. The prefetch count is lowered while an internal
+    queue is full. A message is acknowledged after its prediction is published, or after it is published in the errors
+    queue when a stage fails. When all the threads of a stage end with an error, e.g. the broker connection dropped, the
+    pipeline fails: the consumer stops, the messages queued for the failed stage are dropped without acknowledgement,
+    and run raises an error.
+    The predict batch size adapts to the load between MIN_PREDICT_BATCH_SIZE and PREDICT_BATCH_SIZE, see
+    AdaptiveBatchSize.
+    Each stage records its queue wait and service time in the envelopes, the statistics of the published messages are
+    reported periodically. When auditing is configured, an audit record of each message is written in bulk by a
+    background thread, see AuditSink.
+    '''
+
+    def __init__(self, component, broker, config):
+        '''
+        :param component: PipelineComponent
+        :param broker: Broker
+        :param config: dictionary with MQ_Param settings, overridden by the environment variables
+        '''
+        self.component = component
+        self.broker = broker
+        self.input_queue_name = get_config_param(MQ_Param.MQ_INPUT_QUEUE_NAME, config)
+        self.output_queue_name = get_config_param(MQ_Param.MQ_OUTPUT_QUEUE_NAME, config)
+        self.errors_queue_name = get_config_param(MQ_Param.MQ_INPUT_ERRORS_QUEUE_NAME, config)
+        predict_batch_size = int(get_config_param(MQ_Param.PREDICT_BATCH_SIZE, config, PREDICT_BATCH_SIZE))
+        target_batch_latency_ms = get_config_param(MQ_Param.TARGET_BATCH_LATENCY_MS, config)
+        self.batch_size = AdaptiveBatchSize(
+            int(get_config_param(MQ_Param.MIN_PREDICT_BATCH_SIZE, config, MIN_PREDICT_BATCH_SIZE)),
+            predict_batch_size,
+            float(get_config_param(MQ_Param.MAX_BATCH_WAIT_MS, config, MAX_BATCH_WAIT_MS)),
+            float(target_batch_latency_ms) if target_batch_latency_ms is not None else None)
+        self.prefetch_count = int(get_config_param(MQ_Param.MQ_PREFETCH_COUNT, config, MQ_PREFETCH_COUNT))
+        self.nr_preprocess_threads = int(get_config_param(MQ_Param.MQ_NR_PREPROCESS_THREADS, config,
+                                                          NR_PREPROCESS_THREADS))
+        self.nr_predict_threads = int(get_config_param(MQ_Param.MQ_NR_PREDICT_THREADS, config, NR_PREDICT_THREADS))
+        self.no_ack = io_utils.str2bool(str(get_config_param(MQ_Param.NO_ACK, config, False)))
+        max_internal_queue_size = int(get_config_param(MQ_Param.MAX_INTERNAL_QUEUE_SIZE, config,
+                                                       MAX_INTERNAL_QUEUE_SIZE))
+        self.preprocess_queue = Queue(maxsize=max_internal_queue_size)
+        self.predict_queue = Queue(maxsize=max_internal_queue_size)
+        self.publish_queue = Queue(maxsize=max_internal_queue_size)
+        self.prefetch_controller = PrefetchController(broker, self.prefetch_count, predict_batch_size)
+        self.audit_sink = get_audit_sink(config)
+        self.stop_event = Event()
+        self.failed_stages = list()
+        self.threads = list()
+        self.statistics_lock = Lock()
+        self.nr_published = 0
+        self.nr_errors = 0
+        self.latency_statistics = LatencyStatistics()
+        self.statistics_reporter = StatisticsReporter(
+            self.latency_statistics,
+            float(get_config_param(MQ_Param.STATISTICS_INTERVAL, config, STATISTICS_INTERVAL)),
+            get_config_param(MQ_Param.STATISTICS_PATH, config))
+
+    def __start_stage(self, name, target, nr_threads, next_queue, nr_next_threads):
+        # the last thread of a stage to finish sends one sentinel to each thread of the next stage
+        remaining = [nr_threads]
+        nr_failed = [0]
+        lock = Lock()
+
+        def run():
+            try:
+                target()
+            except Exception as err:
+                logging.getLogger(__name__).error("Stage {} thread failed: {}".format(name, err), exc_info=True)
+                with lock:
+                    nr_failed[0] += 1
+                    has_failed = nr_failed[0] == nr_threads
+                if has_failed:
+                    self.__fail(name)
+            finally:
+                with lock:
+                    remaining[0] -= 1
+                    is_last = remaining[0] == 0
+                if is_last and next_queue is not None:
+                    for _ in range(nr_next_threads):
+                        self.__put(next_queue, _SENTINEL)
+
+        for index in range(nr_threads):
+            thread = Thread(target=run, name="{}-{}".format(name, index), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def start(self):
+        if self.audit_sink is not None:
+            self.audit_sink.start()
+        self.broker.start_consuming(self.input_queue_name, self.prefetch_count, self.no_ack)
+        self.__start_stage("publish", self.__publish, 1, None, 0)
+        self.__start_stage("predict", self.__predict, self.nr_predict_threads, self.publish_queue, 1)
+        self.__start_stage("preprocess", self.__preprocess, self.nr_preprocess_threads, self.predict_queue,
+                           self.nr_predict_threads)
+        self.__start_stage("consume", self.__consume, 1, self.preprocess_queue, self.nr_preprocess_threads)
+        self.statistics_reporter.start()
+
+    def stop(self):
+        '''
+        Stops consuming and waits for the messages already consumed to be published
+        '''
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = list()
+        self.statistics_reporter.stop()
+        if self.audit_sink is not None:
+            self.audit_sink.stop()
+            logging.getLogger(__name__).info(self.audit_sink)
+
+    def run(self):
+        '''
+        Runs the pipeline until interrupted or until a stage fails
+        '''
+        logger = logging.getLogger(__name__)
+        self.start()
+        logger.info("Pipeline consuming {}".format(self.input_queue_name))
+        try:
+            while any([thread.is_alive() for thread in self.threads]):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            logger.info("Pipeline stopping")
+        self.stop()
+        self.broker.close()
+        if len(self.failed_stages) > 0:
+            raise RuntimeError("Pipeline stages {} failed".format(self.failed_stages))
+
+    def __fail(self, stage):
+        # without a thread of the stage its input queue is never drained, so the pipeline can not go on
+        logging.getLogger(__name__).error("All the threads of stage {} failed, the pipeline stops".format(stage))
+        self.failed_stages.append(stage)
+        self.stop_event.set()
+
+    def __put(self, queue, envelope):
+        '''
+        Puts an envelope in an internal queue, the envelope is dropped when the pipeline failed and the queue stays full
+        '''
+        while True:
+            try:
+                queue.put(envelope, block=len(self.failed_stages) == 0, timeout=PUT_TIMEOUT)
+                return
+            except Full:
+                if len(self.failed_stages) > 0:
+                    return
+
+    def __on_error(self, envelope, err):
+        logger = logging.getLogger(__name__)
+        logger.error("Message {} failed: {}".format(envelope.input_id, err), exc_info=True)
+        with self.statistics_lock:
+            self.nr_errors += 1
+        if self.errors_queue_name is not None:
+            try:
+                self.broker.publish(self.errors_queue_name, envelope.input_body)
+            except Exception as publish_err:
+                logger.error("Message {} could not be published in the errors queue: {}".format(
+                    envelope.input_id, publish_err), exc_info=True)
+        self.__ack(envelope)
+        self.__audit(envelope, STATUS_ERROR, err)
+
+    def __audit(self, envelope, status, error=None):
+        if self.audit_sink is not None:
+            self.audit_sink.add(get_audit_record(envelope, status, error))
+
+    def __ack(self, envelope):
+        if not self.no_ack:
+            self.broker.ack(envelope.args["delivery"])
+
+    def __consume(self):
+        internal_queues = [self.preprocess_queue, self.predict_queue, self.publish_queue]
+        while not self.stop_event.is_set():
+            self.prefetch_controller.update(internal_queues)
+            delivery = self.broker.get(CONSUME_TIMEOUT)
+            if delivery is None:
+                continue
+            start = time.monotonic()
+            envelope = MessageEnvelope(delivery.delivery_tag, delivery.body, delivery.body, delivery.received_time,
+                                       delivery=delivery)
+            # the queue wait of the consume stage is the time the delivery waited in the local buffer of the broker,
+            # the time blocked on a full preprocess queue is counted as queue wait of the preprocess stage
+            envelope.add_stage_time("consume", start, time.monotonic())
+            self.__put(self.preprocess_queue, envelope)
+
+    def __preprocess(self):
+        while True:
+            envelope = self.preprocess_queue.get()
+            if envelope is _SENTINEL:
+                break
+            start = time.monotonic()
+            try:
+                preprocessed_envelope = self.component.preprocess(envelope)
+            except Exception as err:
+                self.__on_error(envelope, err)
+                continue
+            preprocessed_envelope.add_stage_time("preprocess", start, time.monotonic())
+            self.__put(self.predict_queue, preprocessed_envelope)
+
+    def __predict(self):
+        self.component.init_predict_thread()
+        is_last_batch = False
+        while not is_last_batch:
+            batch, is_last_batch = self.batch_size.get_batch(self.predict_queue, _SENTINEL)
+            if len(batch) == 0:
+                continue
+            start = time.monotonic()
+            try:
+                predicted_envelopes = list(self.component.predict(batch))
+                if len(predicted_envelopes) != len(batch):
+                    # a dropped message would never be acked and would hold its prefetch slot forever
+                    raise ValueError("The component predicted {} messages for a batch of {}".format(
+                        len(predicted_envelopes), len(batch)))
+            except Exception as err:
+                for envelope in batch:
+                    self.__on_error(envelope, err)
+                continue
+            end = time.monotonic()
+            self.batch_size.update(len(batch), end - start, self.predict_queue.qsize())
+            for envelope in predicted_envelopes:
+                # the service time of a message is the time of its whole batch
+                envelope.add_stage_time("predict", start, end)
+                self.__put(self.publish_queue, envelope)
+
+    def __publish(self):
+        while True:
+            envelope = self.publish_queue.get()
+            if envelope is _SENTINEL:
+                break
+            try:
+                start = time.monotonic()
+                body = self.component.serialize(envelope)
+                envelope.add_stage_time("serialize", start, time.monotonic())
+                start = time.monotonic()
+                self.broker.publish(self.output_queue_name, body)
+                envelope.add_stage_time("publish", start, time.monotonic())
+            except Exception as err:
+                self.__on_error(envelope, err)
+                continue
+            self.__ack(envelope)
+            self.latency_statistics.add(envelope)
+            self.__audit(envelope, STATUS_PUBLISHED)
+            with self.statistics_lock:
+                self.nr_published += 1
+
+    def __str__(self):
+        with self.statistics_lock:
+            return "published = {} errors = {} queued for preprocess = {} predict = {} publish = {} {} " \
+                   "prefetch count = {}".format(self.nr_published, self.nr_errors, self.preprocess_queue.qsize(),
+                                                self.predict_queue.qsize(), self.publish_queue.qsize(), self.batch_size,
+                                                self.prefetch_controller.prefetch_count)
+
+
+def run_pipeline(component, config_file):
+    '''
+    Runs a component on the RabbitMQ server of a json configuration with MQ_Param settings
+    '''
+    # amqpstorm is needed only by the pipelines running on a message queue server
+    from apollo_python_common.ml_pipeline.amqp_broker import get_amqp_broker
+
+    config = io_utils.json_load(config_file)
+    MultiStagePipeline(component, get_amqp_broker(config), config).run()
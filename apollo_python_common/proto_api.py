@@ -11,6 +11,7 @@ from collections import defaultdict
 import orbb_metadata_pb2
 from orbb_definitions_pb2 import _MARK as ROI_MARK
 import apollo_python_common.io_utils as io_utils
+from apollo_python_common.lightweight_types import Point
 
 
 def get_new_metadata_file(imageset_name = "imageset"):
@@ -133,6 +134,57 @@ def serialize_metadata(metadata, output_path, file_name="rois"):
         f.write(str(metadata))
 
 
+def _encode_varint(value):
+    # protobuf base 128 varint, the 7 low bits first
+    encoded = bytearray()
+    while value >= 0x80:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _read_varint(f):
+    '''
+    :return: varint read from a file, or None at the end of the file or of a truncated varint
+    '''
+    value, shift = 0, 0
+    while True:
+        byte = f.read(1)
+        if len(byte) == 0:
+            return None
+        value |= (byte[0] & 0x7F) << shift
+        if byte[0] < 0x80:
+            return value
+        shift += 7
+
+
+def write_delimited_image(image_proto, delimited_file):
+    '''
+    Appends one Image protobuf to a file opened in binary mode, prefixed by its varint encoded size
+    '''
+    serialized_image = image_proto.SerializeToString()
+    delimited_file.write(_encode_varint(len(serialized_image)))
+    delimited_file.write(serialized_image)
+
+
+def read_delimited_images(file_name):
+    '''
+    Reads the Image protobufs written by write_delimited_image, one at a time
+    :return: generator of Image protobufs, in the order they were written; a last record truncated by an interrupted
+    writer is ignored
+    '''
+    with open(file_name, 'rb') as f:
+        while True:
+            size = _read_varint(f)
+            if size is None:
+                break
+            serialized_image = f.read(size)
+            if len(serialized_image) < size:
+                break
+            yield read_image_proto(serialized_image)
+
+
 def add_metadata(metadata, input_path):
     with open(input_path, "rb") as rois_file:
         metadata.ParseFromString(rois_file.read())
@@ -167,3 +219,39 @@ def get_filtered_meta_dict(rois_file, selected_classes):
             result_dict[file_base_name] = remaining_rois
     return result_dict
 
+
+def set_vanishing_point(image_proto, vanishing_point, confidence):
+    '''
+    Stores the vanishing point in the image features
+    :param image_proto: Image protobuf
+    :param vanishing_point: Point namedtuple with x (column) and y (row)
+    :param confidence: vanishing point confidence
+    '''
+    image_proto.features.vanishing_point.vp.col = int(vanishing_point.x)
+    image_proto.features.vanishing_point.vp.row = int(vanishing_point.y)
+    image_proto.features.vanishing_point.confidence = confidence
+
+
+def get_vanishing_point(image_proto):
+    '''
+    Reads the vanishing point stored in the image features
+    :param image_proto: Image protobuf
+    :return: Point namedtuple and confidence, or None and 0 if the image has no vanishing point
+    '''
+    if not image_proto.HasField("features") or not image_proto.features.HasField("vanishing_point"):
+        return None, 0
+    vanishing_point = image_proto.features.vanishing_point
+    return Point(vanishing_point.vp.col, vanishing_point.vp.row), vanishing_point.confidence
+
+
+def create_vanishing_point_dictionary(metadata):
+    '''
+    :param metadata: ImageSet protobuf
+    :return: dictionary image path -> (vanishing point, confidence) for the images having a vanishing point
+    '''
+    dictionary = dict()
+    for element in metadata.images:
+        vanishing_point, confidence = get_vanishing_point(element)
+        if vanishing_point is not None:
+            dictionary[str(element.metadata.image_path)] = (vanishing_point, confidence)
+    return dictionary
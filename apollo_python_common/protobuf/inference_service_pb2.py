@@ -27,7 +27,7 @@ DESCRIPTOR = _descriptor.FileDescriptor(
   name='inference_service.proto',
   package='orbb',
   syntax='proto2',
-  serialized_pb=_b('\n\x17inference_service.proto\x12\x04orbb\x1a\x13orbb_metadata.proto\"\'\n\x10\x44\x65tectionRequest\x12\x13\n\x0bimages_path\x18\x01 \x02(\t2G\n\x10InferenceService\x12\x33\n\x07process\x12\x16.orbb.DetectionRequest\x1a\x0e.orbb.Metadata\"\x00')
+  serialized_pb=_b('\n\x17inference_service.proto\x12\x04orbb\x1a\x13orbb_metadata.proto\";\n\x10\x44\x65tectionRequest\x12\x13\n\x0bimages_path\x18\x01 \x02(\t\x12\x12\n\ngroup_size\x18\x02 \x01(\x05\"I\n\x0f\x44\x65tectionResult\x12\x19\n\x11\x66irst_image_index\x18\x01 \x02(\x05\x12\x1b\n\x06images\x18\x02 \x03(\x0b\x32\x0b.orbb.Image\"0\n\x0c\x45ncodedImage\x12\x12\n\nimage_path\x18\x01 \x02(\t\x12\x0c\n\x04\x64\x61ta\x18\x02 \x02(\x0c\"7\n\x11ImageBytesRequest\x12\"\n\x06images\x18\x01 \x03(\x0b\x32\x12.orbb.EncodedImage\"V\n\x11SharedMemoryFrame\x12\x12\n\nimage_path\x18\x01 \x02(\t\x12\x0e\n\x06offset\x18\x02 \x02(\x03\x12\r\n\x05width\x18\x03 \x02(\x05\x12\x0e\n\x06height\x18\x04 \x02(\x05\"T\n\x13SharedMemoryRequest\x12\x14\n\x0csegment_name\x18\x01 \x02(\t\x12\'\n\x06\x66rames\x18\x02 \x03(\x0b\x32\x17.orbb.SharedMemoryFrame2\x8f\x02\n\x10InferenceService\x12\x33\n\x07process\x12\x16.orbb.DetectionRequest\x1a\x0e.orbb.ImageSet\"\x00\x12\x43\n\x0eprocess_stream\x12\x16.orbb.DetectionRequest\x1a\x15.orbb.DetectionResult\"\x00\x30\x01\x12;\n\x0eprocess_images\x12\x17.orbb.ImageBytesRequest\x1a\x0e.orbb.ImageSet\"\x00\x12\x44\n\x15process_shared_memory\x12\x19.orbb.SharedMemoryRequest\x1a\x0e.orbb.ImageSet\"\x00')
   ,
   dependencies=[orbb__metadata__pb2.DESCRIPTOR,])
 _sym_db.RegisterFileDescriptor(DESCRIPTOR)
@@ -49,6 +49,13 @@ _DETECTIONREQUEST = _descriptor.Descriptor(
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       options=None),
+    _descriptor.FieldDescriptor(
+      name='group_size', full_name='orbb.DetectionRequest.group_size', index=1,
+      number=2, type=5, cpp_type=1, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
   ],
   extensions=[
   ],
@@ -62,10 +69,210 @@ _DETECTIONREQUEST = _descriptor.Descriptor(
   oneofs=[
   ],
   serialized_start=54,
-  serialized_end=93,
+  serialized_end=113,
+)
+
+_DETECTIONRESULT = _descriptor.Descriptor(
+  name='DetectionResult',
+  full_name='orbb.DetectionResult',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='first_image_index', full_name='orbb.DetectionResult.first_image_index', index=0,
+      number=1, type=5, cpp_type=1, label=2,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='images', full_name='orbb.DetectionResult.images', index=1,
+      number=2, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  syntax='proto2',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=115,
+  serialized_end=188,
+)
+
+_ENCODEDIMAGE = _descriptor.Descriptor(
+  name='EncodedImage',
+  full_name='orbb.EncodedImage',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='image_path', full_name='orbb.EncodedImage.image_path', index=0,
+      number=1, type=9, cpp_type=9, label=2,
+      has_default_value=False, default_value=_b("").decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='data', full_name='orbb.EncodedImage.data', index=1,
+      number=2, type=12, cpp_type=9, label=2,
+      has_default_value=False, default_value=_b(""),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  syntax='proto2',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=190,
+  serialized_end=238,
+)
+
+_IMAGEBYTESREQUEST = _descriptor.Descriptor(
+  name='ImageBytesRequest',
+  full_name='orbb.ImageBytesRequest',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='images', full_name='orbb.ImageBytesRequest.images', index=0,
+      number=1, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  syntax='proto2',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=240,
+  serialized_end=295,
+)
+
+_SHAREDMEMORYFRAME = _descriptor.Descriptor(
+  name='SharedMemoryFrame',
+  full_name='orbb.SharedMemoryFrame',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='image_path', full_name='orbb.SharedMemoryFrame.image_path', index=0,
+      number=1, type=9, cpp_type=9, label=2,
+      has_default_value=False, default_value=_b("").decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='offset', full_name='orbb.SharedMemoryFrame.offset', index=1,
+      number=2, type=3, cpp_type=2, label=2,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='width', full_name='orbb.SharedMemoryFrame.width', index=2,
+      number=3, type=5, cpp_type=1, label=2,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='height', full_name='orbb.SharedMemoryFrame.height', index=3,
+      number=4, type=5, cpp_type=1, label=2,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  syntax='proto2',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=297,
+  serialized_end=383,
 )
 
+_SHAREDMEMORYREQUEST = _descriptor.Descriptor(
+  name='SharedMemoryRequest',
+  full_name='orbb.SharedMemoryRequest',
+  filename=None,
+  file=DESCRIPTOR,
+  containing_type=None,
+  fields=[
+    _descriptor.FieldDescriptor(
+      name='segment_name', full_name='orbb.SharedMemoryRequest.segment_name', index=0,
+      number=1, type=9, cpp_type=9, label=2,
+      has_default_value=False, default_value=_b("").decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+    _descriptor.FieldDescriptor(
+      name='frames', full_name='orbb.SharedMemoryRequest.frames', index=1,
+      number=2, type=11, cpp_type=10, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      options=None),
+  ],
+  extensions=[
+  ],
+  nested_types=[],
+  enum_types=[
+  ],
+  options=None,
+  is_extendable=False,
+  syntax='proto2',
+  extension_ranges=[],
+  oneofs=[
+  ],
+  serialized_start=385,
+  serialized_end=469,
+)
+
+_DETECTIONRESULT.fields_by_name['images'].message_type = orbb__metadata__pb2._IMAGE
+_IMAGEBYTESREQUEST.fields_by_name['images'].message_type = _ENCODEDIMAGE
+_SHAREDMEMORYREQUEST.fields_by_name['frames'].message_type = _SHAREDMEMORYFRAME
 DESCRIPTOR.message_types_by_name['DetectionRequest'] = _DETECTIONREQUEST
+DESCRIPTOR.message_types_by_name['DetectionResult'] = _DETECTIONRESULT
+DESCRIPTOR.message_types_by_name['EncodedImage'] = _ENCODEDIMAGE
+DESCRIPTOR.message_types_by_name['ImageBytesRequest'] = _IMAGEBYTESREQUEST
+DESCRIPTOR.message_types_by_name['SharedMemoryFrame'] = _SHAREDMEMORYFRAME
+DESCRIPTOR.message_types_by_name['SharedMemoryRequest'] = _SHAREDMEMORYREQUEST
 
 DetectionRequest = _reflection.GeneratedProtocolMessageType('DetectionRequest', (_message.Message,), dict(
   DESCRIPTOR = _DETECTIONREQUEST,
@@ -74,6 +281,41 @@ DetectionRequest = _reflection.GeneratedProtocolMessageType('DetectionRequest',
   ))
 _sym_db.RegisterMessage(DetectionRequest)
 
+DetectionResult = _reflection.GeneratedProtocolMessageType('DetectionResult', (_message.Message,), dict(
+  DESCRIPTOR = _DETECTIONRESULT,
+  __module__ = 'inference_service_pb2'
+  # @@protoc_insertion_point(class_scope:orbb.DetectionResult)
+  ))
+_sym_db.RegisterMessage(DetectionResult)
+
+EncodedImage = _reflection.GeneratedProtocolMessageType('EncodedImage', (_message.Message,), dict(
+  DESCRIPTOR = _ENCODEDIMAGE,
+  __module__ = 'inference_service_pb2'
+  # @@protoc_insertion_point(class_scope:orbb.EncodedImage)
+  ))
+_sym_db.RegisterMessage(EncodedImage)
+
+ImageBytesRequest = _reflection.GeneratedProtocolMessageType('ImageBytesRequest', (_message.Message,), dict(
+  DESCRIPTOR = _IMAGEBYTESREQUEST,
+  __module__ = 'inference_service_pb2'
+  # @@protoc_insertion_point(class_scope:orbb.ImageBytesRequest)
+  ))
+_sym_db.RegisterMessage(ImageBytesRequest)
+
+SharedMemoryFrame = _reflection.GeneratedProtocolMessageType('SharedMemoryFrame', (_message.Message,), dict(
+  DESCRIPTOR = _SHAREDMEMORYFRAME,
+  __module__ = 'inference_service_pb2'
+  # @@protoc_insertion_point(class_scope:orbb.SharedMemoryFrame)
+  ))
+_sym_db.RegisterMessage(SharedMemoryFrame)
+
+SharedMemoryRequest = _reflection.GeneratedProtocolMessageType('SharedMemoryRequest', (_message.Message,), dict(
+  DESCRIPTOR = _SHAREDMEMORYREQUEST,
+  __module__ = 'inference_service_pb2'
+  # @@protoc_insertion_point(class_scope:orbb.SharedMemoryRequest)
+  ))
+_sym_db.RegisterMessage(SharedMemoryRequest)
+
 
 try:
   # THESE ELEMENTS WILL BE DEPRECATED.
@@ -96,7 +338,22 @@ try:
       self.process = channel.unary_unary(
           '/orbb.InferenceService/process',
           request_serializer=DetectionRequest.SerializeToString,
-          response_deserializer=orbb__metadata__pb2.Metadata.FromString,
+          response_deserializer=orbb__metadata__pb2.ImageSet.FromString,
+          )
+      self.process_stream = channel.unary_stream(
+          '/orbb.InferenceService/process_stream',
+          request_serializer=DetectionRequest.SerializeToString,
+          response_deserializer=DetectionResult.FromString,
+          )
+      self.process_images = channel.unary_unary(
+          '/orbb.InferenceService/process_images',
+          request_serializer=ImageBytesRequest.SerializeToString,
+          response_deserializer=orbb__metadata__pb2.ImageSet.FromString,
+          )
+      self.process_shared_memory = channel.unary_unary(
+          '/orbb.InferenceService/process_shared_memory',
+          request_serializer=SharedMemoryRequest.SerializeToString,
+          response_deserializer=orbb__metadata__pb2.ImageSet.FromString,
           )
 
 
@@ -107,13 +364,49 @@ try:
       context.set_details('Method not implemented!')
       raise NotImplementedError('Method not implemented!')
 
+    def process_stream(self, request, context):
+      """Streams the detections as soon as the images are processed, in the order of the request images
+      """
+      context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+      context.set_details('Method not implemented!')
+      raise NotImplementedError('Method not implemented!')
+
+    def process_images(self, request, context):
+      """Same as process, for encoded images sent in the request
+      """
+      context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+      context.set_details('Method not implemented!')
+      raise NotImplementedError('Method not implemented!')
+
+    def process_shared_memory(self, request, context):
+      """Same as process, for decoded images written by a producer on the same host in a shared memory segment
+      """
+      context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+      context.set_details('Method not implemented!')
+      raise NotImplementedError('Method not implemented!')
+
 
   def add_InferenceServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
         'process': grpc.unary_unary_rpc_method_handler(
             servicer.process,
             request_deserializer=DetectionRequest.FromString,
-            response_serializer=orbb__metadata__pb2.Metadata.SerializeToString,
+            response_serializer=orbb__metadata__pb2.ImageSet.SerializeToString,
+        ),
+        'process_stream': grpc.unary_stream_rpc_method_handler(
+            servicer.process_stream,
+            request_deserializer=DetectionRequest.FromString,
+            response_serializer=DetectionResult.SerializeToString,
+        ),
+        'process_images': grpc.unary_unary_rpc_method_handler(
+            servicer.process_images,
+            request_deserializer=ImageBytesRequest.FromString,
+            response_serializer=orbb__metadata__pb2.ImageSet.SerializeToString,
+        ),
+        'process_shared_memory': grpc.unary_unary_rpc_method_handler(
+            servicer.process_shared_memory,
+            request_deserializer=SharedMemoryRequest.FromString,
+            response_serializer=orbb__metadata__pb2.ImageSet.SerializeToString,
         ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
@@ -129,6 +422,18 @@ try:
     only to ease transition from grpcio<0.15.0 to grpcio>=0.15.0."""
     def process(self, request, context):
       context.code(beta_interfaces.StatusCode.UNIMPLEMENTED)
+    def process_stream(self, request, context):
+      """Streams the detections as soon as the images are processed, in the order of the request images
+      """
+      context.code(beta_interfaces.StatusCode.UNIMPLEMENTED)
+    def process_images(self, request, context):
+      """Same as process, for encoded images sent in the request
+      """
+      context.code(beta_interfaces.StatusCode.UNIMPLEMENTED)
+    def process_shared_memory(self, request, context):
+      """Same as process, for decoded images written by a producer on the same host in a shared memory segment
+      """
+      context.code(beta_interfaces.StatusCode.UNIMPLEMENTED)
 
 
   class BetaInferenceServiceStub(object):
@@ -140,6 +445,20 @@ try:
     def process(self, request, timeout, metadata=None, with_call=False, protocol_options=None):
       raise NotImplementedError()
     process.future = None
+    def process_stream(self, request, timeout, metadata=None, with_call=False, protocol_options=None):
+      """Streams the detections as soon as the images are processed, in the order of the request images
+      """
+      raise NotImplementedError()
+    def process_images(self, request, timeout, metadata=None, with_call=False, protocol_options=None):
+      """Same as process, for encoded images sent in the request
+      """
+      raise NotImplementedError()
+    process_images.future = None
+    def process_shared_memory(self, request, timeout, metadata=None, with_call=False, protocol_options=None):
+      """Same as process, for decoded images written by a producer on the same host in a shared memory segment
+      """
+      raise NotImplementedError()
+    process_shared_memory.future = None
 
 
   def beta_create_InferenceService_server(servicer, pool=None, pool_size=None, default_timeout=None, maximum_timeout=None):
@@ -150,12 +469,21 @@ try:
     generated only to ease transition from grpcio<0.15.0 to grpcio>=0.15.0"""
     request_deserializers = {
       ('orbb.InferenceService', 'process'): DetectionRequest.FromString,
+      ('orbb.InferenceService', 'process_stream'): DetectionRequest.FromString,
+      ('orbb.InferenceService', 'process_images'): ImageBytesRequest.FromString,
+      ('orbb.InferenceService', 'process_shared_memory'): SharedMemoryRequest.FromString,
     }
     response_serializers = {
-      ('orbb.InferenceService', 'process'): orbb__metadata__pb2.Metadata.SerializeToString,
+      ('orbb.InferenceService', 'process'): orbb__metadata__pb2.ImageSet.SerializeToString,
+      ('orbb.InferenceService', 'process_stream'): DetectionResult.SerializeToString,
+      ('orbb.InferenceService', 'process_images'): orbb__metadata__pb2.ImageSet.SerializeToString,
+      ('orbb.InferenceService', 'process_shared_memory'): orbb__metadata__pb2.ImageSet.SerializeToString,
     }
     method_implementations = {
       ('orbb.InferenceService', 'process'): face_utilities.unary_unary_inline(servicer.process),
+      ('orbb.InferenceService', 'process_stream'): face_utilities.unary_stream_inline(servicer.process_stream),
+      ('orbb.InferenceService', 'process_images'): face_utilities.unary_unary_inline(servicer.process_images),
+      ('orbb.InferenceService', 'process_shared_memory'): face_utilities.unary_unary_inline(servicer.process_shared_memory),
     }
     server_options = beta_implementations.server_options(request_deserializers=request_deserializers, response_serializers=response_serializers, thread_pool=pool, thread_pool_size=pool_size, default_timeout=default_timeout, maximum_timeout=maximum_timeout)
     return beta_implementations.server(method_implementations, options=server_options)
@@ -169,12 +497,21 @@ try:
     generated only to ease transition from grpcio<0.15.0 to grpcio>=0.15.0"""
     request_serializers = {
       ('orbb.InferenceService', 'process'): DetectionRequest.SerializeToString,
+      ('orbb.InferenceService', 'process_stream'): DetectionRequest.SerializeToString,
+      ('orbb.InferenceService', 'process_images'): ImageBytesRequest.SerializeToString,
+      ('orbb.InferenceService', 'process_shared_memory'): SharedMemoryRequest.SerializeToString,
     }
     response_deserializers = {
-      ('orbb.InferenceService', 'process'): orbb__metadata__pb2.Metadata.FromString,
+      ('orbb.InferenceService', 'process'): orbb__metadata__pb2.ImageSet.FromString,
+      ('orbb.InferenceService', 'process_stream'): DetectionResult.FromString,
+      ('orbb.InferenceService', 'process_images'): orbb__metadata__pb2.ImageSet.FromString,
+      ('orbb.InferenceService', 'process_shared_memory'): orbb__metadata__pb2.ImageSet.FromString,
     }
     cardinalities = {
       'process': cardinality.Cardinality.UNARY_UNARY,
+      'process_stream': cardinality.Cardinality.UNARY_STREAM,
+      'process_images': cardinality.Cardinality.UNARY_UNARY,
+      'process_shared_memory': cardinality.Cardinality.UNARY_UNARY,
     }
     stub_options = beta_implementations.stub_options(host=host, metadata_transformer=metadata_transformer, request_serializers=request_serializers, response_deserializers=response_deserializers, thread_pool=pool, thread_pool_size=pool_size)
     return beta_implementations.dynamic_stub(channel, 'orbb.InferenceService', cardinalities, options=stub_options)
@@ -25,7 +25,22 @@ class InferenceServiceStub(object):
     self.process = channel.unary_unary(
         '/orbb.InferenceService/process',
         request_serializer=inference__service__pb2.DetectionRequest.SerializeToString,
-        response_deserializer=orbb__metadata__pb2.Metadata.FromString,
+        response_deserializer=orbb__metadata__pb2.ImageSet.FromString,
+        )
+    self.process_stream = channel.unary_stream(
+        '/orbb.InferenceService/process_stream',
+        request_serializer=inference__service__pb2.DetectionRequest.SerializeToString,
+        response_deserializer=inference__service__pb2.DetectionResult.FromString,
+        )
+    self.process_images = channel.unary_unary(
+        '/orbb.InferenceService/process_images',
+        request_serializer=inference__service__pb2.ImageBytesRequest.SerializeToString,
+        response_deserializer=orbb__metadata__pb2.ImageSet.FromString,
+        )
+    self.process_shared_memory = channel.unary_unary(
+        '/orbb.InferenceService/process_shared_memory',
+        request_serializer=inference__service__pb2.SharedMemoryRequest.SerializeToString,
+        response_deserializer=orbb__metadata__pb2.ImageSet.FromString,
         )
 
 
@@ -36,13 +51,49 @@ class InferenceServiceServicer(object):
     context.set_details('Method not implemented!')
     raise NotImplementedError('Method not implemented!')
 
+  def process_stream(self, request, context):
+    """Streams the detections as soon as the images are processed, in the order of the request images
+    """
+    context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+    context.set_details('Method not implemented!')
+    raise NotImplementedError('Method not implemented!')
+
+  def process_images(self, request, context):
+    """Same as process, for encoded images sent in the request
+    """
+    context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+    context.set_details('Method not implemented!')
+    raise NotImplementedError('Method not implemented!')
+
+  def process_shared_memory(self, request, context):
+    """Same as process, for decoded images written by a producer on the same host in a shared memory segment
+    """
+    context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+    context.set_details('Method not implemented!')
+    raise NotImplementedError('Method not implemented!')
+
 
 def add_InferenceServiceServicer_to_server(servicer, server):
   rpc_method_handlers = {
       'process': grpc.unary_unary_rpc_method_handler(
           servicer.process,
           request_deserializer=inference__service__pb2.DetectionRequest.FromString,
-          response_serializer=orbb__metadata__pb2.Metadata.SerializeToString,
+          response_serializer=orbb__metadata__pb2.ImageSet.SerializeToString,
+      ),
+      'process_stream': grpc.unary_stream_rpc_method_handler(
+          servicer.process_stream,
+          request_deserializer=inference__service__pb2.DetectionRequest.FromString,
+          response_serializer=inference__service__pb2.DetectionResult.SerializeToString,
+      ),
+      'process_images': grpc.unary_unary_rpc_method_handler(
+          servicer.process_images,
+          request_deserializer=inference__service__pb2.ImageBytesRequest.FromString,
+          response_serializer=orbb__metadata__pb2.ImageSet.SerializeToString,
+      ),
+      'process_shared_memory': grpc.unary_unary_rpc_method_handler(
+          servicer.process_shared_memory,
+          request_deserializer=inference__service__pb2.SharedMemoryRequest.FromString,
+          response_serializer=orbb__metadata__pb2.ImageSet.SerializeToString,
       ),
   }
   generic_handler = grpc.method_handlers_generic_handler(
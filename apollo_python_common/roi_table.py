@@ -0,0 +1,564 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import struct
+from array import array
+from collections import defaultdict, namedtuple
+
+import numpy as np
+from google.protobuf.internal.decoder import _DecodeSignedVarint, _DecodeVarint
+from google.protobuf.internal.wire_format import WIRETYPE_FIXED32, WIRETYPE_FIXED64, WIRETYPE_LENGTH_DELIMITED, \
+    WIRETYPE_VARINT
+
+import apollo_python_common.io_utils as io_utils
+import apollo_python_common.proto_api as proto_api
+
+# value of Roi.validation for the rois kept by create_metadata_dictionary with check_validation
+VALID_ROI_VALIDATION = 0
+
+# field numbers of orbb_metadata.proto read by read_roi_table
+IMAGE_SET_NAME, IMAGE_SET_IMAGES = 1, 2
+IMAGE_METADATA, IMAGE_ROIS = 2, 5
+IMAGE_METADATA_PATH = 3
+ROI_TYPE, ROI_RECT, ROI_MANUAL, ROI_ALGORITHM, ROI_DETECTIONS, ROI_VALIDATION = 1, 2, 3, 4, 5, 8
+RECT_TL, RECT_BR = 1, 2
+POINT_ROW, POINT_COL = 1, 2
+DETECTION_CONFIDENCE = 2
+
+# the sidecar cache of a rois file is a folder next to it, with one npy file per column and an index file
+CACHE_FOLDER_SUFFIX = ".roi_table"
+CACHE_INDEX_FILE = "index.json"
+# changing the columns or their types must increase the version, which invalidates the existing caches
+CACHE_VERSION = 1
+CACHE_COLUMNS = ["image_ids", "types", "rects", "confidences", "validations", "manual", "algorithm_ids"]
+HASH_CHUNK_SIZE = 1 << 24
+
+# read only views of a RoiTable row, with the attributes of the Roi protobuf read by the evaluation scripts
+RoiPoint = namedtuple('RoiPoint', 'row col')
+RoiRect = namedtuple('RoiRect', 'tl br')
+RoiDetection = namedtuple('RoiDetection', 'type confidence')
+RoiRecord = namedtuple('RoiRecord', 'type rect manual algorithm detections validation')
+
+
+class RoiTable:
+    '''
+    Columnar copy of the rois of an ImageSet: one numpy array per roi field, the image paths and the algorithm names
+    being interned. The rows are ordered by image, so the rois of an image are a slice of the arrays. Only the fields
+    below are kept, the detections are reduced to the confidence of the first one, and the image metadata to the
+    image path.
+    '''
+
+    def __init__(self, image_paths, image_ids, types, rects, confidences, validations, manual, algorithm_ids,
+                 algorithms, name="imageset"):
+        '''
+        :param image_paths: list of the distinct image paths, including the images without rois
+        :param image_ids: index in image_paths of the image of each roi, in increasing order
+        :param types: roi type values
+        :param rects: n x 4 array with the tl col, tl row, br col, br row of the rois
+        :param confidences: confidence of the first detection of the rois, nan for the rois without detections
+        :param validations: roi validation values
+        :param manual: boolean manual flags
+        :param algorithm_ids: index in algorithms of the algorithm of each roi
+        :param algorithms: list of the distinct algorithm names
+        '''
+        self.name = name
+        self.image_paths = image_paths
+        self.image_ids = image_ids
+        self.types = types
+        self.rects = rects
+        self.confidences = confidences
+        self.validations = validations
+        self.manual = manual
+        self.algorithm_ids = algorithm_ids
+        self.algorithms = algorithms
+        self.image_id_by_path = dict([(image_path, image_id) for image_id, image_path in enumerate(image_paths)])
+        # the rows of image i are image_starts[i]:image_starts[i + 1]
+        self.image_starts = np.searchsorted(image_ids, np.arange(len(image_paths) + 1))
+
+    def __len__(self):
+        return len(self.types)
+
+    def nr_images(self):
+        return len(self.image_paths)
+
+    def get_image_rows(self, image_path):
+        '''
+        :return: slice of the rows of the image, empty for an unknown image
+        '''
+        image_id = self.image_id_by_path.get(image_path)
+        if image_id is None:
+            return slice(0, 0)
+        return slice(self.image_starts[image_id], self.image_starts[image_id + 1])
+
+    def get_image_groups(self, with_empty_images=False):
+        '''
+        :param with_empty_images: when false, like create_metadata_dictionary, the images without rois are skipped
+        :return: generator of (image path, slice of its rows), in the order of the images
+        '''
+        for image_id, image_path in enumerate(self.image_paths):
+            start, end = self.image_starts[image_id], self.image_starts[image_id + 1]
+            if start < end or with_empty_images:
+                yield image_path, slice(start, end)
+
+    def get_image_paths_with_rois(self):
+        return [image_path for image_path, _ in self.get_image_groups()]
+
+    def get_class_names(self):
+        '''
+        :return: sorted names of the roi types, like get_class_names_from_metadata_dictionary
+        '''
+        return sorted([proto_api.get_roi_type_name(int(type_value)) for type_value in np.unique(self.types)])
+
+    def select(self, rows):
+        '''
+        :param rows: boolean mask or increasing indexes of the selected rois
+        :return: RoiTable with the selected rois of the same images
+        '''
+        return RoiTable(self.image_paths, self.image_ids[rows], self.types[rows], self.rects[rows],
+                        self.confidences[rows], self.validations[rows], self.manual[rows], self.algorithm_ids[rows],
+                        self.algorithms, self.name)
+
+    def select_valid(self):
+        '''
+        :return: RoiTable with the rois kept by create_metadata_dictionary with check_validation
+        '''
+        return self.select(self.validations == VALID_ROI_VALIDATION)
+
+    def to_image_set(self, with_empty_images=True):
+        '''
+        :return: ImageSet protobuf with the kept fields of the rois, the first detection having the type of its roi
+        '''
+        metadata = proto_api.get_new_metadata_file(self.name)
+        types = self.types.tolist()
+        rects = self.rects.tolist()
+        confidences = self.confidences.tolist()
+        validations = self.validations.tolist()
+        manual = self.manual.tolist()
+        algorithm_ids = self.algorithm_ids.tolist()
+        for image_path, rows in self.get_image_groups(with_empty_images):
+            image = metadata.images.add()
+            image.metadata.trip_id = ""
+            image.metadata.image_index = 0
+            image.metadata.image_path = image_path
+            image.metadata.region = ""
+            for row in range(rows.start, rows.stop):
+                roi = image.rois.add()
+                roi.type = types[row]
+                roi.rect.tl.col, roi.rect.tl.row, roi.rect.br.col, roi.rect.br.row = rects[row]
+                roi.manual = manual[row]
+                roi.algorithm = self.algorithms[algorithm_ids[row]]
+                if confidences[row] == confidences[row]:
+                    detection = roi.detections.add()
+                    detection.type = types[row]
+                    detection.confidence = confidences[row]
+                roi.validation = validations[row]
+        return metadata
+
+    def get_metadata_dictionary(self):
+        '''
+        :return: dictionary image path -> list of RoiRecord, like create_metadata_dictionary without check_validation
+        '''
+        dictionary = defaultdict(list)
+        types = self.types.tolist()
+        rects = self.rects.tolist()
+        confidences = self.confidences.tolist()
+        validations = self.validations.tolist()
+        manual = self.manual.tolist()
+        algorithm_ids = self.algorithm_ids.tolist()
+        for image_path, rows in self.get_image_groups():
+            rois = dictionary[image_path]
+            for row in range(rows.start, rows.stop):
+                tl_col, tl_row, br_col, br_row = rects[row]
+                detections = [RoiDetection(types[row], confidences[row])] \
+                    if confidences[row] == confidences[row] else []
+                rois.append(RoiRecord(types[row], RoiRect(RoiPoint(tl_row, tl_col), RoiPoint(br_row, br_col)),
+                                      manual[row], self.algorithms[algorithm_ids[row]], detections, validations[row]))
+        return dictionary
+
+    def get_nbytes(self):
+        '''
+        :return: memory used by the arrays of the table, in bytes
+        '''
+        return sum([column.nbytes for column in [self.image_ids, self.types, self.rects, self.confidences,
+                                                  self.validations, self.manual, self.algorithm_ids,
+                                                  self.image_starts]])
+
+
+class RoiTableBuilder:
+    '''
+    Appends rois image by image to growing arrays, then builds a RoiTable
+    '''
+
+    def __init__(self, name="imageset"):
+        self.name = name
+        self.image_paths = list()
+        self.image_id_by_path = dict()
+        self.algorithms = list()
+        self.algorithm_id_by_name = dict()
+        self.image_ids = array('i')
+        self.types = array('i')
+        self.rects = array('q')
+        self.confidences = array('d')
+        self.validations = array('b')
+        self.manual = array('b')
+        self.algorithm_ids = array('i')
+
+    def get_image_id(self, image_path):
+        image_id = self.image_id_by_path.get(image_path)
+        if image_id is None:
+            image_id = len(self.image_paths)
+            self.image_id_by_path[image_path] = image_id
+            self.image_paths.append(image_path)
+        return image_id
+
+    def get_algorithm_id(self, algorithm):
+        algorithm_id = self.algorithm_id_by_name.get(algorithm)
+        if algorithm_id is None:
+            algorithm_id = len(self.algorithms)
+            self.algorithm_id_by_name[algorithm] = algorithm_id
+            self.algorithms.append(algorithm)
+        return algorithm_id
+
+    def add_roi(self, image_id, type_value, rect, confidence, validation, manual, algorithm_id):
+        '''
+        :param rect: tl col, tl row, br col, br row
+        :param confidence: confidence of the first detection, nan without detections
+        '''
+        self.image_ids.append(image_id)
+        self.types.append(type_value)
+        self.rects.extend(rect)
+        self.confidences.append(confidence)
+        self.validations.append(validation)
+        self.manual.append(manual)
+        self.algorithm_ids.append(algorithm_id)
+
+    def add_proto_roi(self, image_id, roi):
+        confidence = roi.detections[0].confidence if len(roi.detections) > 0 else np.nan
+        self.add_roi(image_id, roi.type, (roi.rect.tl.col, roi.rect.tl.row, roi.rect.br.col, roi.rect.br.row),
+                     confidence, roi.validation, roi.manual, self.get_algorithm_id(roi.algorithm))
+
+    def build(self):
+        image_ids = np.frombuffer(self.image_ids, dtype=np.int32)
+        # an image path appearing in several images gets the rois of all of them
+        order = np.argsort(image_ids, kind="stable") if np.any(image_ids[1:] < image_ids[:-1]) else slice(None)
+        return RoiTable(self.image_paths, image_ids[order], np.frombuffer(self.types, dtype=np.int32)[order],
+                        np.frombuffer(self.rects, dtype=np.int64).reshape(-1, 4)[order],
+                        np.frombuffer(self.confidences, dtype=np.float64)[order],
+                        np.frombuffer(self.validations, dtype=np.int8)[order],
+                        np.frombuffer(self.manual, dtype=np.int8).astype(bool)[order],
+                        np.frombuffer(self.algorithm_ids, dtype=np.int32)[order], self.algorithms, self.name)
+
+
+def create_roi_table(metadata):
+    '''
+    :param metadata: ImageSet protobuf
+    :return: RoiTable with all the rois of the image set
+    '''
+    builder = RoiTableBuilder(metadata.name)
+    for element in metadata.images:
+        image_id = builder.get_image_id(str(element.metadata.image_path))
+        for roi in element.rois:
+            builder.add_proto_roi(image_id, roi)
+    return builder.build()
+
+
+def _decode_varint(data, position):
+    # most of the tags, lengths and values fit in one byte
+    value = data[position]
+    if value < 0x80:
+        return value, position + 1
+    return _DecodeVarint(data, position)
+
+
+def _decode_signed_varint(data, position):
+    value = data[position]
+    if value < 0x80:
+        return value, position + 1
+    return _DecodeSignedVarint(data, position)
+
+
+def _skip_field(data, position, wire_type):
+    if wire_type == WIRETYPE_VARINT:
+        return _decode_varint(data, position)[1]
+    if wire_type == WIRETYPE_FIXED64:
+        return position + 8
+    if wire_type == WIRETYPE_LENGTH_DELIMITED:
+        size, position = _decode_varint(data, position)
+        return position + size
+    if wire_type == WIRETYPE_FIXED32:
+        return position + 4
+    raise ValueError("Unsupported wire type {} at position {}".format(wire_type, position))
+
+
+def _decode_tag(data, position):
+    '''
+    :return: field number, wire type, position after the tag
+    '''
+    tag, position = _decode_varint(data, position)
+    return tag >> 3, tag & 7, position
+
+
+def _decode_length(data, position):
+    '''
+    :return: start and end of a length delimited field
+    '''
+    size, position = _decode_varint(data, position)
+    return position, position + size
+
+
+def _decode_point(data, position, end):
+    row, col = 0, 0
+    while position < end:
+        field_number, wire_type, position = _decode_tag(data, position)
+        if field_number == POINT_ROW and wire_type == WIRETYPE_VARINT:
+            row, position = _decode_varint(data, position)
+        elif field_number == POINT_COL and wire_type == WIRETYPE_VARINT:
+            col, position = _decode_varint(data, position)
+        else:
+            position = _skip_field(data, position, wire_type)
+    return row, col
+
+
+def _decode_rect(data, position, end):
+    tl, br = (0, 0), (0, 0)
+    while position < end:
+        field_number, wire_type, position = _decode_tag(data, position)
+        if field_number == RECT_TL and wire_type == WIRETYPE_LENGTH_DELIMITED:
+            start, position = _decode_length(data, position)
+            tl = _decode_point(data, start, position)
+        elif field_number == RECT_BR and wire_type == WIRETYPE_LENGTH_DELIMITED:
+            start, position = _decode_length(data, position)
+            br = _decode_point(data, start, position)
+        else:
+            position = _skip_field(data, position, wire_type)
+    return tl[1], tl[0], br[1], br[0]
+
+
+def _decode_confidence(data, position, end):
+    confidence = 0.0
+    while position < end:
+        field_number, wire_type, position = _decode_tag(data, position)
+        if field_number == DETECTION_CONFIDENCE and wire_type == WIRETYPE_FIXED64:
+            confidence = struct.unpack_from("<d", data, position)[0]
+            position += 8
+        else:
+            position = _skip_field(data, position, wire_type)
+    return confidence
+
+
+def _decode_roi(builder, image_id, data, position, end):
+    type_value, rect, manual, algorithm, validation = 0, (0, 0, 0, 0), False, b"", VALID_ROI_VALIDATION
+    confidence = np.nan
+    while position < end:
+        field_number, wire_type, position = _decode_tag(data, position)
+        if field_number == ROI_TYPE and wire_type == WIRETYPE_VARINT:
+            type_value, position = _decode_signed_varint(data, position)
+        elif field_number == ROI_RECT and wire_type == WIRETYPE_LENGTH_DELIMITED:
+            start, position = _decode_length(data, position)
+            rect = _decode_rect(data, start, position)
+        elif field_number == ROI_MANUAL and wire_type == WIRETYPE_VARINT:
+            manual, position = _decode_varint(data, position)
+        elif field_number == ROI_ALGORITHM and wire_type == WIRETYPE_LENGTH_DELIMITED:
+            start, position = _decode_length(data, position)
+            algorithm = data[start:position]
+        elif field_number == ROI_DETECTIONS and wire_type == WIRETYPE_LENGTH_DELIMITED:
+            start, position = _decode_length(data, position)
+            if confidence != confidence:
+                confidence = _decode_confidence(data, start, position)
+        elif field_number == ROI_VALIDATION and wire_type == WIRETYPE_VARINT:
+            validation, position = _decode_signed_varint(data, position)
+        else:
+            position = _skip_field(data, position, wire_type)
+    builder.add_roi(image_id, type_value, rect, confidence, validation, bool(manual), builder.get_algorithm_id(algorithm))
+
+
+def _decode_image_path(data, position, end):
+    image_path = b""
+    while position < end:
+        field_number, wire_type, position = _decode_tag(data, position)
+        if field_number == IMAGE_METADATA_PATH and wire_type == WIRETYPE_LENGTH_DELIMITED:
+            start, position = _decode_length(data, position)
+            image_path = data[start:position]
+        else:
+            position = _skip_field(data, position, wire_type)
+    return image_path
+
+
+def _decode_image(builder, data, position, end):
+    # the rois are added before the image path is known, to a new image id which is merged afterwards if the path
+    # was already seen
+    image_id = len(builder.image_paths)
+    nr_rois = len(builder.types)
+    image_path = b""
+    while position < end:
+        field_number, wire_type, position = _decode_tag(data, position)
+        if field_number == IMAGE_METADATA and wire_type == WIRETYPE_LENGTH_DELIMITED:
+            start, position = _decode_length(data, position)
+            image_path = _decode_image_path(data, start, position)
+        elif field_number == IMAGE_ROIS and wire_type == WIRETYPE_LENGTH_DELIMITED:
+            start, position = _decode_length(data, position)
+            _decode_roi(builder, image_id, data, start, position)
+        else:
+            position = _skip_field(data, position, wire_type)
+    path_id = builder.get_image_id(image_path.decode("utf-8"))
+    if path_id != image_id:
+        for row in range(nr_rois, len(builder.types)):
+            builder.image_ids[row] = path_id
+
+
+def decode_roi_table(data):
+    '''
+    Decodes a serialized ImageSet without building its protobuf messages, which is much faster than
+    ParseFromString with the python protobuf implementation
+    :param data: bytes of a serialized ImageSet
+    :return: RoiTable, equal to the one of create_roi_table
+    '''
+    builder = RoiTableBuilder()
+    position, end = 0, len(data)
+    while position < end:
+        field_number, wire_type, position = _decode_tag(data, position)
+        if field_number == IMAGE_SET_IMAGES and wire_type == WIRETYPE_LENGTH_DELIMITED:
+            start, position = _decode_length(data, position)
+            _decode_image(builder, data, start, position)
+        elif field_number == IMAGE_SET_NAME and wire_type == WIRETYPE_LENGTH_DELIMITED:
+            start, position = _decode_length(data, position)
+            builder.name = data[start:position].decode("utf-8")
+        else:
+            position = _skip_field(data, position, wire_type)
+    builder.algorithms = [algorithm.decode("utf-8") for algorithm in builder.algorithms]
+    return builder.build()
+
+
+def get_file_hash(file_name):
+    file_hash = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def get_cache_key(file_stat, file_hash):
+    return {"version": CACHE_VERSION, "size": file_stat.st_size, "mtime_ns": file_stat.st_mtime_ns,
+            "sha256": file_hash}
+
+
+def write_cache_index(cache_folder, index):
+    # the index is replaced atomically, a reader sees either the old or the new one
+    temp_file = os.path.join(cache_folder, "{}.tmp".format(io_utils.get_random_file_name()))
+    io_utils.json_dump(index, temp_file)
+    os.replace(temp_file, os.path.join(cache_folder, CACHE_INDEX_FILE))
+
+
+def write_roi_table_cache(roi_table, cache_folder, key):
+    '''
+    Writes the columns of the table to a temporary folder which then replaces the cache folder
+    '''
+    temp_folder = "{}.{}.tmp".format(cache_folder, io_utils.get_random_file_name())
+    io_utils.create_folder(temp_folder)
+    try:
+        for column in CACHE_COLUMNS:
+            np.save(os.path.join(temp_folder, column + ".npy"), getattr(roi_table, column))
+        write_cache_index(temp_folder, {"key": key, "name": roi_table.name, "image_paths": roi_table.image_paths,
+                                        "algorithms": roi_table.algorithms})
+        if os.path.isdir(cache_folder):
+            # the processes which mapped the stale columns keep reading them until they close them
+            stale_folder = "{}.{}.stale".format(cache_folder, io_utils.get_random_file_name())
+            os.rename(cache_folder, stale_folder)
+            shutil.rmtree(stale_folder, ignore_errors=True)
+        os.rename(temp_folder, cache_folder)
+    finally:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+
+
+def read_cache_index(cache_folder):
+    '''
+    :return: index of the cache, None when there is no readable cache
+    '''
+    try:
+        return io_utils.json_load(os.path.join(cache_folder, CACHE_INDEX_FILE))
+    except (OSError, ValueError):
+        return None
+
+
+def load_roi_table_cache(cache_folder, index):
+    '''
+    :return: RoiTable with the columns memory mapped from the cache, None when they can not be read
+    '''
+    try:
+        columns = [np.load(os.path.join(cache_folder, column + ".npy"), mmap_mode='r') for column in CACHE_COLUMNS]
+    except (OSError, ValueError):
+        return None
+    image_ids, types, rects, confidences, validations, manual, algorithm_ids = columns
+    return RoiTable(index["image_paths"], image_ids, types, rects, confidences, validations, manual, algorithm_ids,
+                    index["algorithms"], index["name"])
+
+
+def read_cached_roi_table(file_name, file_stat, cache_folder):
+    '''
+    :return: RoiTable of the cache when its key matches the file, else None. When only the modification time of the
+    file changed, the hash of its content decides and the key of a valid cache is updated.
+    '''
+    index = read_cache_index(cache_folder)
+    if index is None:
+        return None
+    key = index["key"]
+    if key.get("version") != CACHE_VERSION or key.get("size") != file_stat.st_size:
+        return None
+    if key.get("mtime_ns") != file_stat.st_mtime_ns:
+        file_hash = get_file_hash(file_name)
+        if file_hash != key.get("sha256"):
+            return None
+        index["key"] = get_cache_key(file_stat, file_hash)
+        try:
+            write_cache_index(cache_folder, index)
+        except OSError:
+            pass
+    return load_roi_table_cache(cache_folder, index)
+
+
+def read_roi_table(file_name, use_cache=True):
+    '''
+    Reads a rois file as RoiTable. With use_cache, the table is saved at the first read in a sidecar folder next to
+    the file, keyed by the size, modification time and sha256 of the file, and the next reads memory map it. A
+    stale cache is rebuilt, and the file is decoded without caching when its folder is not writable.
+    :param file_name: rois.bin file with a serialized ImageSet
+    :return: RoiTable with all the rois of the file, its columns are read only when memory mapped
+    '''
+    if not use_cache:
+        with open(file_name, 'rb') as f:
+            return decode_roi_table(f.read())
+    cache_folder = os.path.abspath(file_name) + CACHE_FOLDER_SUFFIX
+    # the key is taken before reading, so a file modified while it is read gets a stale key
+    file_stat = os.stat(file_name)
+    roi_table = read_cached_roi_table(file_name, file_stat, cache_folder)
+    if roi_table is not None:
+        return roi_table
+    with open(file_name, 'rb') as f:
+        data = f.read()
+    roi_table = decode_roi_table(data)
+    if len(data) == file_stat.st_size:
+        try:
+            write_roi_table_cache(roi_table, cache_folder, get_cache_key(file_stat, hashlib.sha256(data).hexdigest()))
+        except OSError as err:
+            logging.getLogger(__name__).warning("Could not cache the rois of {}: {}".format(file_name, err))
+    return roi_table
+
+
+def read_metadata_dictionary(file_name, check_validation=True):
+    '''
+    Cached replacement of create_metadata_dictionary(read_metadata(file_name), check_validation) for the code which
+    only reads the type, rect, manual flag, algorithm, first detection and validation of the rois
+    :return: dictionary image path -> list of RoiRecord
+    '''
+    roi_table = read_roi_table(file_name)
+    if check_validation:
+        roi_table = roi_table.select_valid()
+    return roi_table.get_metadata_dictionary()
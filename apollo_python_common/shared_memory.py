@@ -0,0 +1,76 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import mmap
+import os
+
+import numpy as np
+
+# POSIX shared memory segments created with shm_open are files of this folder on Linux
+SHARED_MEMORY_ROOT = '/dev/shm'
+NR_CHANNELS = 3
+
+
+def get_segment_path(segment_name):
+    '''
+    :param segment_name: name of the segment, as given to shm_open, with or without the leading slash
+    :return: path of the segment file
+    '''
+    name = segment_name[1:] if segment_name.startswith('/') else segment_name
+    if len(name) == 0 or '/' in name or name in ('.', '..'):
+        raise ValueError("Invalid shared memory segment name {}".format(segment_name))
+    return os.path.join(SHARED_MEMORY_ROOT, name)
+
+
+def get_frame_size(width, height):
+    return width * height * NR_CHANNELS
+
+
+def create_segment(segment_name, size):
+    '''
+    Creates a segment, or resizes an existing one
+    :return: writable mmap of the segment
+    '''
+    with open(get_segment_path(segment_name), 'w+b') as segment_file:
+        segment_file.truncate(size)
+        return mmap.mmap(segment_file.fileno(), size)
+
+
+def open_segment(segment_name):
+    '''
+    :return: read only mmap of an existing segment, it stays mapped while an array returned by get_frame uses it
+    '''
+    with open(get_segment_path(segment_name), 'rb') as segment_file:
+        return mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def remove_segment(segment_name):
+    os.remove(get_segment_path(segment_name))
+
+
+def get_frame(segment, offset, width, height):
+    '''
+    :param segment: mmap of the segment
+    :param offset: offset of the first pixel in the segment, in bytes
+    :return: BGR image sharing the memory of the segment, without copying the pixels
+    '''
+    size = get_frame_size(width, height)
+    if offset < 0 or width <= 0 or height <= 0 or offset + size > len(segment):
+        raise ValueError("Frame {}x{} at offset {} is outside the segment of {} bytes".format(width, height, offset,
+                                                                                             len(segment)))
+    return np.frombuffer(segment, dtype=np.uint8, count=size, offset=offset).reshape(height, width, NR_CHANNELS)
+
+
+def write_frame(segment, offset, image):
+    '''
+    Copies a BGR image to a writable segment
+    :return: offset following the frame
+    '''
+    height, width = image.shape[0], image.shape[1]
+    frame = np.frombuffer(segment, dtype=np.uint8, count=get_frame_size(width, height), offset=offset)
+    frame[:] = image.reshape(-1)
+    return offset + frame.size
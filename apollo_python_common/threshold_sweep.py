@@ -0,0 +1,150 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import bisect
+from collections import defaultdict
+
+import numpy as np
+
+import apollo_python_common.proto_api as proto_api
+from apollo_python_common.generate_model_statistics import Statistics, get_rects, get_areas, \
+    get_intersection_areas, get_overlaps, get_valid_sizes
+
+# rois of this type are not counted in the Total statistics
+INVALID_TYPE_NAME = "INVALID"
+
+# outcomes of an expected roi, as indexes in the counts
+TRUE_POSITIVE, MISS_CLASSIFIED, FALSE_NEGATIVE = 0, 1, 2
+NR_OUTCOMES = 3
+
+
+class ThresholdSweep:
+    '''
+    Statistics of get_model_statistics for all the confidence thresholds of a class, the other classes keeping the
+    default threshold. The predictions are matched to the ground truth once: for each expected roi the overlapping
+    predictions are kept in the order in which select_best_area_match prefers them, with the outcome each one would
+    have as best match. For a class threshold t the best match of an expected roi is the first prediction in this
+    order which passes its threshold, so each outcome holds for an interval of t, and the counts of all the thresholds
+    are cumulative sums of the interval bounds. The iou is not computed.
+    '''
+
+    def __init__(self, expected_dict, actual_dict, min_size, default_threshold=0.5):
+        '''
+        :param expected_dict: ground truth rois per file name
+        :param actual_dict: predicted rois per file name, with the confidence in their first detection
+        :param min_size: minimum size of a roi to be counted, see valid_size
+        :param default_threshold: threshold of the classes which are not swept
+        '''
+        self.default_threshold = default_threshold
+        # for each expected roi: list of (type name, confidence, outcome) of the overlapping predictions, in order
+        # of preference, and the outcome when none of them passes its threshold
+        self.candidates = list()
+        self.fallback_outcomes = list()
+        self.expected_indexes_per_class = defaultdict(list)
+        # confidences of the predictions which are false positives when they pass their threshold
+        self.false_positive_confidences = defaultdict(list)
+        for file_name, expected_rois in expected_dict.items():
+            self.__add_file(expected_rois, actual_dict[file_name] if file_name in actual_dict else list(), min_size)
+        self.false_positive_confidences = dict([(class_name, sorted(confidences))
+                                                for class_name, confidences in self.false_positive_confidences.items()])
+        self.base_counts = np.zeros(NR_OUTCOMES, dtype=np.int64)
+        self.base_outcomes = [self.__get_outcome(index, None) for index in range(len(self.candidates))]
+        for outcome in self.base_outcomes:
+            if outcome is not None:
+                self.base_counts[outcome] += 1
+
+    def __add_file(self, expected_rois, actual_rois, min_size):
+        expected_rects = get_rects(expected_rois)
+        actual_rects = get_rects(actual_rois)
+        intersection_areas = get_intersection_areas(expected_rects, actual_rects)
+        # select_best_area_match compares the overlap relative to the area of the prediction
+        overlaps = get_overlaps(intersection_areas, get_areas(actual_rects))
+        expected_valid = get_valid_sizes(expected_rects, min_size)
+        actual_valid = get_valid_sizes(actual_rects, min_size)
+        actual_types = [proto_api.get_roi_type_name(roi.type) for roi in actual_rois]
+        actual_confidences = [roi.detections[0].confidence for roi in actual_rois]
+
+        for actual_index, actual_type in enumerate(actual_types):
+            if actual_type != INVALID_TYPE_NAME and actual_valid[actual_index] and \
+                    not np.any(intersection_areas[:, actual_index] != 0):
+                self.false_positive_confidences[actual_type].append(actual_confidences[actual_index])
+
+        for expected_index, expected_roi in enumerate(expected_rois):
+            expected_type = proto_api.get_roi_type_name(expected_roi.type)
+            if expected_type == INVALID_TYPE_NAME:
+                continue
+            overlapping = np.nonzero(intersection_areas[expected_index] != 0)[0]
+            # highest overlap first, the first prediction wins ties
+            order = overlapping[np.lexsort((overlapping, -overlaps[expected_index, overlapping]))]
+            candidates = list()
+            for actual_index in order:
+                outcome = None
+                if actual_valid[actual_index] or expected_valid[expected_index]:
+                    outcome = TRUE_POSITIVE if actual_types[actual_index] == expected_type else MISS_CLASSIFIED
+                candidates.append((actual_types[actual_index], actual_confidences[actual_index], outcome))
+            index = len(self.candidates)
+            self.candidates.append(candidates)
+            self.fallback_outcomes.append(FALSE_NEGATIVE if expected_valid[expected_index] else None)
+            for class_name in set([candidate[0] for candidate in candidates]):
+                self.expected_indexes_per_class[class_name].append(index)
+
+    def __get_outcome(self, index, class_name, threshold=None):
+        for candidate_type, confidence, outcome in self.candidates[index]:
+            candidate_threshold = threshold if candidate_type == class_name else self.default_threshold
+            if confidence > candidate_threshold:
+                return outcome
+        return self.fallback_outcomes[index]
+
+    def __add_outcome_intervals(self, index, class_name, thresholds, count_changes):
+        # the outcome of the first prediction of the class passing the threshold holds from the highest confidence of
+        # the predictions of the class before it, up to its own confidence
+        previous_confidence = -np.inf
+        fallback_outcome = self.fallback_outcomes[index]
+        for candidate_type, confidence, outcome in self.candidates[index]:
+            if candidate_type != class_name:
+                if confidence > self.default_threshold:
+                    fallback_outcome = outcome
+                    break
+                continue
+            if previous_confidence < confidence and outcome is not None:
+                count_changes[bisect.bisect_left(thresholds, previous_confidence), outcome] += 1
+                count_changes[bisect.bisect_left(thresholds, confidence), outcome] -= 1
+            previous_confidence = max(previous_confidence, confidence)
+        if fallback_outcome is not None:
+            count_changes[bisect.bisect_left(thresholds, previous_confidence), fallback_outcome] += 1
+
+    def __get_false_positives(self, class_name, threshold):
+        confidences = self.false_positive_confidences.get(class_name, list())
+        return len(confidences) - bisect.bisect_right(confidences, threshold)
+
+    def sweep(self, class_name, thresholds):
+        '''
+        :param class_name: name of the swept class
+        :param thresholds: sorted list of thresholds
+        :return: list with the Total Statistics of get_model_statistics for each threshold of the class
+        '''
+        expected_indexes = self.expected_indexes_per_class.get(class_name, list())
+        count_changes = np.zeros((len(thresholds) + 1, NR_OUTCOMES), dtype=np.int64)
+        base_counts = self.base_counts.copy()
+        for index in expected_indexes:
+            if self.base_outcomes[index] is not None:
+                base_counts[self.base_outcomes[index]] -= 1
+            self.__add_outcome_intervals(index, class_name, thresholds, count_changes)
+        counts = base_counts[None, :] + np.cumsum(count_changes, axis=0)[:len(thresholds)]
+
+        base_false_positives = sum([self.__get_false_positives(other_class, self.default_threshold)
+                                    for other_class in self.false_positive_confidences.keys()
+                                    if other_class != class_name])
+        statistics_per_threshold = list()
+        for threshold, threshold_counts in zip(thresholds, counts):
+            statistics = Statistics()
+            statistics.true_positives = int(threshold_counts[TRUE_POSITIVE])
+            statistics.miss_classified = int(threshold_counts[MISS_CLASSIFIED])
+            statistics.false_negatives = int(threshold_counts[FALSE_NEGATIVE])
+            statistics.false_positives = base_false_positives + self.__get_false_positives(class_name, threshold)
+            statistics_per_threshold.append(statistics)
+        return statistics_per_threshold
@@ -0,0 +1,136 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+import apollo_python_common.image
+import apollo_python_common.io_utils as io_utils
+import apollo_python_common.log_util as log_util
+import apollo_python_common.proto_api as meta
+from retinanet.cascade import CascadePredictor, get_candidate_min_score
+from retinanet.predict import get_model_for_pred, RESOLUTIONS
+from retinanet.traffic_signs_generator import RoisLabels
+from retinanet.utils import preprocess_image, predict_one_image
+
+IOU_THRESHOLD = 0.5
+
+
+def get_iou_matrix(boxes_a, boxes_b):
+    x1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    y1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    x2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    y2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    intersection = np.maximum(0, x2 - x1) * np.maximum(0, y2 - y1)
+    areas_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    areas_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    return intersection / np.maximum(areas_a[:, None] + areas_b[None, :] - intersection, 1e-9)
+
+
+def get_nr_matched(reference_boxes, reference_labels, boxes, labels, iou_threshold):
+    '''
+    :return: number of reference boxes overlapping a box of the same label with at least iou_threshold
+    '''
+    if len(reference_boxes) == 0 or len(boxes) == 0:
+        return 0
+    iou = get_iou_matrix(np.asarray(reference_boxes, dtype=np.float64), np.asarray(boxes, dtype=np.float64))
+    same_label = np.asarray(reference_labels)[:, None] == np.asarray(labels)[None, :]
+    return int(np.sum(np.any((iou >= iou_threshold) & same_label, axis=1)))
+
+
+def get_ground_truth(rois_file):
+    '''
+    :return: dictionary image base name -> (boxes, label names)
+    '''
+    ground_truth = dict()
+    for image_path, rois in meta.create_metadata_dictionary(meta.read_metadata(rois_file)).items():
+        boxes = [[roi.rect.tl.col, roi.rect.tl.row, roi.rect.br.col, roi.rect.br.row] for roi in rois]
+        labels = [meta.get_roi_type_name(roi.type) for roi in rois]
+        ground_truth[os.path.basename(image_path)] = (np.array(boxes).reshape(-1, 4), labels)
+    return ground_truth
+
+
+def benchmark(model, rois_labels, file_names, score_threshold_per_class, ground_truth, iou_threshold):
+    logger = logging.getLogger(__name__)
+    cascade = CascadePredictor(get_candidate_min_score(score_threshold_per_class))
+    times = {'two_pass': 0.0, 'cascade': 0.0}
+    nr_matched = {'two_pass': 0, 'cascade': 0}
+    nr_ground_truth, nr_two_pass, nr_cascade_agreement = 0, 0, 0
+    for file_name in file_names:
+        image = apollo_python_common.image.get_bgr(file_name)
+        if image is None:
+            continue
+        image = preprocess_image(image)
+        start = time.time()
+        two_pass_predictions, _ = predict_one_image(image, model, rois_labels, RESOLUTIONS,
+                                                    score_threshold_per_class, 0)
+        times['two_pass'] += time.time() - start
+        start = time.time()
+        cascade_predictions, _ = predict_one_image(image, model, rois_labels, RESOLUTIONS,
+                                                   score_threshold_per_class, 0, image_predictor=cascade)
+        times['cascade'] += time.time() - start
+
+        nr_two_pass += len(two_pass_predictions[0])
+        nr_cascade_agreement += get_nr_matched(two_pass_predictions[0], two_pass_predictions[2],
+                                               cascade_predictions[0], cascade_predictions[2], iou_threshold)
+        if ground_truth is not None:
+            gt_boxes, gt_labels = ground_truth.get(os.path.basename(file_name), (np.zeros((0, 4)), []))
+            nr_ground_truth += len(gt_boxes)
+            for mode, (boxes, _, labels) in [('two_pass', two_pass_predictions), ('cascade', cascade_predictions)]:
+                nr_matched[mode] += get_nr_matched(gt_boxes, gt_labels, boxes, labels, iou_threshold)
+
+    nr_images = max(len(file_names), 1)
+    for mode in ['two_pass', 'cascade']:
+        logger.info("{:8s} {:.1f} ms/image".format(mode, 1000 * times[mode] / nr_images))
+    logger.info("cascade speedup {:.2f}x".format(times['two_pass'] / times['cascade'] if times['cascade'] > 0 else 0))
+    logger.info("two pass detections found by the cascade {}/{} = {:.2%}".format(
+        nr_cascade_agreement, nr_two_pass, nr_cascade_agreement / nr_two_pass if nr_two_pass > 0 else 1))
+    if ground_truth is not None:
+        for mode in ['two_pass', 'cascade']:
+            logger.info("{:8s} recall {}/{} = {:.2%}".format(mode, nr_matched[mode], nr_ground_truth,
+                                                             nr_matched[mode] / max(nr_ground_truth, 1)))
+    logger.info("Cascade: {}".format(cascade))
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Compares the coarse to fine cascade with the two pass prediction.')
+    parser.add_argument('--weights_file', type=str, required=True)
+    parser.add_argument('--train_meta_file', type=str, required=True,
+                        help='Metadata file used for training, for the class labels.')
+    parser.add_argument('--input_images_path', type=str, required=True)
+    parser.add_argument('--gt_rois_file', type=str, default=None,
+                        help='Optional metadata file with the ground truth of the images, for the recall.')
+    parser.add_argument('--threshold_file', type=str, default='SAME')
+    parser.add_argument('--lowest_score_threshold', type=float, default=0.5)
+    parser.add_argument('--max_number_of_images', type=int, default=200)
+    parser.add_argument('--iou_threshold', type=float, default=IOU_THRESHOLD)
+    parser.add_argument('--multi_gpu', type=int, default=1)
+    return parser.parse_args(args)
+
+
+def main():
+    log_util.config(__file__)
+    args = parse_args(sys.argv[1:])
+    rois_labels = RoisLabels(args.train_meta_file)
+    if args.threshold_file == 'SAME':
+        score_threshold_per_class = dict([(class_label, args.lowest_score_threshold)
+                                          for class_label in rois_labels.classes.keys()])
+    else:
+        score_threshold_per_class = io_utils.json_load(args.threshold_file)
+    model = get_model_for_pred(args)
+    file_names = sorted(io_utils.get_images_from_folder(args.input_images_path))[:args.max_number_of_images]
+    ground_truth = get_ground_truth(args.gt_rois_file) if args.gt_rois_file is not None else None
+    benchmark(model, rois_labels, file_names, score_threshold_per_class, ground_truth, args.iou_threshold)
+
+
+if __name__ == '__main__':
+    main()
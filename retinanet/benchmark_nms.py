@@ -0,0 +1,109 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import argparse
+import itertools
+import logging
+import sys
+import time
+
+import numpy as np
+
+import apollo_python_common.log_util as log_util
+from apollo_python_common.rectangle import Rectangle
+from retinanet.utils import non_max_suppression
+
+BOX_SET_SIZES = [10, 50, 100, 300, 1000, 5000]
+CLASS_NAMES = ['SIGNAL', 'STOP_US', 'SL_US_25', 'YIELD_US']
+RESOLUTIONS = [800, 1920]
+
+
+def pairwise_non_max_suppression(boxes, scores, resolutions, predicted_label_names, score_threshold_per_class,
+                                 iou_threshold=0.5):
+    '''
+    Previous pure python implementation, kept as reference for timing and agreement
+    '''
+    if len(boxes) == 0:
+        return []
+    pick = set([i for i in range(len(boxes)) if scores[i] > score_threshold_per_class[predicted_label_names[i]]])
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    should_continue = True
+    while should_continue:
+        should_continue = False
+        for (i1, i2) in itertools.combinations(list(range(0, len(boxes))), 2):
+            if i1 in pick and i2 in pick:
+                r1 = Rectangle(x1[i1], y1[i1], x2[i1], y2[i1])
+                r2 = Rectangle(x1[i2], y1[i2], x2[i2], y2[i2])
+                rect_intersect = r1.get_overlapped_rect(r2)
+                if rect_intersect.area() / r1.area() > iou_threshold or \
+                        rect_intersect.area() / r2.area() > iou_threshold:
+                    pick.remove(i1 if scores[i1] < scores[i2] else i2)
+                    should_continue = True
+    return sorted(pick)
+
+
+def get_synthetic_boxes(nr_boxes, image_width=1920, image_height=1080, seed=0):
+    '''
+    Generates boxes grouped around a few sign locations, as returned by the resolution passes on a busy frame
+    '''
+    random_state = np.random.RandomState(seed)
+    nr_signs = max(1, nr_boxes // 4)
+    centers = random_state.uniform((0, 0), (image_width, image_height), size=(nr_signs, 2))
+    sizes = random_state.uniform(15, 120, size=nr_signs)
+    sign_ids = random_state.randint(0, nr_signs, size=nr_boxes)
+    jitter = random_state.normal(0, 0.15, size=(nr_boxes, 4)) * sizes[sign_ids, None]
+    half_sizes = sizes[sign_ids, None] / 2
+    boxes = np.hstack([centers[sign_ids] - half_sizes, centers[sign_ids] + half_sizes]) + jitter
+    boxes[:, 2:] = np.maximum(boxes[:, 2:], boxes[:, :2] + 1)
+    scores = random_state.uniform(0.05, 1.0, size=nr_boxes)
+    resolutions = random_state.choice(RESOLUTIONS, size=nr_boxes)
+    label_names = np.array(CLASS_NAMES)[random_state.randint(0, len(CLASS_NAMES), size=nr_boxes)]
+    return boxes, scores, resolutions, label_names
+
+
+def time_function(function, arguments, repeats):
+    start = time.time()
+    for _ in range(repeats):
+        result = function(*arguments)
+    return (time.time() - start) / repeats, result
+
+
+def run_benchmark(box_set_sizes, max_reference_boxes, repeats):
+    logger = logging.getLogger(__name__)
+    score_threshold_per_class = dict([(class_name, 0.1) for class_name in CLASS_NAMES])
+    for nr_boxes in box_set_sizes:
+        arguments = get_synthetic_boxes(nr_boxes) + (score_threshold_per_class,)
+        vectorized_time, vectorized_pick = time_function(non_max_suppression, arguments, repeats)
+        line = "boxes {:5d} kept {:5d} vectorized {:9.3f} ms".format(nr_boxes, len(vectorized_pick),
+                                                                     vectorized_time * 1000)
+        if nr_boxes <= max_reference_boxes:
+            reference_time, reference_pick = time_function(pairwise_non_max_suppression, arguments, 1)
+            common = len(set(vectorized_pick) & set(reference_pick))
+            line += " pairwise {:10.3f} ms speedup {:8.1f}x agreement {:.3f}".format(
+                reference_time * 1000, reference_time / vectorized_time,
+                common / max(len(set(vectorized_pick) | set(reference_pick)), 1))
+        logger.info(line)
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Micro-benchmark for the non max suppression on synthetic boxes.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=BOX_SET_SIZES,
+                        help='Number of boxes in each synthetic set.')
+    parser.add_argument('--max_reference_boxes', type=int, default=300,
+                        help='Largest set on which the pairwise reference implementation is also timed.')
+    parser.add_argument('--repeats', type=int, default=10)
+    return parser.parse_args(args)
+
+
+def main():
+    log_util.config(__file__)
+    args = parse_args(sys.argv[1:])
+    run_benchmark(args.sizes, args.max_reference_boxes, args.repeats)
+
+
+if __name__ == '__main__':
+    main()
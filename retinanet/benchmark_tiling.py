@@ -0,0 +1,107 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+import apollo_python_common.image
+import apollo_python_common.io_utils as io_utils
+import apollo_python_common.log_util as log_util
+from retinanet.benchmark_cascade import get_nr_matched, get_ground_truth, IOU_THRESHOLD
+from retinanet.predict import get_model_for_pred, RESOLUTIONS
+from retinanet.tiling import TiledPredictor, TILE_SIZE, TILE_OVERLAP, TILE_BATCH_SIZE
+from retinanet.traffic_signs_generator import RoisLabels
+from retinanet.utils import preprocess_image, predict_one_image
+
+
+def benchmark(model, rois_labels, file_names, score_threshold_per_class, ground_truth, iou_threshold,
+              tiled_predictor):
+    logger = logging.getLogger(__name__)
+    modes = [('resize', None), ('tiled', tiled_predictor)]
+    images = list()
+    for file_name in file_names:
+        image = apollo_python_common.image.get_bgr(file_name)
+        if image is not None:
+            images.append((file_name, preprocess_image(image)))
+    if len(images) == 0:
+        logger.warning("No images to benchmark")
+        return
+
+    predictions = dict()
+    for mode, image_predictor in modes:
+        # the first prediction initializes the model, it is not timed
+        predict_one_image(images[0][1], model, rois_labels, RESOLUTIONS, score_threshold_per_class, 0,
+                          image_predictor=image_predictor)
+        start = time.time()
+        predictions[mode] = [predict_one_image(image, model, rois_labels, RESOLUTIONS,
+                                               score_threshold_per_class, 0, image_predictor=image_predictor)[0]
+                             for _, image in images]
+        elapsed_time = time.time() - start
+        logger.info("{:6s} {:.1f} ms/image {:.2f} images/sec".format(mode, 1000 * elapsed_time / len(images),
+                                                                     len(images) / elapsed_time))
+    logger.info("Tiles: {}".format(tiled_predictor))
+
+    nr_resize = sum([len(boxes) for boxes, _, _ in predictions['resize']])
+    nr_agreement = sum([get_nr_matched(resize_boxes, resize_labels, tiled_boxes, tiled_labels, iou_threshold)
+                        for (resize_boxes, _, resize_labels), (tiled_boxes, _, tiled_labels)
+                        in zip(predictions['resize'], predictions['tiled'])])
+    nr_tiled = sum([len(boxes) for boxes, _, _ in predictions['tiled']])
+    logger.info("resize detections = {} tiled detections = {} resize detections found by the tiles = {:.2%}".format(
+        nr_resize, nr_tiled, nr_agreement / nr_resize if nr_resize > 0 else 1))
+    if ground_truth is not None:
+        gt_per_image = [ground_truth.get(os.path.basename(file_name), (np.zeros((0, 4)), []))
+                        for file_name, _ in images]
+        nr_ground_truth = sum([len(gt_boxes) for gt_boxes, _ in gt_per_image])
+        for mode, _ in modes:
+            nr_matched = sum([get_nr_matched(gt_boxes, gt_labels, boxes, labels, iou_threshold)
+                              for (gt_boxes, gt_labels), (boxes, _, labels) in zip(gt_per_image, predictions[mode])])
+            logger.info("{:6s} recall {}/{} = {:.2%}".format(mode, nr_matched, nr_ground_truth,
+                                                             nr_matched / max(nr_ground_truth, 1)))
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Compares the tiled prediction with the resize prediction.')
+    parser.add_argument('--weights_file', type=str, required=True)
+    parser.add_argument('--train_meta_file', type=str, required=True,
+                        help='Metadata file used for training, for the class labels.')
+    parser.add_argument('--input_images_path', type=str, required=True)
+    parser.add_argument('--gt_rois_file', type=str, default=None,
+                        help='Optional metadata file with the ground truth of the images, for the recall.')
+    parser.add_argument('--threshold_file', type=str, default='SAME')
+    parser.add_argument('--lowest_score_threshold', type=float, default=0.5)
+    parser.add_argument('--max_number_of_images', type=int, default=200)
+    parser.add_argument('--iou_threshold', type=float, default=IOU_THRESHOLD)
+    parser.add_argument('--tile_size', type=int, default=TILE_SIZE)
+    parser.add_argument('--tile_overlap', type=int, default=TILE_OVERLAP)
+    parser.add_argument('--tile_batch_size', type=int, default=TILE_BATCH_SIZE)
+    parser.add_argument('--multi_gpu', type=int, default=1)
+    return parser.parse_args(args)
+
+
+def main():
+    log_util.config(__file__)
+    args = parse_args(sys.argv[1:])
+    rois_labels = RoisLabels(args.train_meta_file)
+    if args.threshold_file == 'SAME':
+        score_threshold_per_class = dict([(class_label, args.lowest_score_threshold)
+                                          for class_label in rois_labels.classes.keys()])
+    else:
+        score_threshold_per_class = io_utils.json_load(args.threshold_file)
+    model = get_model_for_pred(args)
+    file_names = sorted(io_utils.get_images_from_folder(args.input_images_path))[:args.max_number_of_images]
+    ground_truth = get_ground_truth(args.gt_rois_file) if args.gt_rois_file is not None else None
+    benchmark(model, rois_labels, file_names, score_threshold_per_class, ground_truth, args.iou_threshold,
+              TiledPredictor(args.tile_size, args.tile_overlap, args.tile_batch_size))
+
+
+if __name__ == '__main__':
+    main()
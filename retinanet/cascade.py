@@ -0,0 +1,186 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import threading
+
+import cv2
+import numpy as np
+
+import retinanet.image_pyramid as image_pyramid
+from retinanet.utils import get_predicted_detections, MIN_SCORE_THRESHOLD
+
+# the coarse boxes scoring above this ratio of the lowest class threshold are candidates, so that the weak signs
+# missed by the coarse resolution are refined
+CANDIDATE_SCORE_RATIO = 0.5
+# context added around a candidate box, as a ratio of its size
+CROP_PADDING_RATIO = 1.0
+# smallest crop side, in fine resolution pixels, so that the model sees enough context
+MIN_CROP_SIZE = 256
+MAX_CROPS = 8
+# when the crops cover more than this ratio of the image, the fine pass is run on the full image
+MAX_CROP_AREA_RATIO = 0.5
+# fine boxes closer than this to an inner crop border are cut by the crop and are discarded
+CROP_BORDER_MARGIN = 2
+
+
+def get_candidate_min_score(score_threshold_per_class, candidate_score_ratio=CANDIDATE_SCORE_RATIO):
+    '''
+    :param score_threshold_per_class: dictionary class name -> minimum score
+    :return: minimum score of the coarse candidates, below the lowest class threshold
+    '''
+    return max(MIN_SCORE_THRESHOLD, candidate_score_ratio * min(score_threshold_per_class.values()))
+
+
+class CascadePredictor(object):
+    '''
+    Coarse to fine prediction: the smallest resolution runs on the full image and proposes candidate regions, then
+    the largest resolution runs only on padded crops around the candidates. The fine boxes are mapped back to the
+    image and merged with the coarse ones by the usual non max suppression.
+    '''
+
+    def __init__(self, candidate_min_score, crop_padding_ratio=CROP_PADDING_RATIO, min_crop_size=MIN_CROP_SIZE,
+                 max_crops=MAX_CROPS, max_crop_area_ratio=MAX_CROP_AREA_RATIO):
+        '''
+        :param candidate_min_score: the coarse boxes scoring above it are refined, it should be below the class
+        thresholds, see get_candidate_min_score
+        '''
+        self.candidate_min_score = candidate_min_score
+        self.crop_padding_ratio = crop_padding_ratio
+        self.min_crop_size = min_crop_size
+        self.max_crops = max_crops
+        self.max_crop_area_ratio = max_crop_area_ratio
+        self.lock = threading.Lock()
+        self.nr_images = 0
+        self.nr_crops = 0
+        self.nr_full_fine_passes = 0
+        self.fine_pixels = 0
+        self.full_fine_pixels = 0
+
+    def get_crops(self, boxes, scores, image_shape, fine_scale):
+        '''
+        Pads the candidate boxes and merges the overlapping ones
+        :param boxes: (N, 4) array with the coarse boxes in image coordinates
+        :param scores: (N,) array with the coarse scores
+        :param image_shape: shape of the image
+        :param fine_scale: scale from image to fine resolution
+        :return: list of (x1, y1, x2, y2) integer crops, or None when the fine pass should run on the full image
+        '''
+        height, width = image_shape[0], image_shape[1]
+        candidates = boxes[scores >= self.candidate_min_score]
+        if len(candidates) == 0:
+            return []
+        min_crop_size = self.min_crop_size / fine_scale
+        centers = (candidates[:, :2] + candidates[:, 2:]) / 2
+        sizes = np.maximum((candidates[:, 2:] - candidates[:, :2]) * (1 + 2 * self.crop_padding_ratio),
+                           min_crop_size)
+        crops = np.hstack([centers - sizes / 2, centers + sizes / 2])
+        crops = np.clip(crops, 0, [width, height, width, height])
+
+        # union of the overlapping crops, until no two crops overlap
+        merged = [crop for crop in crops]
+        has_merged = True
+        while has_merged:
+            has_merged = False
+            for i in range(len(merged)):
+                for j in range(i + 1, len(merged)):
+                    if merged[i][0] < merged[j][2] and merged[j][0] < merged[i][2] and \
+                            merged[i][1] < merged[j][3] and merged[j][1] < merged[i][3]:
+                        merged[i] = np.hstack([np.minimum(merged[i][:2], merged[j][:2]),
+                                               np.maximum(merged[i][2:], merged[j][2:])])
+                        del merged[j]
+                        has_merged = True
+                        break
+                if has_merged:
+                    break
+
+        crop_area = sum([(crop[2] - crop[0]) * (crop[3] - crop[1]) for crop in merged])
+        if len(merged) > self.max_crops or crop_area > self.max_crop_area_ratio * width * height:
+            return None
+        return [tuple(int(round(value)) for value in crop) for crop in merged]
+
+    @staticmethod
+    def __keep_inside_crop(boxes, crop, image_shape):
+        # a crop border which is also an image border does not cut boxes
+        x1, y1, x2, y2 = crop
+        keep = np.ones(len(boxes), dtype=bool)
+        if x1 > 0:
+            keep &= boxes[:, 0] > x1 + CROP_BORDER_MARGIN
+        if y1 > 0:
+            keep &= boxes[:, 1] > y1 + CROP_BORDER_MARGIN
+        if x2 < image_shape[1]:
+            keep &= boxes[:, 2] < x2 - CROP_BORDER_MARGIN
+        if y2 < image_shape[0]:
+            keep &= boxes[:, 3] < y2 - CROP_BORDER_MARGIN
+        return keep
+
+    def __predict_resolution(self, image, model, resolution):
+        image_resized, scale = image_pyramid.get_pyramid(image, [resolution])[resolution]
+        image_for_pred = image_pyramid.get_network_input(image_resized)
+        boxes, scores, labels = get_predicted_detections(model, np.expand_dims(image_for_pred, axis=0))
+        return boxes[0] / scale, scores[0], labels[0], image_resized.shape[0] * image_resized.shape[1]
+
+    def __predict_crops(self, image, model, crops, fine_scale):
+        images_resized = [cv2.resize(image[y1:y2, x1:x2], None, fx=fine_scale, fy=fine_scale)
+                          for x1, y1, x2, y2 in crops]
+        images_for_pred, _ = image_pyramid.get_network_input_batch(images_resized)
+        all_crops_boxes, all_crops_scores, all_crops_labels = get_predicted_detections(model, images_for_pred)
+        all_boxes, all_scores, all_labels = list(), list(), list()
+        for crop, boxes, scores, labels in zip(crops, all_crops_boxes, all_crops_scores, all_crops_labels):
+            boxes = boxes / fine_scale + [crop[0], crop[1], crop[0], crop[1]]
+            keep = self.__keep_inside_crop(boxes, crop, image.shape)
+            all_boxes.append(boxes[keep])
+            all_scores.append(scores[keep])
+            all_labels.append(labels[keep])
+        nr_pixels = sum([image_resized.shape[0] * image_resized.shape[1] for image_resized in images_resized])
+        return np.concatenate(all_boxes), np.concatenate(all_scores), np.concatenate(all_labels), nr_pixels
+
+    def predict_per_resolution(self, image, model, rois_labels, resolutions):
+        '''
+        Same as retinanet.utils.predict_one_image_per_resolution, running the largest resolution only on crops
+        :return: lists of boxes, resolution tags, labels, scores and label names with one element per resolution
+        '''
+        coarse_resolution, fine_resolution = min(resolutions), max(resolutions)
+        long_side = max(image.shape[0], image.shape[1])
+        fine_scale = float(fine_resolution) / long_side
+        passes = list()
+        coarse_boxes, coarse_scores, coarse_labels, _ = self.__predict_resolution(image, model, coarse_resolution)
+        passes.append((coarse_resolution, coarse_boxes, coarse_scores, coarse_labels))
+        crops = None
+        if fine_resolution > coarse_resolution:
+            crops = self.get_crops(coarse_boxes, coarse_scores, image.shape, fine_scale)
+            if crops is None:
+                fine_boxes, fine_scores, fine_labels, fine_pixels = \
+                    self.__predict_resolution(image, model, fine_resolution)
+                passes.append((fine_resolution, fine_boxes, fine_scores, fine_labels))
+            elif len(crops) > 0:
+                fine_boxes, fine_scores, fine_labels, fine_pixels = \
+                    self.__predict_crops(image, model, crops, fine_scale)
+                passes.append((fine_resolution, fine_boxes, fine_scores, fine_labels))
+            else:
+                fine_pixels = 0
+            with self.lock:
+                self.nr_images += 1
+                self.nr_crops += len(crops) if crops is not None else 0
+                self.nr_full_fine_passes += 1 if crops is None else 0
+                self.fine_pixels += fine_pixels
+                self.full_fine_pixels += int(image.shape[0] * fine_scale) * int(image.shape[1] * fine_scale)
+
+        all_boxes, all_resolutions, all_predicted_labels, all_scores, all_predicted_label_names = [], [], [], [], []
+        for resolution, boxes, scores, labels in passes:
+            all_boxes.append(boxes)
+            all_resolutions.append(np.full(len(boxes), resolution))
+            all_predicted_labels.append(labels)
+            all_scores.append(scores)
+            all_predicted_label_names.append([rois_labels.label_to_name(label) for label in labels])
+        return all_boxes, all_resolutions, all_predicted_labels, all_scores, all_predicted_label_names
+
+    def fine_pixels_ratio(self):
+        return self.fine_pixels / self.full_fine_pixels if self.full_fine_pixels > 0 else 0
+
+    def __str__(self):
+        return "candidate min score = {} images = {} crops = {} full fine passes = {} fine pixels vs full frame = {:.2%}".format(
+            self.candidate_min_score, self.nr_images, self.nr_crops, self.nr_full_fine_passes, self.fine_pixels_ratio())
@@ -0,0 +1,219 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from queue import Queue
+
+import apollo_python_common.image
+import apollo_python_common.io_utils as io_utils
+from retinanet.utils import get_image_fc_VP, predict_one_image_per_resolution, merge_predictions, \
+    save_image_with_predictions, get_preds_in_common_format, check_image_predictor
+from vanishing_point.vanishing_point import VanishingPointDetector
+
+NR_PREPROCESS_WORKERS = 4
+NR_POSTPROCESS_WORKERS = 2
+PREPROCESS_QUEUE_SIZE = 8
+POSTPROCESS_QUEUE_SIZE = 8
+
+# marks the end of the work in a queue
+_SENTINEL = None
+
+
+class StageTimings(object):
+    '''
+    Thread safe accumulator of the time spent in each pipeline stage
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total_times = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.total_times[stage] += seconds
+            self.counts[stage] += 1
+
+    def __str__(self):
+        with self.lock:
+            return " ".join(["{} = {:.2f}s ({:.1f} ms/img)".format(
+                stage, self.total_times[stage], 1000 * self.total_times[stage] / self.counts[stage])
+                for stage in self.total_times.keys()])
+
+
+class PipelineElem(object):
+    def __init__(self, file_name, image=None):
+        self.file_name = file_name
+        self.image = image
+        self.predictions_per_resolution = None
+
+
+class FolderPredictionPipeline(object):
+    '''
+    Bounded producer/consumer pipeline for folder prediction. A pool of workers reads the images, detects the
+    vanishing point and preprocesses them ahead of the model, the model runs in the calling thread and another pool
+    merges the predictions of all resolutions, draws them and writes the output images.
+    '''
+    def __init__(self, model, rois_labels, resolutions, score_threshold_per_class,
+                 nr_preprocess_workers=NR_PREPROCESS_WORKERS, nr_postprocess_workers=NR_POSTPROCESS_WORKERS,
+                 preprocess_queue_size=PREPROCESS_QUEUE_SIZE, postprocess_queue_size=POSTPROCESS_QUEUE_SIZE,
+                 vanishing_points=None, resolution_policy=None, image_predictor=None):
+        # without workers on both sides of the model the bounded queues are never drained
+        if nr_preprocess_workers < 1 or nr_postprocess_workers < 1:
+            raise ValueError("The pipeline needs at least one preprocess and one postprocess worker, got {} and {}"
+                             .format(nr_preprocess_workers, nr_postprocess_workers))
+        check_image_predictor(image_predictor, resolution_policy)
+        self.model = model
+        self.rois_labels = rois_labels
+        self.resolutions = resolutions
+        self.score_threshold_per_class = score_threshold_per_class
+        self.nr_preprocess_workers = nr_preprocess_workers
+        self.nr_postprocess_workers = nr_postprocess_workers
+        self.preprocess_queue_size = preprocess_queue_size
+        self.postprocess_queue_size = postprocess_queue_size
+        self.vanishing_points = vanishing_points if vanishing_points is not None else dict()
+        self.resolution_policy = resolution_policy
+        self.image_predictor = image_predictor
+        self.timings = StageTimings()
+
+    def __timed(self, stage, function, *args):
+        start = time.time()
+        result = function(*args)
+        self.timings.add(stage, time.time() - start)
+        return result
+
+    def __preprocess_worker(self, files_queue, preprocessed_queue):
+        logger = logging.getLogger(__name__)
+        # the detector keeps intermediate images as members, so it can not be shared between threads
+        vp_detector = VanishingPointDetector()
+        while True:
+            file_name = files_queue.get()
+            if file_name is _SENTINEL:
+                break
+            try:
+                image = self.__timed('decode', apollo_python_common.image.get_bgr, file_name)
+                image = self.__timed('vp', get_image_fc_VP, image, vp_detector,
+                                     self.vanishing_points.get(os.path.basename(file_name)))
+                # the conversion to float is done by the model thread, at the network input size
+                preprocessed_queue.put(PipelineElem(file_name, image))
+            except Exception as err:
+                logger.warning('Image {} is corrupted: {}'.format(file_name, err))
+        preprocessed_queue.put(_SENTINEL)
+
+    def __postprocess_worker(self, postprocessed_queue, output_folder, draw_predictions, all_predictions):
+        logger = logging.getLogger(__name__)
+        while True:
+            elem = postprocessed_queue.get()
+            if elem is _SENTINEL:
+                break
+            try:
+                merged_predictions = self.__timed('nms', merge_predictions, *elem.predictions_per_resolution,
+                                                  self.score_threshold_per_class)
+                # dictionary item assignment is atomic, no lock is needed
+                all_predictions[os.path.basename(elem.file_name)] = merged_predictions
+                if draw_predictions:
+                    self.__timed('draw_write', save_image_with_predictions, elem.image, merged_predictions,
+                                 output_folder, elem.file_name)
+            except Exception as err:
+                logger.error('Image {} postprocessing failed: {}'.format(elem.file_name, err), exc_info=True)
+
+    def __start_workers(self, target, nr_workers, *args):
+        workers = [threading.Thread(target=target, args=args, daemon=True) for _ in range(nr_workers)]
+        for worker in workers:
+            worker.start()
+        return workers
+
+    def run(self, img_files_lst, output_folder, draw_predictions):
+        '''
+        Predicts the given images
+        :return: dictionary image base name -> (boxes, scores, label names)
+        '''
+        logger = logging.getLogger(__name__)
+        all_predictions = dict()
+        files_queue = Queue()
+        for file_name in img_files_lst:
+            files_queue.put(file_name)
+        for _ in range(self.nr_preprocess_workers):
+            files_queue.put(_SENTINEL)
+        preprocessed_queue = Queue(maxsize=self.preprocess_queue_size)
+        postprocess_queue = Queue(maxsize=self.postprocess_queue_size)
+
+        preprocess_workers = self.__start_workers(self.__preprocess_worker, self.nr_preprocess_workers,
+                                                  files_queue, preprocessed_queue)
+        postprocess_workers = self.__start_workers(self.__postprocess_worker, self.nr_postprocess_workers,
+                                                   postprocess_queue, output_folder, draw_predictions,
+                                                   all_predictions)
+        nr_finished_preprocess_workers = 0
+        while nr_finished_preprocess_workers < self.nr_preprocess_workers:
+            elem = self.__timed('predict_wait', preprocessed_queue.get)
+            if elem is _SENTINEL:
+                nr_finished_preprocess_workers += 1
+                continue
+            try:
+                elem.predictions_per_resolution = self.__timed('predict', self.__predict, elem.image)
+            except Exception as err:
+                logger.error('Image {} prediction failed: {}'.format(elem.file_name, err), exc_info=True)
+                continue
+            postprocess_queue.put(elem)
+        for _ in range(self.nr_postprocess_workers):
+            postprocess_queue.put(_SENTINEL)
+
+        for worker in preprocess_workers + postprocess_workers:
+            worker.join()
+        return all_predictions
+
+    def __predict(self, image):
+        if self.image_predictor is not None:
+            all_boxes, all_resolutions, _, all_scores, all_predicted_label_names = \
+                self.image_predictor.predict_per_resolution(image, self.model, self.rois_labels,
+                                                            self.resolutions)
+            return all_boxes, all_resolutions, all_scores, all_predicted_label_names
+        all_boxes, all_resolutions, _, all_scores, all_predicted_label_names = \
+            predict_one_image_per_resolution(image, self.model, self.rois_labels, self.resolutions,
+                                             self.resolution_policy)
+        return all_boxes, all_resolutions, all_scores, all_predicted_label_names
+
+
+def predict_folder_pipelined(model, input_folder, output_folder, resolutions, rois_labels, score_threshold_per_class,
+                             algorithm="retinanet", draw_predictions=False, max_number_of_images=None,
+                             nr_preprocess_workers=NR_PREPROCESS_WORKERS,
+                             nr_postprocess_workers=NR_POSTPROCESS_WORKERS,
+                             preprocess_queue_size=PREPROCESS_QUEUE_SIZE,
+                             postprocess_queue_size=POSTPROCESS_QUEUE_SIZE, vanishing_points=None,
+                             resolution_policy=None, image_predictor=None):
+    '''
+    Same as retinanet.utils.predict_folder, but overlaps image reading, vanishing point detection, preprocessing and
+    output writing with the model predictions
+    '''
+    logger = logging.getLogger(__name__)
+    if output_folder is not None and not os.path.isdir(output_folder):
+        io_utils.create_folder(output_folder)
+
+    img_files_lst = sorted(io_utils.get_images_from_folder(input_folder))
+    if max_number_of_images!=None:
+        img_files_lst = img_files_lst[:max_number_of_images]
+
+    pipeline = FolderPredictionPipeline(model, rois_labels, resolutions, score_threshold_per_class,
+                                        nr_preprocess_workers, nr_postprocess_workers,
+                                        preprocess_queue_size, postprocess_queue_size, vanishing_points,
+                                        resolution_policy, image_predictor)
+    start = time.time()
+    all_predictions = pipeline.run(img_files_lst, output_folder, draw_predictions)
+    elapsed_time = time.time() - start
+    logger.info('Pipelined prediction on {}: images = {} images/sec = {:.2f}'.format(
+        input_folder, len(all_predictions), len(all_predictions) / elapsed_time if elapsed_time > 0 else 0))
+    logger.info('Stage timings: {}'.format(pipeline.timings))
+    if resolution_policy is not None:
+        logger.info('Resolution policy: {}'.format(resolution_policy))
+    if image_predictor is not None:
+        logger.info('Image predictor: {}'.format(image_predictor))
+
+    metadata = get_preds_in_common_format(all_predictions, algorithm, "")
+    return metadata
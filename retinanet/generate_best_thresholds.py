@@ -9,37 +9,31 @@ import argparse
 import sys
 import logging
 import numpy as np
-from tqdm import tqdm
-from multiprocessing import Pool
-import multiprocessing
 
 import apollo_python_common.log_util as log_util
 import apollo_python_common.proto_api as meta
 from apollo_python_common.generate_model_statistics import get_model_statistics
+from apollo_python_common.roi_table import read_metadata_dictionary
+from apollo_python_common.threshold_sweep import ThresholdSweep
 import apollo_python_common.io_utils as io_utils
 
 
 MIN_SIZE = 15
+DEFAULT_THRESHOLD = 0.5
+# searching best in range of 0.1 to 1 with the step 0.01
+THRESHOLDS = [round(thr, 2) for thr in np.arange(0.1, 1.01, 0.01)]
 
 
-def get_threshold_for_class(data):
+def get_threshold_for_class(threshold_sweep, class_name):
     logger = logging.getLogger(__name__)
-    expected_dict, actual_dict, class_name = data
-    class_names = set(meta.get_class_names_from_metadata_dictionary(expected_dict)).union(
-        set(meta.get_class_names_from_metadata_dictionary(actual_dict)))
-    thresholds_per_class = dict([(c, 0.5) for c in class_names])
     logger.info("Searching best threshold for class {}".format(class_name))
     best_acc = 0
     best_threshold = 0.1
-    for thr in tqdm(np.arange(0.1, 1.01, 0.01)): # searching best in range of 0.1 to 1 with the step 0.01
-        thresholds_per_class[class_name] = round(thr, 2)
-        confident_dict = get_confident_rois(actual_dict, thresholds_per_class)
-        statistics_dict = get_model_statistics(expected_dict, confident_dict, None, MIN_SIZE)
-        accuracy = statistics_dict['Total'].accuracy()
+    for thr, statistics in zip(THRESHOLDS, threshold_sweep.sweep(class_name, THRESHOLDS)):
+        accuracy = statistics.accuracy()
         if accuracy > best_acc:
             best_acc = accuracy
-            best_threshold = thresholds_per_class[class_name]
-    thresholds_per_class[class_name] = best_threshold
+            best_threshold = thr
     logger.info('Best threshold for class {}: {}'.format(class_name, best_threshold))
     return class_name, best_threshold
 
@@ -48,12 +42,10 @@ def get_thresholds(expected_dict, actual_dict):
     logger = logging.getLogger(__name__)
     class_names = set(meta.get_class_names_from_metadata_dictionary(expected_dict)).union(
         set(meta.get_class_names_from_metadata_dictionary(actual_dict)))
-    data = [(expected_dict, actual_dict, class_name) for class_name in class_names]
-    threads_number = multiprocessing.cpu_count() // 2
-    pool = Pool(threads_number)
-    thresholds = pool.map(get_threshold_for_class, data)
-    pool.close()
-    thresholds_per_class = dict(thresholds)
+    # the predictions are matched to the ground truth once for all the classes and thresholds
+    threshold_sweep = ThresholdSweep(expected_dict, actual_dict, MIN_SIZE, DEFAULT_THRESHOLD)
+    thresholds_per_class = dict([get_threshold_for_class(threshold_sweep, class_name)
+                                 for class_name in sorted(class_names)])
     # Evaluating with best thresholds
     confident_dict = get_confident_rois(actual_dict, thresholds_per_class)
     statistics_dict = get_model_statistics(expected_dict, confident_dict, None, MIN_SIZE)
@@ -93,12 +85,11 @@ def main():
     # parse arguments
     args = sys.argv[1:]
     args = parse_args(args)
-    # get metadata
-    expected_metadata = meta.read_metadata(args.expected_rois_file)
-    actual_metadata = meta.read_metadata(args.actual_rois_file)
+    # get metadata, from the cached tables of the rois files after the first run
+    expected_dict = read_metadata_dictionary(args.expected_rois_file, True)
+    actual_dict = read_metadata_dictionary(args.actual_rois_file, True)
     # calculate best thresholds
-    best_thresholds = get_thresholds(meta.create_metadata_dictionary(expected_metadata, True),
-                            meta.create_metadata_dictionary(actual_metadata, True))
+    best_thresholds = get_thresholds(expected_dict, actual_dict)
     io_utils.json_dump(best_thresholds, args.result_file)
 
 
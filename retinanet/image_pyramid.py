@@ -0,0 +1,115 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# BGR means subtracted by keras_retinanet.utils.image.preprocess_image
+IMAGE_MEANS = np.array([103.939, 116.779, 123.68], dtype=np.float32)
+# number of network input buffers kept per thread, one for each input shape seen recently
+MAX_BUFFERS = 8
+
+_buffers = threading.local()
+
+
+def __get_buffer(shape):
+    '''
+    :return: float32 buffer of the given shape owned by the current thread, its content is overwritten by the next
+    request of the same shape from the same thread
+    '''
+    if not hasattr(_buffers, 'pool'):
+        _buffers.pool = OrderedDict()
+    shape = tuple(shape)
+    if shape in _buffers.pool:
+        _buffers.pool.move_to_end(shape)
+    else:
+        _buffers.pool[shape] = np.empty(shape, dtype=np.float32)
+        if len(_buffers.pool) > MAX_BUFFERS:
+            _buffers.pool.popitem(last=False)
+    return _buffers.pool[shape]
+
+
+def get_scale(image_shape, resolution):
+    return float(resolution) / max(image_shape[0], image_shape[1])
+
+
+def get_scaled_size(image_shape, scale):
+    # same rounding as cv2.resize with fx and fy
+    return int(round(image_shape[1] * scale)), int(round(image_shape[0] * scale))
+
+
+def add_level(pyramid, image, resolution):
+    '''
+    Resizes an uint8 image to one resolution and adds it to a pyramid. A downscaled level is resized from the
+    smallest level of the pyramid which is larger, so that only the largest level reads the full image, and no other
+    resolution is resized.
+    :param pyramid: dictionary resolution -> (uint8 resized image, scale) of the levels already built
+    :param image: uint8 BGR image
+    :param resolution: size of the longest image side
+    :return: (uint8 resized image, scale from image to resized image)
+    '''
+    if resolution in pyramid:
+        return pyramid[resolution]
+    scale = get_scale(image.shape, resolution)
+    # upscaled levels are resized from the image itself
+    source, source_scale = image, 1.0
+    for level, level_scale in pyramid.values():
+        if scale <= level_scale < source_scale:
+            source, source_scale = level, level_scale
+    size = get_scaled_size(image.shape, scale)
+    if size == (source.shape[1], source.shape[0]):
+        level = source
+    else:
+        level = cv2.resize(source, size)
+    pyramid[resolution] = (level, scale)
+    return pyramid[resolution]
+
+
+def get_pyramid(image, resolutions):
+    '''
+    Resizes an uint8 image to all the resolutions. The levels are built from the largest to the smallest, each
+    downscaled level being resized from the previous one, see add_level.
+    :param image: uint8 BGR image
+    :param resolutions: requested resolutions, i.e. sizes of the longest image side
+    :return: dictionary resolution -> (uint8 resized image, scale from image to resized image)
+    '''
+    pyramid = dict()
+    for resolution in sorted(set(resolutions), reverse=True):
+        add_level(pyramid, image, resolution)
+    return pyramid
+
+
+def get_network_input(image):
+    '''
+    Converts an uint8 image to the float network input, in a buffer reused by the next call of the thread
+    :return: float32 image with the means subtracted
+    '''
+    network_input = __get_buffer(image.shape)
+    np.subtract(image, IMAGE_MEANS, out=network_input)
+    return network_input
+
+
+def get_network_input_batch(images):
+    '''
+    Converts uint8 images of different sizes to a batch of float network inputs, padded with zeros on the bottom
+    and right, in a buffer reused by the next call of the thread
+    :return: (batch, number of padded pixels)
+    '''
+    max_height = max([image.shape[0] for image in images])
+    max_width = max([image.shape[1] for image in images])
+    batch = __get_buffer((len(images), max_height, max_width, 3))
+    padded_pixels = 0
+    for idx, image in enumerate(images):
+        height, width = image.shape[0], image.shape[1]
+        np.subtract(image, IMAGE_MEANS, out=batch[idx, :height, :width])
+        batch[idx, height:, :] = 0
+        batch[idx, :height, width:] = 0
+        padded_pixels += max_height * max_width - height * width
+    return batch, padded_pixels
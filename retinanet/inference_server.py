@@ -0,0 +1,315 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent import futures
+
+import grpc
+
+import inference_service_pb2
+import inference_service_pb2_grpc
+import apollo_python_common.image
+import apollo_python_common.io_utils as io_utils
+import apollo_python_common.log_util as log_util
+import apollo_python_common.proto_api as proto_api
+import apollo_python_common.shared_memory as shared_memory
+from retinanet.micro_batcher import MicroBatcher, MAX_BATCH_SIZE, MAX_WAIT_MS
+from retinanet.predict import get_model_for_pred, RESOLUTIONS
+from retinanet.traffic_signs_generator import RoisLabels
+from retinanet.utils import preprocess_image, predict_images_on_batch, get_preds_in_common_format, BatchStatistics
+from vanishing_point.vanishing_point import VanishingPointDetector
+
+PORT = 31338
+NR_SERVER_THREADS = 16
+STATISTICS_LOG_INTERVAL = 60
+# requests with encoded images are larger than the 4 MB grpc default
+MAX_MESSAGE_LENGTH = 256 * 1024 * 1024
+# images of a streamed request queued for prediction, in number of batches, it bounds the memory of a request
+STREAM_WINDOW_BATCHES = 2
+
+
+def get_request_image_paths(images_path):
+    '''
+    :param images_path: folder with images or path of one image
+    :return: list of image paths, empty when the path does not exist
+    '''
+    if os.path.isdir(images_path):
+        return sorted(io_utils.get_images_from_folder(images_path))
+    if os.path.isfile(images_path):
+        return [images_path]
+    return []
+
+
+class RetinaNetInferenceService(inference_service_pb2_grpc.InferenceServiceServicer):
+    '''
+    RetinaNet implementation of the InferenceService. The images of concurrent requests are read, or taken from the
+    request or from shared memory, and cropped above the vanishing point in the request threads, then they are queued
+    for one model thread which predicts them in micro batches.
+    '''
+
+    def __init__(self, config, rois_labels, score_threshold_per_class, max_batch_size=MAX_BATCH_SIZE,
+                 max_wait_ms=MAX_WAIT_MS, stream_window_size=None):
+        '''
+        :param config: model configuration given to get_model_for_pred
+        :param stream_window_size: maximum number of images of a streamed request waiting for their prediction,
+        STREAM_WINDOW_BATCHES batches when missing
+        '''
+        self.config = config
+        self.rois_labels = rois_labels
+        self.score_threshold_per_class = score_threshold_per_class
+        self.model = None
+        self.batch_statistics = BatchStatistics()
+        self.local = threading.local()
+        self.start_time = time.time()
+        self.stream_window_size = stream_window_size if stream_window_size is not None \
+            else STREAM_WINDOW_BATCHES * max_batch_size
+        self.batcher = MicroBatcher(self.__predict_batch, max_batch_size, max_wait_ms, initializer=self.__load_model)
+
+    def __load_model(self):
+        # the model is loaded by the thread which uses it, the tensorflow graph name depends on the thread
+        self.model = get_model_for_pred(self.config)
+
+    def __predict_batch(self, images):
+        predictions = predict_images_on_batch(images, self.model, self.rois_labels, RESOLUTIONS,
+                                              self.score_threshold_per_class, 0, self.batch_statistics)
+        # the statistics are updated only by the model thread, the throughput is measured until the last batch
+        self.batch_statistics.total_time = time.time() - self.start_time
+        return predictions
+
+    def __get_vp_detector(self):
+        # the detector keeps intermediate images as members, so each request thread has its own
+        if not hasattr(self.local, 'vp_detector'):
+            self.local.vp_detector = VanishingPointDetector()
+        return self.local.vp_detector
+
+    def start(self):
+        self.batcher.start()
+        self.start_time = time.time()
+
+    def stop(self):
+        self.batcher.stop()
+
+    def __submit(self, image_path):
+        # returns None for a corrupted image
+        image = apollo_python_common.image.get_bgr(image_path)
+        if image is None:
+            logging.getLogger(__name__).warning('Image {} is corrupted'.format(image_path))
+            return None
+        return self.__preprocess_and_submit(image_path, image)
+
+    def __preprocess_and_submit(self, image_name, image):
+        # returns None for an image which can not be preprocessed, so that it fails only its own result
+        try:
+            image = preprocess_image(image, self.__get_vp_detector())
+        except Exception as err:
+            logging.getLogger(__name__).error('Image {} preprocessing failed: {}'.format(image_name, err),
+                                              exc_info=True)
+            return None
+        return self.batcher.submit(image)
+
+    def predict_images(self, image_paths):
+        '''
+        Predicts images using the shared model thread, with at most stream_window_size decoded images alive
+        :return: dictionary image base name -> (boxes, scores, label names), without the corrupted images and the
+        images which could not be predicted
+        '''
+        return dict([(file_name, predictions) for file_name, predictions in self.predict_images_in_order(image_paths)
+                     if predictions is not None])
+
+    def predict_decoded_images(self, images):
+        '''
+        Predicts decoded images using the shared model thread, with at most stream_window_size images of the request
+        waiting for their prediction
+        :param images: iterable of (image name, BGR image or None for an image which could not be decoded), it is
+        advanced as the predictions are returned
+        :return: dictionary image name -> (boxes, scores, label names), without the images which could not be decoded
+        or predicted
+        '''
+        submissions = ((image_name, self.__preprocess_and_submit(image_name, image) if image is not None else None)
+                       for image_name, image in images)
+        return dict([(image_name, predictions) for image_name, predictions in self.__get_results_in_order(submissions)
+                     if predictions is not None])
+
+    def predict_images_in_order(self, image_paths):
+        '''
+        Predicts images using the shared model thread, keeping at most stream_window_size images submitted and not
+        yet returned
+        :return: generator of (image base name, (boxes, scores, label names) or None for a corrupted image or an image
+        which could not be predicted), in the order of image_paths
+        '''
+        return self.__get_results_in_order((os.path.basename(image_path), self.__submit(image_path))
+                                           for image_path in image_paths)
+
+    def __get_results_in_order(self, submissions):
+        # submissions is a generator of (image name, future or None), it is advanced only while less than
+        # stream_window_size images wait for their prediction, so the images are decoded as the window drains
+        pending = deque()
+        for image_name, future in submissions:
+            pending.append((image_name, future))
+            if len(pending) >= self.stream_window_size:
+                image_name, future = pending.popleft()
+                yield image_name, self.__get_result(image_name, future)
+        while len(pending) > 0:
+            image_name, future = pending.popleft()
+            yield image_name, self.__get_result(image_name, future)
+
+    @staticmethod
+    def __get_result(image_name, future):
+        # an image whose prediction failed has no result, the other images of the request are still returned
+        if future is None:
+            return None
+        try:
+            return future.result()
+        except Exception as err:
+            logging.getLogger(__name__).error('Image {} prediction failed: {}'.format(image_name, err))
+            return None
+
+    def process(self, request, context):
+        logger = logging.getLogger(__name__)
+        image_paths = get_request_image_paths(request.images_path)
+        if len(image_paths) == 0:
+            logger.info("Request path missing {}.".format(request.images_path))
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details("Path {} does not exist or has no images".format(request.images_path))
+            return proto_api.get_new_metadata_file()
+        return self.__get_response(lambda: self.predict_images(image_paths), context)
+
+    @staticmethod
+    def __decode(encoded_image):
+        # returns None for a corrupted image, like __submit
+        try:
+            return apollo_python_common.image.get_bgr_from_bytes(encoded_image.data, encoded_image.image_path)
+        except Exception:
+            logging.getLogger(__name__).warning('Image {} is corrupted'.format(encoded_image.image_path))
+            return None
+
+    def process_images(self, request, context):
+        # the images are decoded by the generator, one at a time, as they are submitted
+        images = ((encoded_image.image_path, self.__decode(encoded_image)) for encoded_image in request.images)
+        return self.__get_response(lambda: self.predict_decoded_images(images), context)
+
+    def process_shared_memory(self, request, context):
+        logger = logging.getLogger(__name__)
+        try:
+            segment = shared_memory.open_segment(request.segment_name)
+            images = [(frame.image_path, shared_memory.get_frame(segment, frame.offset, frame.width, frame.height))
+                      for frame in request.frames]
+        except (OSError, ValueError) as err:
+            logger.info("Invalid shared memory request {}: {}".format(request.segment_name, err))
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            context.set_details(str(err))
+            return proto_api.get_new_metadata_file()
+        return self.__get_response(lambda: self.predict_decoded_images(images), context)
+
+    def __get_response(self, predict, context):
+        try:
+            predictions = predict()
+        except Exception as err:
+            logging.getLogger(__name__).error(err, exc_info=True)
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(err))
+            return proto_api.get_new_metadata_file()
+        return get_preds_in_common_format(predictions, "retinanet", "")
+
+    def process_stream(self, request, context):
+        logger = logging.getLogger(__name__)
+        image_paths = get_request_image_paths(request.images_path)
+        if len(image_paths) == 0:
+            logger.info("Request path missing {}.".format(request.images_path))
+            context.set_code(grpc.StatusCode.NOT_FOUND)
+            context.set_details("Path {} does not exist or has no images".format(request.images_path))
+            return
+        group_size = max(request.group_size, 1)
+        group = dict()
+        try:
+            for image_index, (file_name, predictions) in enumerate(self.predict_images_in_order(image_paths)):
+                if not context.is_active():
+                    logger.info("Request {} cancelled after {} images.".format(request.images_path, image_index))
+                    return
+                # corrupted images have no result, the group keeps the index of the following images
+                if predictions is not None:
+                    group[file_name] = predictions
+                if (image_index + 1) % group_size == 0 or image_index + 1 == len(image_paths):
+                    result = inference_service_pb2.DetectionResult()
+                    result.first_image_index = image_index - image_index % group_size
+                    result.images.extend(get_preds_in_common_format(group, "retinanet", "").images)
+                    group = dict()
+                    yield result
+        except Exception as err:
+            logger.error(err, exc_info=True)
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(err))
+
+    def __str__(self):
+        return "{}; {}".format(self.batcher.statistics, self.batch_statistics)
+
+
+def serve(service, port, nr_threads):
+    logger = logging.getLogger(__name__)
+    service.start()
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=nr_threads),
+                         options=[('grpc.max_receive_message_length', MAX_MESSAGE_LENGTH)])
+    inference_service_pb2_grpc.add_InferenceServiceServicer_to_server(service, server)
+    server.add_insecure_port('[::]:{}'.format(port))
+    server.start()
+    logger.info('RetinaNet inference server listening on port {}'.format(port))
+    try:
+        while True:
+            time.sleep(STATISTICS_LOG_INTERVAL)
+            logger.info('Statistics: {}'.format(service))
+    except KeyboardInterrupt:
+        server.stop(0)
+        service.stop()
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='RetinaNet gRPC inference server.')
+    parser.add_argument('--weights_file', help='Model weights (.h5 or .pb).', type=str, required=True)
+    parser.add_argument('--train_meta_file', help='Metadata file used for training, for the class labels.',
+                        type=str, required=True)
+    parser.add_argument('--threshold_file', help='Threshold file to be used for minimum classes confidence.',
+                        type=str, default='SAME')
+    parser.add_argument('--lowest_score_threshold', help='Score threshold used when threshold_file is SAME.',
+                        type=float, default=0.5)
+    parser.add_argument('--multi_gpu', help='Number of GPUs to use for parallel processing.', type=int, default=1)
+    parser.add_argument('-p', '--port', type=int, default=PORT)
+    parser.add_argument('--nr_threads', help='Number of threads serving the requests.',
+                        type=int, default=NR_SERVER_THREADS)
+    parser.add_argument('--max_batch_size', help='Maximum number of images predicted in one model call.',
+                        type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument('--max_wait_ms', help='Maximum time a batch waits for images from other requests.',
+                        type=float, default=MAX_WAIT_MS)
+    parser.add_argument('--stream_window_size', help='Maximum number of images of a streamed request waiting for '
+                                                     'their prediction, by default two batches.',
+                        type=int, default=None)
+    return parser.parse_args(args)
+
+
+def main():
+    log_util.config(__file__)
+    logger = logging.getLogger(__name__)
+    args = parse_args(sys.argv[1:])
+    rois_labels = RoisLabels(args.train_meta_file)
+    if args.threshold_file == 'SAME':
+        score_threshold_per_class = dict([(class_label, args.lowest_score_threshold)
+                                          for class_label in rois_labels.classes.keys()])
+    else:
+        score_threshold_per_class = io_utils.json_load(args.threshold_file)
+    logger.info("Score thresholds: {}".format(score_threshold_per_class))
+    service = RetinaNetInferenceService(args, rois_labels, score_threshold_per_class, args.max_batch_size,
+                                        args.max_wait_ms, args.stream_window_size)
+    serve(service, args.port, args.nr_threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from queue import Queue, Empty
+
+MAX_BATCH_SIZE = 8
+MAX_WAIT_MS = 20
+
+# marks the end of the work in the queue
+_SENTINEL = None
+
+
+class MicroBatcherStatistics(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.nr_items = 0
+        self.nr_batches = 0
+        self.wait_time = 0.0
+        self.process_time = 0.0
+
+    def add(self, batch_size, wait_time, process_time):
+        with self.lock:
+            self.nr_items += batch_size
+            self.nr_batches += 1
+            self.wait_time += wait_time
+            self.process_time += process_time
+
+    def __str__(self):
+        with self.lock:
+            nr_batches = max(self.nr_batches, 1)
+            return "items = {} batches = {} mean batch size = {:.2f} mean batch wait = {:.1f} ms " \
+                   "mean batch process = {:.1f} ms".format(self.nr_items, self.nr_batches,
+                                                           self.nr_items / nr_batches,
+                                                           1000 * self.wait_time / nr_batches,
+                                                           1000 * self.process_time / nr_batches)
+
+
+class MicroBatcher(object):
+    '''
+    Groups the items submitted by concurrent callers in batches processed by one worker thread. A batch is processed
+    when it has max_batch_size items or when its first item waited max_wait_ms, so that a lone request is not
+    delayed more than max_wait_ms. When a batch fails its items are processed again one by one, so that an item
+    fails only the caller which submitted it.
+    '''
+
+    def __init__(self, process_batch, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, initializer=None):
+        '''
+        :param process_batch: function called in the worker thread with a list of items, it returns a list with one
+        result for each item
+        :param max_batch_size: maximum number of items in a batch
+        :param max_wait_ms: maximum time a batch waits for more items after receiving its first one
+        :param initializer: optional function called once in the worker thread before processing the first batch,
+        e.g. to load a model which has to be used by the thread which loaded it
+        '''
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.initializer = initializer
+        self.queue = Queue()
+        self.statistics = MicroBatcherStatistics()
+        self.ready = threading.Event()
+        self.initializer_error = None
+        self.worker = threading.Thread(target=self.__run, daemon=True)
+
+    def start(self):
+        '''
+        Starts the worker thread and waits for the initializer to finish
+        '''
+        self.worker.start()
+        self.ready.wait()
+        if self.initializer_error is not None:
+            raise self.initializer_error
+
+    def stop(self):
+        self.queue.put(_SENTINEL)
+        self.worker.join()
+
+    def submit(self, item):
+        '''
+        :return: concurrent.futures.Future with the result of the item
+        '''
+        future = Future()
+        self.queue.put((item, future))
+        return future
+
+    def __get_batch(self):
+        first = self.queue.get()
+        if first is _SENTINEL:
+            return None, 0
+        batch = [first]
+        start = time.time()
+        deadline = start + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                elem = self.queue.get(timeout=remaining)
+            except Empty:
+                break
+            if elem is _SENTINEL:
+                # the sentinel is put back, so that the worker stops after this batch
+                self.queue.put(_SENTINEL)
+                break
+            batch.append(elem)
+        return batch, time.time() - start
+
+    def __run(self):
+        logger = logging.getLogger(__name__)
+        try:
+            if self.initializer is not None:
+                self.initializer()
+        except Exception as err:
+            self.initializer_error = err
+            self.ready.set()
+            return
+        self.ready.set()
+        while True:
+            batch, wait_time = self.__get_batch()
+            if batch is None:
+                break
+            items = [item for item, _ in batch]
+            futures = [future for _, future in batch]
+            start = time.time()
+            try:
+                results = self.process_batch(items)
+            except Exception as err:
+                if len(items) == 1:
+                    logger.error("Item failed: {}".format(err), exc_info=True)
+                    futures[0].set_exception(err)
+                    continue
+                logger.warning("Batch of {} items failed, its items are processed one by one: {}".format(
+                    len(items), err))
+                results = None
+            if results is None:
+                self.__process_one_by_one(items, futures)
+                continue
+            self.statistics.add(len(batch), wait_time, time.time() - start)
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+    def __process_one_by_one(self, items, futures):
+        logger = logging.getLogger(__name__)
+        for item, future in zip(items, futures):
+            start = time.time()
+            try:
+                result = self.process_batch([item])[0]
+            except Exception as err:
+                logger.error("Item failed: {}".format(err), exc_info=True)
+                future.set_exception(err)
+                continue
+            self.statistics.add(1, 0.0, time.time() - start)
+            future.set_result(result)
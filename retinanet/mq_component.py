@@ -0,0 +1,108 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import argparse
+import logging
+import sys
+import threading
+
+import numpy as np
+
+import apollo_python_common.image
+import apollo_python_common.io_utils as io_utils
+import apollo_python_common.log_util as log_util
+import apollo_python_common.proto_api as proto_api
+from apollo_python_common.ml_pipeline.pipeline import PipelineComponent, run_pipeline
+from retinanet.predict import get_model_for_pred, RESOLUTIONS
+from retinanet.traffic_signs_generator import RoisLabels
+from retinanet.utils import preprocess_image, predict_images_on_batch, add_detections_to_img_proto, BatchStatistics
+from vanishing_point.vanishing_point import VanishingPointDetector
+
+ALGORITHM = "retinanet"
+
+
+class RetinaNetComponent(PipelineComponent):
+    '''
+    RetinaNet detection of the image of a serialized Image protobuf, the detections are added to the protobuf
+    '''
+
+    def __init__(self, config, rois_labels, score_threshold_per_class, resolutions=RESOLUTIONS):
+        '''
+        :param config: model configuration given to get_model_for_pred
+        '''
+        self.config = config
+        self.rois_labels = rois_labels
+        self.score_threshold_per_class = score_threshold_per_class
+        self.resolutions = resolutions
+        self.local = threading.local()
+
+    def init_predict_thread(self):
+        # the model is loaded by the thread which uses it, the tensorflow graph name depends on the thread
+        self.local.model = get_model_for_pred(self.config)
+        self.local.batch_statistics = BatchStatistics()
+
+    def __get_vp_detector(self):
+        # the detector keeps intermediate images as members, so each preprocess thread has its own
+        if not hasattr(self.local, 'vp_detector'):
+            self.local.vp_detector = VanishingPointDetector()
+        return self.local.vp_detector
+
+    def preprocess(self, envelope):
+        image_proto = proto_api.read_image_proto(envelope.body)
+        with envelope.step_timer("decode"):
+            image = apollo_python_common.image.get_bgr(image_proto.metadata.image_path)
+        vanishing_point, confidence = proto_api.get_vanishing_point(image_proto)
+        with envelope.step_timer("vp"):
+            image = preprocess_image(image, self.__get_vp_detector(),
+                                     (vanishing_point, confidence) if vanishing_point is not None else None)
+        return envelope.get_with_new_body((image_proto, image))
+
+    def predict(self, envelopes):
+        batch_statistics = self.local.batch_statistics
+        nms_time = batch_statistics.nms_time
+        predictions = predict_images_on_batch([envelope.body[1] for envelope in envelopes], self.local.model,
+                                              self.rois_labels, self.resolutions, self.score_threshold_per_class, 0,
+                                              batch_statistics)
+        nms_time = batch_statistics.nms_time - nms_time
+        predicted_envelopes = list()
+        for envelope, (boxes, scores, label_names) in zip(envelopes, predictions):
+            envelope.add_step_time("nms", nms_time)
+            image_proto = envelope.body[0]
+            boxes = np.clip(boxes, 1, sys.maxsize)
+            add_detections_to_img_proto(ALGORITHM, "", image_proto, boxes, scores, label_names, 0)
+            predicted_envelopes.append(envelope.get_with_new_body(image_proto))
+        return predicted_envelopes
+
+    def serialize(self, envelope):
+        return envelope.body.SerializeToString()
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='RetinaNet message queue pipeline.')
+    parser.add_argument('--config_file', help='Json file with the model settings (weights_file, train_meta_file, '
+                                              'threshold_file, lowest_score_threshold, multi_gpu) and the message '
+                                              'queue settings.', type=str, required=True)
+    return parser.parse_args(args)
+
+
+def main():
+    log_util.config(__file__)
+    logger = logging.getLogger(__name__)
+    args = parse_args(sys.argv[1:])
+    config = io_utils.json_load(args.config_file)
+    rois_labels = RoisLabels(config.train_meta_file)
+    if config.get('threshold_file', 'SAME') == 'SAME':
+        score_threshold_per_class = dict([(class_label, config.get('lowest_score_threshold', 0.5))
+                                          for class_label in rois_labels.classes.keys()])
+    else:
+        score_threshold_per_class = io_utils.json_load(config.threshold_file)
+    logger.info("Score thresholds: {}".format(score_threshold_per_class))
+    run_pipeline(RetinaNetComponent(config, rois_labels, score_threshold_per_class), args.config_file)
+
+
+if __name__ == '__main__':
+    main()
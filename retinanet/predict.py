@@ -21,7 +21,12 @@ import apollo_python_common.io_utils as io_utils
 import apollo_python_common.log_util as log_util
 import apollo_python_common.proto_api as meta
 from retinanet.traffic_signs_generator import RoisLabels
-from retinanet.utils import predict_folder, get_graph_name
+from retinanet.utils import predict_folder, get_graph_name, VP_DETECTOR
+from retinanet.folder_pipeline import predict_folder_pipelined, NR_POSTPROCESS_WORKERS, PREPROCESS_QUEUE_SIZE
+from retinanet.cascade import CascadePredictor, get_candidate_min_score
+from retinanet.tiling import TiledPredictor, TILE_SIZE, TILE_OVERLAP, TILE_BATCH_SIZE
+from retinanet.resolution_policy import AdaptiveResolutionPolicy, MIN_SIGN_SIZE, EMPTY_IMAGE_MAX_SCORE
+from vanishing_point.vp_tracker import VanishingPointTracker
 
 RESOLUTIONS = [800, 1920]
 
@@ -48,7 +53,80 @@ def __parse_args(args):
     parser.add_argument('--threshold_file',
                         help='Threshold file to be used for minimum classes confidence.',
                         type=str, default='SAME')
-    return parser.parse_args(args)
+    parser.add_argument('--batch_size',
+                        help='Number of images predicted in one model call. Images are grouped by aspect ratio.',
+                        type=int, default=1)
+    parser.add_argument('--nr_preprocess_workers',
+                        help='Number of threads reading and preprocessing images ahead of the model. '
+                             'With 0 the images are processed sequentially.',
+                        type=int, default=0)
+    parser.add_argument('--nr_postprocess_workers',
+                        help='Number of threads merging, drawing and writing predictions after the model.',
+                        type=int, default=NR_POSTPROCESS_WORKERS)
+    parser.add_argument('--queue_size',
+                        help='Maximum number of images waiting before and after the model.',
+                        type=int, default=PREPROCESS_QUEUE_SIZE)
+    parser.add_argument('--vp_redetect_interval',
+                        help='When greater than 0, the vanishing point of consecutive frames is reused and the full '
+                             'detection runs only every vp_redetect_interval frames. The images of the folder are '
+                             'tracked as one trip, so the folder should hold the frames of a single trip.',
+                        type=int, default=0)
+    parser.add_argument('--vp_file',
+                        help='Optional metadata file with precomputed vanishing points, '
+                             'see vanishing_point/precompute.py.',
+                        type=str, default=None)
+    parser.add_argument('--adaptive_resolutions',
+                        help='Choose the resolutions per image: skip the resolutions above the image size and the '
+                             'large ones not needed to detect min_sign_size signs.',
+                        action='store_true')
+    parser.add_argument('--min_sign_size',
+                        help='Smallest sign side, in original image pixels, kept detectable by the adaptive '
+                             'resolutions.',
+                        type=int, default=MIN_SIGN_SIZE)
+    parser.add_argument('--empty_image_max_score',
+                        help='The adaptive resolutions skip the larger resolutions of an image when no box found by '
+                             'the smaller ones scores above this value. A negative value runs them on all images.',
+                        type=float, default=EMPTY_IMAGE_MAX_SCORE)
+    image_predictor_group = parser.add_mutually_exclusive_group()
+    image_predictor_group.add_argument('--cascade',
+                                       help='Run the largest resolution only on crops around the candidates found by '
+                                            'the smallest one. The images are predicted one by one.',
+                                       action='store_true')
+    image_predictor_group.add_argument('--tiled',
+                                       help='Run the model at native resolution on overlapping tiles of the band '
+                                            'above the vanishing point. The images are predicted one by one.',
+                                       action='store_true')
+    parser.add_argument('--cascade_min_score',
+                        help='Minimum score of the coarse boxes refined by the cascade. By default it is half of the '
+                             'lowest class threshold.',
+                        type=float, default=None)
+    parser.add_argument('--tile_size', help='Tile side in pixels.', type=int, default=TILE_SIZE)
+    parser.add_argument('--tile_overlap', help='Overlap of neighbour tiles in pixels.', type=int, default=TILE_OVERLAP)
+    parser.add_argument('--tile_batch_size', help='Number of tiles predicted in one model call.',
+                        type=int, default=TILE_BATCH_SIZE)
+    args = parser.parse_args(args)
+    if args.nr_preprocess_workers < 0:
+        parser.error('--nr_preprocess_workers must be >= 0')
+    if args.nr_postprocess_workers < 1:
+        parser.error('--nr_postprocess_workers must be >= 1')
+    if args.queue_size < 1:
+        parser.error('--queue_size must be >= 1')
+    if args.batch_size < 1:
+        parser.error('--batch_size must be >= 1')
+    # the pipelined prediction runs the model on one image at a time, and its preprocess workers see the frames out
+    # of order, so they can not reuse the vanishing point of the previous frame
+    if args.nr_preprocess_workers > 0 and args.batch_size > 1:
+        parser.error('--batch_size is only supported with --nr_preprocess_workers 0')
+    if args.nr_preprocess_workers > 0 and args.vp_redetect_interval > 0:
+        parser.error('--vp_redetect_interval is only supported with --nr_preprocess_workers 0')
+    # the cascade and the tiles choose their own passes and predict the images one by one
+    if (args.cascade or args.tiled) and args.adaptive_resolutions:
+        parser.error('--adaptive_resolutions is not supported with --cascade or --tiled')
+    if (args.cascade or args.tiled) and args.batch_size > 1:
+        parser.error('--batch_size is not supported with --cascade or --tiled')
+    if args.cascade_min_score is not None and not args.cascade:
+        parser.error('--cascade_min_score is only supported with --cascade')
+    return args
 
 
 def __create_keras_model(gpu_options, multi_gpu, weights_file):
@@ -96,10 +174,28 @@ def get_model_for_pred(config):
 
 
 def predict_one_folder(input_images_path, output_images_path, rois_labels, model,
-                       score_threshold_per_class, out_rois_file_name='rois_retinanet'):
-    metadata = predict_folder(model, input_images_path, output_images_path,
-                              RESOLUTIONS, rois_labels, score_threshold_per_class,
-                              draw_predictions=True, log_level=0, max_number_of_images=None)
+                       score_threshold_per_class, out_rois_file_name='rois_retinanet', batch_size=1,
+                       nr_preprocess_workers=0, nr_postprocess_workers=NR_POSTPROCESS_WORKERS,
+                       queue_size=PREPROCESS_QUEUE_SIZE, vp_detector=VP_DETECTOR, vanishing_points=None,
+                       resolution_policy=None, image_predictor=None):
+    if nr_preprocess_workers > 0:
+        if batch_size > 1 or vp_detector is not VP_DETECTOR:
+            raise ValueError("The pipelined prediction supports neither a batch size nor a vanishing point detector")
+        metadata = predict_folder_pipelined(model, input_images_path, output_images_path,
+                                            RESOLUTIONS, rois_labels, score_threshold_per_class,
+                                            draw_predictions=True, max_number_of_images=None,
+                                            nr_preprocess_workers=nr_preprocess_workers,
+                                            nr_postprocess_workers=nr_postprocess_workers,
+                                            preprocess_queue_size=queue_size, postprocess_queue_size=queue_size,
+                                            vanishing_points=vanishing_points,
+                                            resolution_policy=resolution_policy,
+                                            image_predictor=image_predictor)
+    else:
+        metadata = predict_folder(model, input_images_path, output_images_path,
+                                  RESOLUTIONS, rois_labels, score_threshold_per_class,
+                                  draw_predictions=True, log_level=0, max_number_of_images=None,
+                                  batch_size=batch_size, vp_detector=vp_detector, vanishing_points=vanishing_points,
+                                  resolution_policy=resolution_policy, image_predictor=image_predictor)
     meta.serialize_metadata(metadata, output_images_path, out_rois_file_name)
 
 
@@ -118,8 +214,27 @@ def main():
 
     logger.info("Score thresholds: {}".format(score_threshold_per_class))
     model = get_model_for_pred(args)
+    vp_detector = VanishingPointTracker(redetect_interval=args.vp_redetect_interval) \
+        if args.vp_redetect_interval > 0 else VP_DETECTOR
+    vanishing_points = meta.create_vanishing_point_dictionary(meta.read_metadata(args.vp_file)) \
+        if args.vp_file is not None else None
+    resolution_policy = AdaptiveResolutionPolicy(
+        min_sign_size=args.min_sign_size,
+        empty_image_max_score=args.empty_image_max_score if args.empty_image_max_score >= 0 else None) \
+        if args.adaptive_resolutions else None
+    image_predictor = None
+    if args.cascade:
+        candidate_min_score = args.cascade_min_score if args.cascade_min_score is not None \
+            else get_candidate_min_score(score_threshold_per_class)
+        image_predictor = CascadePredictor(candidate_min_score)
+    elif args.tiled:
+        image_predictor = TiledPredictor(args.tile_size, args.tile_overlap, args.tile_batch_size)
     predict_one_folder(args.input_images_path, args.output_images_path, rois_labels, model,
-                       score_threshold_per_class)
+                       score_threshold_per_class, batch_size=args.batch_size,
+                       nr_preprocess_workers=args.nr_preprocess_workers,
+                       nr_postprocess_workers=args.nr_postprocess_workers, queue_size=args.queue_size,
+                       vp_detector=vp_detector, vanishing_points=vanishing_points,
+                       resolution_policy=resolution_policy, image_predictor=image_predictor)
 
 
 if __name__ == '__main__':
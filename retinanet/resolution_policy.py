@@ -0,0 +1,140 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import threading
+
+import numpy as np
+
+# smallest sign side, in original image pixels, we want to detect
+MIN_SIGN_SIZE = 25
+# smallest object side, in network input pixels, detected reliably (the smallest anchor is 32 pixels)
+MIN_DETECTABLE_SIZE = 24
+# boxes found by the passes already run with a score above this value can trigger a native resolution pass
+SMALL_BOX_MIN_SCORE = 0.3
+# when no box found by the passes already run scores above this value, the larger resolutions are skipped
+EMPTY_IMAGE_MAX_SCORE = 0.1
+
+
+class ResolutionPolicy(object):
+    '''
+    Decides which resolutions the model runs on for an image. The resolutions are requested one by one, so that
+    a policy can look at the predictions of the passes already run.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.nr_images = 0
+        self.nr_requested_passes = 0
+        self.nr_run_passes = 0
+
+    def next_resolution(self, resolutions, image_shape, done_resolutions, boxes, scores):
+        '''
+        :param resolutions: resolutions requested for the image
+        :param image_shape: shape of the image given to the model
+        :param done_resolutions: resolutions already run on the image
+        :param boxes: (N, 4) array with the boxes predicted by the passes already run, in image coordinates
+        :param scores: (N,) array with the scores of the boxes
+        :return: next resolution to run, or None when the image is done
+        '''
+        raise NotImplementedError()
+
+    def record(self, resolutions, done_resolutions):
+        with self.lock:
+            self.nr_images += 1
+            self.nr_requested_passes += len(resolutions)
+            self.nr_run_passes += len(done_resolutions)
+
+    def __str__(self):
+        return "images = {} requested passes = {} run passes = {} saved model invocations = {}".format(
+            self.nr_images, self.nr_requested_passes, self.nr_run_passes,
+            self.nr_requested_passes - self.nr_run_passes)
+
+
+class FixedResolutionPolicy(ResolutionPolicy):
+    '''
+    Runs all the requested resolutions, in the requested order
+    '''
+
+    def next_resolution(self, resolutions, image_shape, done_resolutions, boxes, scores):
+        if len(done_resolutions) < len(resolutions):
+            return resolutions[len(done_resolutions)]
+        return None
+
+
+class AdaptiveResolutionPolicy(ResolutionPolicy):
+    '''
+    Runs the requested resolutions from the smallest one and:
+        - clamps the resolutions which would upsample the image above max_upscale, running each clamped value once
+        - skips the larger resolutions when a smaller one already shows min_sign_size signs at min_detectable_size
+        - skips the larger resolutions when the passes run found no box scoring above empty_image_max_score, as the
+          images without any sign like object are the most frequent ones
+        - adds a native resolution pass when the passes run found confident boxes too small to be reliable
+    '''
+
+    def __init__(self, min_sign_size=MIN_SIGN_SIZE, min_detectable_size=MIN_DETECTABLE_SIZE, max_upscale=1.0,
+                 refine_small_boxes=True, small_box_min_score=SMALL_BOX_MIN_SCORE,
+                 empty_image_max_score=EMPTY_IMAGE_MAX_SCORE):
+        '''
+        :param empty_image_max_score: the larger resolutions are skipped when no box of the passes run scores above
+        it, None to run them on all images
+        '''
+        super().__init__()
+        self.min_sign_size = min_sign_size
+        self.min_detectable_size = min_detectable_size
+        self.max_upscale = max_upscale
+        self.refine_small_boxes = refine_small_boxes
+        self.small_box_min_score = small_box_min_score
+        self.empty_image_max_score = empty_image_max_score
+        self.nr_empty_images = 0
+
+    def get_planned_resolutions(self, resolutions, image_shape):
+        '''
+        Resolutions run on an image whatever its predictions. A resolution showing min_sign_size signs at
+        min_detectable_size already detects all the signs of interest, the larger ones would only add pixels; it
+        depends only on the image size, so it mostly applies to the small images
+        '''
+        long_side = max(image_shape[0], image_shape[1])
+        max_resolution = int(long_side * self.max_upscale)
+        planned = list()
+        for resolution in sorted(resolutions):
+            resolution = min(resolution, max_resolution)
+            if len(planned) > 0 and resolution == planned[-1]:
+                continue
+            if len(planned) > 0 and self.min_sign_size * planned[-1] / long_side >= self.min_detectable_size:
+                break
+            planned.append(resolution)
+        return planned
+
+    def __has_small_boxes(self, boxes, scores, scale):
+        confident_boxes = boxes[scores > self.small_box_min_score]
+        if len(confident_boxes) == 0:
+            return False
+        min_sides = np.minimum(confident_boxes[:, 2] - confident_boxes[:, 0],
+                               confident_boxes[:, 3] - confident_boxes[:, 1]) * scale
+        return bool(np.any(min_sides < self.min_detectable_size))
+
+    def __is_empty(self, scores):
+        return self.empty_image_max_score is not None and not np.any(scores > self.empty_image_max_score)
+
+    def next_resolution(self, resolutions, image_shape, done_resolutions, boxes, scores):
+        remaining = [resolution for resolution in self.get_planned_resolutions(resolutions, image_shape)
+                     if resolution not in done_resolutions]
+        if len(remaining) > 0 and len(done_resolutions) > 0 and self.__is_empty(scores):
+            with self.lock:
+                self.nr_empty_images += 1
+            return None
+        if len(remaining) > 0:
+            return remaining[0]
+        long_side = max(image_shape[0], image_shape[1])
+        native_resolution = int(long_side * self.max_upscale)
+        if self.refine_small_boxes and len(done_resolutions) > 0 and native_resolution > max(done_resolutions) and \
+                self.__has_small_boxes(boxes, scores, max(done_resolutions) / long_side):
+            return native_resolution
+        return None
+
+    def __str__(self):
+        return "{} empty images = {}".format(super().__str__(), self.nr_empty_images)
@@ -0,0 +1,117 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import threading
+
+import numpy as np
+
+import retinanet.image_pyramid as image_pyramid
+from retinanet.utils import get_predicted_detections
+
+TILE_SIZE = 800
+# signs smaller than the overlap are whole in the tile owning their center, larger ones may be seen cut by several
+# tiles and are merged by the non max suppression
+TILE_OVERLAP = 160
+TILE_BATCH_SIZE = 4
+
+
+def get_tile_starts(length, tile_size, overlap):
+    '''
+    :return: start positions of the tiles covering length, the last tile is aligned to the end
+    '''
+    if length <= tile_size:
+        return [0]
+    stride = tile_size - overlap
+    starts = list(range(0, length - tile_size, stride))
+    starts.append(length - tile_size)
+    return starts
+
+
+def get_tiles(image_shape, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    '''
+    Splits an image in overlapping tiles of the same size
+    :return: list of (x1, y1, x2, y2) tiles
+    '''
+    height, width = image_shape[0], image_shape[1]
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+            for y in get_tile_starts(height, tile_size, overlap)
+            for x in get_tile_starts(width, tile_size, overlap)]
+
+
+def get_tile_core(tile, image_shape, overlap):
+    '''
+    :return: part of the tile owning the box centers, the overlaps with the neighbour tiles are split in the middle
+    '''
+    x1, y1, x2, y2 = tile
+    half_overlap = overlap / 2
+    return (x1 + half_overlap if x1 > 0 else 0, y1 + half_overlap if y1 > 0 else 0,
+            x2 - half_overlap if x2 < image_shape[1] else image_shape[1],
+            y2 - half_overlap if y2 < image_shape[0] else image_shape[0])
+
+
+def get_tile_owned_boxes(boxes, tile, image_shape, overlap):
+    '''
+    Tile aware suppression: a tile keeps only the boxes centered in its core. The cores split the image, so a sign
+    seen whole by several tiles is kept once, and the parts of a sign cut by a tile border are kept by the tile owning
+    their center and merged with the other parts by the non max suppression
+    :param boxes: (N, 4) array with the boxes of the tile in image coordinates
+    :return: boolean mask of the kept boxes
+    '''
+    core_x1, core_y1, core_x2, core_y2 = get_tile_core(tile, image_shape, overlap)
+    centers_x = (boxes[:, 0] + boxes[:, 2]) / 2
+    centers_y = (boxes[:, 1] + boxes[:, 3]) / 2
+    return (centers_x >= core_x1) & (centers_x <= core_x2) & (centers_y >= core_y1) & (centers_y <= core_y2)
+
+
+class TiledPredictor(object):
+    '''
+    Runs the model at native resolution on overlapping fixed size tiles of the band above the vanishing point,
+    instead of resizing the band as a whole. Small distant signs are not downscaled and, as all tiles have the same
+    size, they are batched without padding. The detections are stitched by a tile aware suppression followed by the
+    usual non max suppression.
+    '''
+
+    def __init__(self, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, batch_size=TILE_BATCH_SIZE):
+        if overlap >= tile_size:
+            raise ValueError("The tile overlap {} should be smaller than the tile size {}".format(overlap, tile_size))
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.nr_images = 0
+        self.nr_tiles = 0
+        self.nr_model_invocations = 0
+
+    def predict_per_resolution(self, image, model, rois_labels, resolutions):
+        '''
+        Same as retinanet.utils.predict_one_image_per_resolution, the requested resolutions are not used
+        :return: lists of boxes, resolution tags, labels, scores and label names with one element per tile
+        '''
+        tiles = get_tiles(image.shape, self.tile_size, self.overlap)
+        all_boxes, all_resolutions, all_predicted_labels, all_scores, all_predicted_label_names = [], [], [], [], []
+        for batch_start in range(0, len(tiles), self.batch_size):
+            batch_tiles = tiles[batch_start:batch_start + self.batch_size]
+            images_for_pred, _ = image_pyramid.get_network_input_batch([image[y1:y2, x1:x2]
+                                                                       for x1, y1, x2, y2 in batch_tiles])
+            tiles_boxes, tiles_scores, tiles_labels = get_predicted_detections(model, images_for_pred)
+            for tile, boxes, scores, labels in zip(batch_tiles, tiles_boxes, tiles_scores, tiles_labels):
+                boxes = boxes + [tile[0], tile[1], tile[0], tile[1]]
+                keep = get_tile_owned_boxes(boxes, tile, image.shape, self.overlap)
+                all_boxes.append(boxes[keep])
+                all_resolutions.append(np.full(np.sum(keep), self.tile_size))
+                all_predicted_labels.append(labels[keep])
+                all_scores.append(scores[keep])
+                all_predicted_label_names.append([rois_labels.label_to_name(label) for label in labels[keep]])
+        with self.lock:
+            self.nr_images += 1
+            self.nr_tiles += len(tiles)
+            self.nr_model_invocations += (len(tiles) + self.batch_size - 1) // self.batch_size
+        return all_boxes, all_resolutions, all_predicted_labels, all_scores, all_predicted_label_names
+
+    def __str__(self):
+        return "images = {} tiles = {} tiles/image = {:.1f} model invocations = {}".format(
+            self.nr_images, self.nr_tiles, self.nr_tiles / max(self.nr_images, 1), self.nr_model_invocations)
@@ -0,0 +1,31 @@
+#!/usr/bin/env bash
+set -e
+CUDA_VISIBLE_DEVICES="0"
+WEIGHTS='/data/model/retinanet_resnet50_traffic_signs_v002.pb'
+TRAIN_META_FILE='/data/train_data/rois.bin'
+THRESHOLD_FILE="/data/model/classes_thresholds.json"
+LOWEST_SCORE_THRESHOLD="0.5"
+PORT="31338"
+MAX_BATCH_SIZE="8"
+MAX_WAIT_MS="20"
+
+echo 'Parameters:'
+echo 'CUDA_VISIBLE_DEVICES='$CUDA_VISIBLE_DEVICES
+echo 'WEIGHTS='$WEIGHTS
+echo 'TRAIN_META_FILE='$TRAIN_META_FILE
+echo 'THRESHOLD_FILE='$THRESHOLD_FILE
+echo 'PORT='$PORT
+echo 'MAX_BATCH_SIZE='$MAX_BATCH_SIZE
+echo 'MAX_WAIT_MS='$MAX_WAIT_MS
+echo '----------------------------------------'
+PYTHONPATH=../../:../../apollo_python_common/protobuf/:$PYTHONPATH
+export PYTHONPATH
+
+CUDA_VISIBLE_DEVICES=$CUDA_VISIBLE_DEVICES python -u ../inference_server.py \
+    --weights_file $WEIGHTS \
+    --train_meta_file $TRAIN_META_FILE \
+    --threshold_file $THRESHOLD_FILE \
+    --lowest_score_threshold $LOWEST_SCORE_THRESHOLD \
+    --port $PORT \
+    --max_batch_size $MAX_BATCH_SIZE \
+    --max_wait_ms $MAX_WAIT_MS
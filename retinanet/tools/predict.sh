@@ -7,6 +7,7 @@ INPUT_PATH='/data/test_data'
 THRESHOLD_FILE="/data/model/classes_thresholds.json"
 LOWEST_SCORE_THRESHOLD="0.5"
 OUTPUT_PATH='/data/output'
+BATCH_SIZE="1"
 
 echo 'Parameters:'
 echo 'CUDA_VISIBLE_DEVICES='$CUDA_VISIBLE_DEVICES
@@ -15,6 +16,7 @@ echo 'WEIGHTS='$WEIGHTS
 echo 'TRAIN_META_FILE='$TRAIN_META_FILE
 echo 'INPUT_PATH='$INPUT_PATH
 echo 'OUTPUT_PATH='$OUTPUT_PATH
+echo 'BATCH_SIZE='$BATCH_SIZE
 echo '----------------------------------------'
 PYTHONPATH=../../:../../apollo_python_common/protobuf/:$PYTHONPATH
 export PYTHONPATH
@@ -25,4 +27,5 @@ CUDA_VISIBLE_DEVICES=$CUDA_VISIBLE_DEVICES python -u ../predict.py \
     --output_images_path $OUTPUT_PATH \
     --train_meta_file $TRAIN_META_FILE \
     --lowest_score_threshold $LOWEST_SCORE_THRESHOLD \
-    --threshold_file $THRESHOLD_FILE
+    --threshold_file $THRESHOLD_FILE \
+    --batch_size $BATCH_SIZE
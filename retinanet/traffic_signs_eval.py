@@ -30,6 +30,8 @@ class TrafficSignsEval(keras.callbacks.Callback):
         self.logger = logging.getLogger(__name__)
         self.expected_metadata = meta.read_metadata(self.ground_truth_proto_file)
         self.expected_dict = meta.create_metadata_dictionary(self.expected_metadata, True)
+        # vanishing points precomputed in the ground truth file are reused at every evaluation
+        self.vanishing_points = meta.create_vanishing_point_dictionary(self.expected_metadata)
         self.roi_min_side_size = roi_min_side_size
         self.logger = logging.getLogger(__name__)
         super().__init__()
@@ -44,7 +46,7 @@ class TrafficSignsEval(keras.callbacks.Callback):
         actual_metadata = predict_folder(self.model, self.images_folder, None, resolutions, self.rois_labels,
                                          score_threshold_per_class,
                                          draw_predictions=False, max_number_of_images=self.max_number_of_images,
-                                         log_level=0)
+                                         log_level=0, vanishing_points=self.vanishing_points)
         actual_dict = meta.create_metadata_dictionary(actual_metadata, True)
         for file_name in list(self.expected_dict.keys()):
             if file_name not in actual_dict:
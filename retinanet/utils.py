@@ -11,20 +11,19 @@ import logging
 import cv2
 import numpy as np
 import time
-import itertools
 import traceback
 import math
 from tqdm import tqdm
 import threading
-import keras_retinanet.utils.image as retinanet_image
-from collections import OrderedDict
 from keras.models import Model as Keras_Model
 from tensorflow import Session as Tensorflow_Session
 
 import apollo_python_common.image
 from vanishing_point.vanishing_point import VanishingPointDetector
+from vanishing_point.vp_tracker import VanishingPointTracker
+from retinanet.resolution_policy import FixedResolutionPolicy
+import retinanet.image_pyramid as image_pyramid
 import apollo_python_common.io_utils as io_utils
-from apollo_python_common.rectangle import Rectangle
 import apollo_python_common.proto_api as meta
 
 RESOLUTIONS_COLORS = [(0, 0, 255), (255, 0, 0), (255,255,0), (0,255,255), (255,0,255)]
@@ -33,17 +32,45 @@ VP_CONFIDENCE_THRESHOLD = 0.2
 VP_SIGNIFICATIVE_Y_PERCENTAGE = 1.15
 MIN_SCORE_THRESHOLD = 0.05
 MAX_DETECTIONS=300
+BUCKET_WINDOW = 4
 
 
 def predict_folder(model, input_folder, output_folder, resolutions, rois_labels, score_threshold_per_class,
-                   algorithm="retinanet",draw_predictions=False, max_number_of_images=None, log_level=0):
+                   algorithm="retinanet",draw_predictions=False, max_number_of_images=None, log_level=0,
+                   batch_size=1, vp_detector=VP_DETECTOR, vanishing_points=None, resolution_policy=None,
+                   image_predictor=None):
+    '''
+    Predicts all images of a folder
+    :param vp_detector: vanishing point detector; a VanishingPointTracker is reset at the start of the folder and all
+    the images of the folder are tracked as one trip, as the folder images carry no trip id or image index, so a
+    folder should hold the frames of a single trip
+    :param vanishing_points: optional dictionary image base name -> (vanishing point, confidence) with precomputed
+    vanishing points, e.g. from proto_api.create_vanishing_point_dictionary; the other images use vp_detector
+    :param resolution_policy: optional ResolutionPolicy choosing the resolutions run for each image, by default all
+    the resolutions are run
+    :param image_predictor: optional object replacing predict_one_image_per_resolution, e.g. a CascadePredictor or a
+    TiledPredictor; it chooses its own passes and predicts the images one by one, so it can not be used with a
+    resolution policy or a batch size
+    :return: metadata with the predictions
+    '''
+    check_image_predictor(image_predictor, resolution_policy, batch_size)
+    if vanishing_points is None:
+        vanishing_points = dict()
+    if batch_size > 1 and image_predictor is None:
+        return predict_folder_in_batches(model, input_folder, output_folder, resolutions, rois_labels,
+                                         score_threshold_per_class, batch_size, algorithm, draw_predictions,
+                                         max_number_of_images, log_level, vp_detector=vp_detector,
+                                         vanishing_points=vanishing_points, resolution_policy=resolution_policy)
     logger = logging.getLogger(__name__)
     if log_level > 0:
         logger.info('Prediction on directory {} is starting.'.format(input_folder))
     if output_folder is not None and not os.path.isdir(output_folder):
         io_utils.create_folder(output_folder)
 
-    img_files_lst = io_utils.get_images_from_folder(input_folder)
+    # sorted, so that the frames of a trip are consecutive for a vanishing point tracker
+    img_files_lst = sorted(io_utils.get_images_from_folder(input_folder))
+    if isinstance(vp_detector, VanishingPointTracker):
+        vp_detector.reset()
     if max_number_of_images!=None:
         img_files_lst = img_files_lst[:max_number_of_images]
     all_predictions = dict()
@@ -53,43 +80,190 @@ def predict_folder(model, input_folder, output_folder, resolutions, rois_labels,
         try:
             image = apollo_python_common.image.get_bgr(file_name)
             if image is not None:
-                image, image_pred = preprocess_image(image)
-                merged_predictions, predictions_per_resolutions = predict_one_image(image_pred, model, rois_labels,
+                image = preprocess_image(image, vp_detector, vanishing_points.get(os.path.basename(file_name)))
+                merged_predictions, predictions_per_resolutions = predict_one_image(image, model, rois_labels,
                                                                                     resolutions, score_threshold_per_class,
-                                                                                    log_level)
+                                                                                    log_level, resolution_policy,
+                                                                                    image_predictor)
                 all_predictions[os.path.basename(file_name)] = merged_predictions
                 if draw_predictions:
-                    # Painting predictions
-                    paint_detections_to_image(image, merged_predictions, (0, 0, 255))
                     # # For debugging:
                     # for idx, prediction_per_resolution in enumerate(predictions_per_resolutions):
                     #     paint_detections_to_image(image, prediction_per_resolution, RESOLUTIONS_COLORS[idx])
-                    out_file_name = os.path.join(output_folder, os.path.basename(file_name))
-                    # Saving image with predicted boxes
-                    cv2.imwrite(out_file_name, image)
+                    save_image_with_predictions(image, merged_predictions, output_folder, file_name)
             else:
                 logger.warning('Image {} is corrupted'.format(file_name))
         except Exception as err:
             logger.error(err)
             print(traceback.format_exc())
+    if vp_detector is not VP_DETECTOR:
+        logger.info('Vanishing point: {}'.format(vp_detector))
+    if resolution_policy is not None:
+        logger.info('Resolution policy: {}'.format(resolution_policy))
+    if image_predictor is not None:
+        logger.info('Image predictor: {}'.format(image_predictor))
+
+    metadata = get_preds_in_common_format(all_predictions, algorithm, "")
+    return metadata
+
+
+def check_image_predictor(image_predictor, resolution_policy, batch_size=1):
+    '''
+    Raises a ValueError when an image predictor is given with options it would ignore
+    '''
+    if image_predictor is None:
+        return
+    if resolution_policy is not None:
+        raise ValueError("{} does not support a resolution policy".format(type(image_predictor).__name__))
+    if batch_size > 1:
+        raise ValueError("{} does not support a batch size".format(type(image_predictor).__name__))
+
+
+def predict_folder_in_batches(model, input_folder, output_folder, resolutions, rois_labels, score_threshold_per_class,
+                              batch_size, algorithm="retinanet", draw_predictions=False, max_number_of_images=None,
+                              log_level=0, bucket_window=BUCKET_WINDOW, vp_detector=VP_DETECTOR,
+                              vanishing_points=None, resolution_policy=None):
+    '''
+    Predicts a folder running the model on batches of images. The images of a window of bucket_window batches are
+    grouped by the aspect ratio of their VP cropped shape, so that the padding needed to stack a batch stays small.
+    As in predict_folder, a VanishingPointTracker tracks the images of the folder as one trip.
+    '''
+    logger = logging.getLogger(__name__)
+    if log_level > 0:
+        logger.info('Batched prediction on directory {} is starting.'.format(input_folder))
+    if output_folder is not None and not os.path.isdir(output_folder):
+        io_utils.create_folder(output_folder)
+
+    # sorted, so that the frames of a trip are consecutive for a vanishing point tracker
+    img_files_lst = sorted(io_utils.get_images_from_folder(input_folder))
+    if isinstance(vp_detector, VanishingPointTracker):
+        vp_detector.reset()
+    if max_number_of_images!=None:
+        img_files_lst = img_files_lst[:max_number_of_images]
+    all_predictions = dict()
+    batch_statistics = BatchStatistics()
+    start = time.time()
+    window_size = batch_size * bucket_window
+    for window_start in tqdm(range(0, len(img_files_lst), window_size)):
+        window_elems = load_preprocessed_images(img_files_lst[window_start:window_start + window_size], vp_detector,
+                                                vanishing_points)
+        buckets = get_aspect_ratio_buckets([image.shape for _, image in window_elems], batch_size)
+        for bucket in buckets:
+            bucket_elems = [window_elems[idx] for idx in bucket]
+            try:
+                batch_predictions = predict_images_on_batch([image for _, image in bucket_elems], model,
+                                                            rois_labels, resolutions, score_threshold_per_class,
+                                                            log_level, batch_statistics, resolution_policy)
+            except Exception as err:
+                logger.error(err)
+                print(traceback.format_exc())
+                continue
+            for (file_name, image), merged_predictions in zip(bucket_elems, batch_predictions):
+                all_predictions[os.path.basename(file_name)] = merged_predictions
+                if draw_predictions:
+                    save_image_with_predictions(image, merged_predictions, output_folder, file_name)
+    batch_statistics.total_time = time.time() - start
+    logger.info('Batched prediction on {}: {}'.format(input_folder, batch_statistics))
+    if vp_detector is not VP_DETECTOR:
+        logger.info('Vanishing point: {}'.format(vp_detector))
+    if resolution_policy is not None:
+        logger.info('Resolution policy: {}'.format(resolution_policy))
 
     metadata = get_preds_in_common_format(all_predictions, algorithm, "")
     return metadata
 
 
-def preprocess_image(image):
-    image_cropped = get_image_fc_VP(image)
-    image_pred = retinanet_image.preprocess_image(image_cropped)
-    return image_cropped, image_pred
+def load_preprocessed_images(file_names, vp_detector=VP_DETECTOR, vanishing_points=None):
+    '''
+    Reads and preprocesses images, skipping the ones that can not be read
+    :return: list of (file name, VP cropped image)
+    '''
+    logger = logging.getLogger(__name__)
+    if vanishing_points is None:
+        vanishing_points = dict()
+    elems = list()
+    for file_name in file_names:
+        try:
+            image = apollo_python_common.image.get_bgr(file_name)
+            image = preprocess_image(image, vp_detector, vanishing_points.get(os.path.basename(file_name)))
+            elems.append((file_name, image))
+        except Exception as err:
+            logger.warning('Image {} is corrupted: {}'.format(file_name, err))
+    return elems
+
+
+def get_aspect_ratio_buckets(image_shapes, batch_size):
+    '''
+    Groups images with similar aspect ratios in batches
+    :param image_shapes: list of image shapes
+    :param batch_size: maximum number of images in a batch
+    :return: list of batches, each batch is a list of indexes in image_shapes
+    '''
+    aspect_ratios = [shape[0] / shape[1] for shape in image_shapes]
+    sorted_indexes = sorted(range(len(image_shapes)), key=lambda idx: aspect_ratios[idx])
+    return [sorted_indexes[i:i + batch_size] for i in range(0, len(sorted_indexes), batch_size)]
+
+
+class BatchStatistics(object):
+    '''
+    Padding and throughput statistics for batched prediction
+    '''
+    def __init__(self):
+        self.nr_images = 0
+        self.nr_batches = 0
+        self.model_invocations = 0
+        self.image_pixels = 0
+        self.padded_pixels = 0
+        self.predict_time = 0
+        # part of the predict time spent merging the resolutions through non max suppression
+        self.nms_time = 0
+        self.total_time = 0
+
+    def padding_overhead(self):
+        total_pixels = self.image_pixels + self.padded_pixels
+        return self.padded_pixels / total_pixels if total_pixels > 0 else 0
+
+    def images_per_second(self):
+        return self.nr_images / self.total_time if self.total_time > 0 else 0
+
+    def predict_images_per_second(self):
+        return self.nr_images / self.predict_time if self.predict_time > 0 else 0
+
+    def __str__(self):
+        return "images = {} batches = {} model invocations = {} padding overhead = {:.2%} " \
+               "images/sec = {:.2f} predict images/sec = {:.2f}" \
+            .format(self.nr_images, self.nr_batches, self.model_invocations, self.padding_overhead(),
+                    self.images_per_second(), self.predict_images_per_second())
+
+
+def save_image_with_predictions(image, predictions, output_folder, file_name):
+    # Painting predictions
+    paint_detections_to_image(image, predictions, (0, 0, 255))
+    out_file_name = os.path.join(output_folder, os.path.basename(file_name))
+    # Saving image with predicted boxes
+    cv2.imwrite(out_file_name, image)
+
+
+def preprocess_image(image, vp_detector=VP_DETECTOR, vanishing_point=None):
+    '''
+    Crops the area above the vanishing point. The image stays uint8, it is converted to the float network input only
+    at the network input size, see retinanet.image_pyramid
+    '''
+    return get_image_fc_VP(image, vp_detector, vanishing_point)
 
 
-def get_image_fc_VP(image):
+def get_image_fc_VP(image, vp_detector=VP_DETECTOR, vanishing_point=None):
     '''
     Gets the area of interest where traffic signs are located in a image
     :param image: full image
+    :param vp_detector: vanishing point detector, it keeps state so each thread should use its own detector
+    :param vanishing_point: optional precomputed (vanishing point, confidence), when given the detector is not used
     :return: cropped image with the area above vanishing point
     '''
-    detected_vp, confidence = VP_DETECTOR.get_vanishing_point(image)
+    if vanishing_point is not None:
+        detected_vp, confidence = vanishing_point
+    else:
+        detected_vp, confidence = vp_detector.get_vanishing_point(image)
     if confidence > VP_CONFIDENCE_THRESHOLD:
         crop_y = math.floor(detected_vp.y * VP_SIGNIFICATIVE_Y_PERCENTAGE)
         new_image = image[:crop_y, :]
@@ -137,83 +311,132 @@ def get_predicted_detections(model, images_for_pred):
     return all_boxes, all_scores, all_labels
 
 
-def predict_images_on_batch(images, model, rois_labels, resolutions, score_threshold_per_class, log_level):
-    all_boxes, all_resolutions, all_predicted_labels, all_scores, all_predicted_label_names = \
-        OrderedDict(), OrderedDict(), OrderedDict(), OrderedDict(), OrderedDict()
-    final_predictions = list()
-    for resolution in resolutions:
-        scales = list()
-        images_for_pred = list()
-        for image_pred in images:
-            image_resized, scale = get_regular_sized_image(image_pred, max_image_shape=(resolution, resolution, 3))
-            scales.append(scale)
-            images_for_pred.append(np.expand_dims(image_resized, axis=0))
-        images_for_pred = np.vstack(images_for_pred)
-        all_images_boxes, all_images_scores, all_images_labels = get_predicted_detections(model, images_for_pred)
-        for i in range(len(images)):
-            boxes = all_images_boxes[i] / scales[i]
-            resolution = np.full(len(boxes), resolution)
-            predicted_labels = all_images_labels[i]
-            scores = all_images_scores[i]
-            predicted_label_names = [rois_labels.label_to_name(label) for label in predicted_labels]
-            all_boxes.setdefault(i, []).append(boxes)
-            all_resolutions.setdefault(i, []).append(resolution)
-            all_predicted_labels.setdefault(i, []).append(predicted_labels)
-            all_scores.setdefault(i, []).append(scores)
-            all_predicted_label_names.setdefault(i, []).append(predicted_label_names)
+def predict_images_on_batch(images, model, rois_labels, resolutions, score_threshold_per_class, log_level,
+                            batch_statistics=None, resolution_policy=None):
+    if resolution_policy is None:
+        resolution_policy = FixedResolutionPolicy()
+    all_boxes, all_resolutions, all_scores, all_predicted_label_names = \
+        [list() for _ in images], [list() for _ in images], [list() for _ in images], [list() for _ in images]
+    done_resolutions = [list() for _ in images]
+    start = time.time()
+    next_resolutions = [get_next_resolution(resolution_policy, resolutions, image.shape, [], [], [])
+                        for image in images]
+    pyramids = [dict() for _ in images]
+    while any([resolution is not None for resolution in next_resolutions]):
+        # images for which the policy asks the same resolution are predicted together
+        for resolution in sorted(set([resolution for resolution in next_resolutions if resolution is not None])):
+            indexes = [i for i, next_resolution in enumerate(next_resolutions) if next_resolution == resolution]
+            scales = list()
+            images_resized = list()
+            for i in indexes:
+                # only the resolutions chosen by the policy are resized
+                image_resized, scale = image_pyramid.add_level(pyramids[i], images[i], resolution)
+                scales.append(scale)
+                images_resized.append(image_resized)
+            images_for_pred, padded_pixels = image_pyramid.get_network_input_batch(images_resized)
+            all_images_boxes, all_images_scores, all_images_labels = get_predicted_detections(model, images_for_pred)
+            if batch_statistics is not None:
+                batch_statistics.model_invocations += 1
+                batch_statistics.padded_pixels += padded_pixels
+                batch_statistics.image_pixels += sum([image.shape[0] * image.shape[1] for image in images_resized])
+            for position, i in enumerate(indexes):
+                boxes = all_images_boxes[position] / scales[position]
+                all_boxes[i].append(boxes)
+                all_resolutions[i].append(np.full(len(boxes), resolution))
+                all_scores[i].append(all_images_scores[position])
+                all_predicted_label_names[i].append([rois_labels.label_to_name(label)
+                                                     for label in all_images_labels[position]])
+                done_resolutions[i].append(resolution)
+        next_resolutions = [get_next_resolution(resolution_policy, resolutions, images[i].shape, done_resolutions[i],
+                                                all_boxes[i], all_scores[i]) for i in range(len(images))]
 
+    final_predictions = list()
+    nms_start = time.time()
     for i in range(len(images)):
-        all_boxes_ar = np.concatenate(all_boxes[i])
-        all_resolutions_ar = np.hstack(all_resolutions[i])
-        all_predicted_labels_ar = np.concatenate(all_predicted_labels[i])
-        all_scores_ar = np.concatenate(all_scores[i])
-        all_predicted_label_names_ar = np.concatenate(all_predicted_label_names[i])
-        # Non_max_suppression
-        selected_indices = non_max_suppression(all_boxes_ar, all_scores_ar, all_resolutions_ar,
-                                               all_predicted_label_names_ar, score_threshold_per_class)
-        selected_boxes = all_boxes_ar[selected_indices]
-        selected_predicted_labels = all_predicted_labels_ar[selected_indices]
-        selected_scores = all_scores_ar[selected_indices]
-        selected_predicted_label_names = all_predicted_label_names_ar[selected_indices]
-        final_predictions.append((selected_boxes, selected_scores, selected_predicted_label_names))
+        resolution_policy.record(resolutions, done_resolutions[i])
+        final_predictions.append(merge_predictions(all_boxes[i], all_resolutions[i], all_scores[i],
+                                                   all_predicted_label_names[i], score_threshold_per_class))
+    if batch_statistics is not None:
+        batch_statistics.nms_time += time.time() - nms_start
+        batch_statistics.nr_images += len(images)
+        batch_statistics.nr_batches += 1
+        batch_statistics.predict_time += time.time() - start
     return final_predictions
 
 
-def predict_one_image(image_pred, model, rois_labels, resolutions, score_threshold_per_class, log_level):
+def get_next_resolution(resolution_policy, resolutions, image_shape, done_resolutions, all_boxes, all_scores):
+    boxes = np.concatenate(all_boxes) if len(all_boxes) > 0 else np.zeros((0, 4))
+    scores = np.concatenate(all_scores) if len(all_scores) > 0 else np.zeros(0)
+    return resolution_policy.next_resolution(resolutions, image_shape, done_resolutions, boxes, scores)
+
+
+def predict_one_image(image, model, rois_labels, resolutions, score_threshold_per_class, log_level,
+                      resolution_policy=None, image_predictor=None):
     logger = logging.getLogger(__name__)
     start = time.time()
-    all_boxes, all_resolutions, all_predicted_labels, all_scores, all_predicted_label_names = [], [], [], [], []
+    if image_predictor is not None:
+        all_boxes, all_resolutions, all_predicted_labels, all_scores, all_predicted_label_names = \
+            image_predictor.predict_per_resolution(image, model, rois_labels, resolutions)
+    else:
+        all_boxes, all_resolutions, all_predicted_labels, all_scores, all_predicted_label_names = \
+            predict_one_image_per_resolution(image, model, rois_labels, resolutions, resolution_policy)
+    if log_level > 0:
+        logger.info("processing time: {}".format(time.time() - start))
 
-    for resolution in resolutions:
-        image_resized, scale = get_regular_sized_image(image_pred, max_image_shape=(resolution, resolution, 3))
-        all_imgs_boxes, all_imgs_scores, all_imgs_labels = get_predicted_detections(model, np.expand_dims(image_resized, axis=0))
+    merged_predictions = merge_predictions(all_boxes, all_resolutions, all_scores, all_predicted_label_names,
+                                           score_threshold_per_class)
+    return merged_predictions, zip(all_boxes, all_scores, all_predicted_label_names)
+
+
+def predict_one_image_per_resolution(image, model, rois_labels, resolutions, resolution_policy=None):
+    '''
+    Runs the model on one uint8 image for every resolution chosen by the resolution policy
+    :return: lists of boxes, resolution tags, labels, scores and label names with one element per resolution
+    '''
+    if resolution_policy is None:
+        resolution_policy = FixedResolutionPolicy()
+    all_boxes, all_resolutions, all_predicted_labels, all_scores, all_predicted_label_names = [], [], [], [], []
+    done_resolutions = list()
+    resolution = get_next_resolution(resolution_policy, resolutions, image.shape, done_resolutions,
+                                     all_boxes, all_scores)
+    pyramid = dict()
+    while resolution is not None:
+        # only the resolutions chosen by the policy are resized
+        image_resized, scale = image_pyramid.add_level(pyramid, image, resolution)
+        image_for_pred = image_pyramid.get_network_input(image_resized)
+        all_imgs_boxes, all_imgs_scores, all_imgs_labels = get_predicted_detections(model, np.expand_dims(image_for_pred, axis=0))
         boxes, scores, predicted_labels = all_imgs_boxes[0], all_imgs_scores[0], all_imgs_labels[0]
         boxes = boxes / scale
-        resolution = np.full(len(boxes), resolution)
+        resolution_tags = np.full(len(boxes), resolution)
         predicted_label_names = [rois_labels.label_to_name(label) for label in predicted_labels]
         all_boxes.append(boxes)
-        all_resolutions.append(resolution)
+        all_resolutions.append(resolution_tags)
         all_predicted_labels.append(predicted_labels)
         all_scores.append(scores)
         all_predicted_label_names.append(predicted_label_names)
-    if log_level > 0:
-        logger.info("processing time: {}".format(time.time() - start))
+        done_resolutions.append(resolution)
+        resolution = get_next_resolution(resolution_policy, resolutions, image.shape, done_resolutions,
+                                         all_boxes, all_scores)
+    resolution_policy.record(resolutions, done_resolutions)
+    return all_boxes, all_resolutions, all_predicted_labels, all_scores, all_predicted_label_names
+
 
+def merge_predictions(all_boxes, all_resolutions, all_scores, all_predicted_label_names, score_threshold_per_class):
+    '''
+    Merges the predictions of all resolutions of an image through non max suppression
+    :return: selected boxes, scores and label names
+    '''
     all_boxes_ar = np.concatenate(all_boxes)
     all_resolutions_ar = np.hstack(all_resolutions)
-    all_predicted_labels_ar = np.concatenate(all_predicted_labels)
     all_scores_ar = np.concatenate(all_scores)
     all_predicted_label_names_ar = np.concatenate(all_predicted_label_names)
     # Non_max_suppression
     selected_indices = non_max_suppression(all_boxes_ar, all_scores_ar, all_resolutions_ar,
                                            all_predicted_label_names_ar, score_threshold_per_class)
     selected_boxes = all_boxes_ar[selected_indices]
-    selected_predicted_labels = all_predicted_labels_ar[selected_indices]
     selected_scores = all_scores_ar[selected_indices]
     selected_predicted_label_names = all_predicted_label_names_ar[selected_indices]
-
-    return (selected_boxes, selected_scores, selected_predicted_label_names), \
-           zip(all_boxes, all_scores, all_predicted_label_names)
+    return selected_boxes, selected_scores, selected_predicted_label_names
 
 
 def get_preds_in_common_format(all_predictions, algorithm, algorithm_version):
@@ -259,36 +482,56 @@ def add_roi_to_img_proto(image_proto, algorithm, algorithm_version, label_name,
 
 
 def non_max_suppression(boxes, scores, resolutions, predicted_label_names, score_threshold_per_class,
-                        iou_threshold=0.5):
+                        iou_threshold=0.5, cross_resolution_only=False):
+    '''
+    Greedy non max suppression over the detections of all resolutions. Boxes are visited in descending score order
+    and a box is dropped if the intersection covers more than iou_threshold of its area or of the area of an already
+    kept box (containment overlap).
+    :param boxes: (N, 4) array with x1, y1, x2, y2 coordinates
+    :param scores: (N,) array with the detection scores
+    :param resolutions: (N,) array with the resolution tag of the pass that produced each detection
+    :param predicted_label_names: (N,) array with the class names
+    :param score_threshold_per_class: dictionary class name -> minimum score
+    :param iou_threshold: overlap threshold, either a number or a dictionary class name -> overlap threshold
+    :param cross_resolution_only: if True a box can be suppressed only by a box coming from another resolution
+    :return: sorted list with the indexes of the selected boxes
+    '''
     # if there are no boxes, return an empty list
     if len(boxes) == 0:
         return []
 
-    # initialize the list of picked indexes
-    pick = set([i for i in range(len(boxes)) if scores[i] > score_threshold_per_class[predicted_label_names[i]]])
-    # grab the coordinates of the bounding boxes
-    x1 = boxes[:, 0]
-    y1 = boxes[:, 1]
-    x2 = boxes[:, 2]
-    y2 = boxes[:, 3]
-    should_continue = True
-    while should_continue:
-        should_continue = False
-        # NMS inter-models (inter-resolutions)
-        for (i1, i2) in itertools.combinations(list(range(0, len(boxes))), 2):
-            if i1 in pick and i2 in pick:
-                r1 = Rectangle(x1[i1], y1[i1], x2[i1], y2[i2])
-                r2 = Rectangle(x1[i2], y1[i2], x2[i2], y2[i2])
-                score1 = scores[i1]
-                score2 = scores[i2]
-                rect_intersect = r1.get_overlapped_rect(r2)
-                if rect_intersect.area() / r1.area() > iou_threshold or rect_intersect.area() / r2.area() > iou_threshold:
-                    exclude_idx = i1 if score1 < score2 else i2
-                    pick.remove(exclude_idx)
-                    should_continue = True
-    selected_indices = list(pick)
+    boxes = np.asarray(boxes, dtype=np.float64)
+    scores = np.asarray(scores, dtype=np.float64)
+    resolutions = np.asarray(resolutions)
+    class_score_thresholds = np.array([score_threshold_per_class[name] for name in predicted_label_names])
+    if isinstance(iou_threshold, dict):
+        overlap_thresholds = np.array([iou_threshold[name] for name in predicted_label_names], dtype=np.float64)
+    else:
+        overlap_thresholds = np.full(len(boxes), iou_threshold, dtype=np.float64)
+
+    candidates = np.where(scores > class_score_thresholds)[0]
+    # stable sort keeps the lowest index first when scores are equal
+    order = candidates[np.argsort(-scores[candidates], kind='mergesort')]
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+
+    pick = list()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        while order.size > 0:
+            current, order = order[0], order[1:]
+            pick.append(current)
+            if order.size == 0:
+                break
+            width = np.maximum(0, np.minimum(x2[current], x2[order]) - np.maximum(x1[current], x1[order]))
+            height = np.maximum(0, np.minimum(y2[current], y2[order]) - np.maximum(y1[current], y1[order]))
+            intersection = width * height
+            overlap = np.maximum(intersection / areas[current], intersection / areas[order])
+            suppressed = overlap > overlap_thresholds[current]
+            if cross_resolution_only:
+                suppressed &= resolutions[order] != resolutions[current]
+            order = order[~suppressed]
     # returning only the bounding boxes indexes that were picked
-    return selected_indices
+    return sorted(int(idx) for idx in pick)
 
 
 def paint_detections_to_image(image, predictions, color):
@@ -299,10 +542,3 @@ def paint_detections_to_image(image, predictions, color):
         caption = "{} {:.3f}".format(label, score)
         cv2.putText(image, caption, (b[0], b[1] - 10), cv2.FONT_HERSHEY_PLAIN, 1.5, (0, 0, 0), 3)
         cv2.putText(image, caption, (b[0], b[1] - 10), cv2.FONT_HERSHEY_PLAIN, 1.5, (255, 255, 255), 2)
-
-
-def get_regular_sized_image(img, max_image_shape):
-    size_factor = float(max([max_image_shape[0], max_image_shape[1]])) / \
-                  max([img.shape[0], img.shape[1]])
-    img = cv2.resize(img, None, fx=size_factor, fy=size_factor)
-    return img, size_factor
\ No newline at end of file
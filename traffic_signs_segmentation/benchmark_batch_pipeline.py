@@ -0,0 +1,150 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from multiprocessing.pool import ThreadPool
+from queue import Queue
+from threading import Thread, Event
+
+import cv2
+import numpy as np
+
+import apollo_python_common.log_util as log_util
+import batch
+import utils
+
+SLEEP_TIME = 0.01
+NET_WIDTH = 1600
+NET_HEIGHT = 1200
+
+
+class ResizeTransformer:
+    """
+    Stands for the caffe transformer of the segmentation network, so that the benchmark does not need caffe
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+    def preprocess(self, name, image):
+        return cv2.resize(image, (self.width, self.height)).astype(np.float32).transpose(2, 0, 1)
+
+
+class SleepHandler:
+    """
+    Stands for the batch handler, a batch takes forward_time seconds
+    """
+
+    def __init__(self, forward_time):
+        self.forward_time = forward_time
+        self.nr_images = 0
+
+    def __call__(self, image_batch):
+        time.sleep(self.forward_time)
+        self.nr_images += len(image_batch)
+
+
+def run_polling_pipeline(images_path, transformer, batch_size, batch_handler):
+    """
+    Previous pipeline, for reference: the processor polls the queue every SLEEP_TIME and stops on a flag set after
+    all the batches are read
+    """
+    batch_queue = Queue()
+    finished = Event()
+    image_reader = batch.ImageBatchReader(transformer)
+
+    def read():
+        images = utils.collect_images(images_path)
+        images_batches = [images[i:i + batch_size] for i in range(0, len(images), batch_size)]
+        pool = ThreadPool(batch.NUM_THREADS)
+        pool.map(lambda images_batch: batch_queue.put(image_reader(images_batch)), images_batches)
+        pool.close()
+        finished.set()
+
+    def process():
+        while True:
+            if not batch_queue.empty():
+                batch_handler(batch_queue.get())
+            else:
+                time.sleep(SLEEP_TIME)
+            if finished.is_set():
+                while not batch_queue.empty():
+                    batch_handler(batch_queue.get())
+                break
+
+    threads = [Thread(target=read), Thread(target=process)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_event_pipeline(images_path, transformer, batch_size, batch_handler):
+    batch_queue = batch.BatchQueue()
+    batch_reader = batch.BatchReader(images_path, transformer, batch_size, batch_queue)
+    batch_processor = batch.BatchProcessor(batch_handler, batch_queue)
+    batch_reader.start()
+    batch_processor.start()
+    batch_reader.join()
+    batch_processor.join()
+
+
+def make_small_folder(images, nr_images):
+    """
+    Returns a temporary folder with links to the first nr_images images
+    """
+    folder = tempfile.mkdtemp()
+    for image_path in images[:nr_images]:
+        os.symlink(os.path.abspath(image_path), os.path.join(folder, os.path.basename(image_path)))
+    return folder
+
+
+def benchmark(input_path, folder_sizes, batch_size, forward_time, nr_repetitions):
+    logger = logging.getLogger(__name__)
+    images = sorted(utils.collect_images(input_path))
+    transformer = ResizeTransformer(NET_WIDTH, NET_HEIGHT)
+    pipelines = [("polling", run_polling_pipeline), ("event", run_event_pipeline)]
+    for folder_size in folder_sizes:
+        folder = make_small_folder(images, folder_size)
+        try:
+            for name, run_pipeline in pipelines:
+                latencies = list()
+                for _ in range(nr_repetitions):
+                    batch_handler = SleepHandler(forward_time)
+                    start = time.time()
+                    run_pipeline(folder, transformer, batch_size, batch_handler)
+                    latencies.append(time.time() - start)
+                logger.info("{:7s} images = {:3d} latency mean = {:.1f} ms p95 = {:.1f} ms".format(
+                    name, batch_handler.nr_images, 1000 * np.mean(latencies), 1000 * np.percentile(latencies, 95)))
+        finally:
+            shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    log_util.config(__file__)
+    parser = argparse.ArgumentParser(description='Compares the end to end latency of the previous polling batch '
+                                                 'pipeline and of the event driven one on small folders.')
+    parser.add_argument(
+        "-i", "--input_path", type=str, required=True)
+    parser.add_argument(
+        "--folder_sizes", type=int, nargs='+', required=False, default=[1, 2, 4, 8, 16])
+    parser.add_argument(
+        "--batch_size", type=int, required=False, default=2)
+    parser.add_argument(
+        "--forward_ms", type=float, required=False, default=20, help="emulated forward pass time of a batch")
+    parser.add_argument(
+        "--nr_repetitions", type=int, required=False, default=20)
+    args = parser.parse_args()
+
+    benchmark(args.input_path, args.folder_sizes, args.batch_size, args.forward_ms / 1000.0, args.nr_repetitions)
@@ -0,0 +1,72 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import argparse
+import logging
+import sys
+import time
+
+import apollo_python_common.log_util as log_util
+import batch
+import network_setup
+import utils
+from inference_server import InferenceService, required_files, detect_batch, get_batch_rois, classify, \
+    classify_rois
+
+
+def benchmark(service, input_path, max_number_of_images):
+    """
+    Classifies the rois of each batch one by one and all at once, and logs the time of both
+    """
+    logger = logging.getLogger(__name__)
+    images = sorted(utils.collect_images(input_path))[:max_number_of_images]
+    batch_size = network_setup.get_batch_size(service.net_segm)
+    image_reader = batch.ImageBatchReader(service.transformer_segm)
+    total_rois, total_one_by_one_time, total_batched_time, nr_different = 0, 0.0, 0.0, 0
+    for start in range(0, len(images), batch_size):
+        image_batch = image_reader(images[start:start + batch_size])
+        net_output = service.scheduler.run(detect_batch, service.net_segm, image_batch)
+        _, _, rois = get_batch_rois(image_batch, net_output)
+
+        one_by_one_start = time.time()
+        one_by_one_class_ids = [service.scheduler.run(classify, service.net_class, service.transformer_class, roi)
+                                for roi in rois]
+        one_by_one_time = time.time() - one_by_one_start
+        batched_start = time.time()
+        batched_class_ids = classify_rois(service.scheduler, service.net_class, service.transformer_class, rois)
+        batched_time = time.time() - batched_start
+
+        nr_different += sum([one_by_one[0] != batched[0]
+                             for one_by_one, batched in zip(one_by_one_class_ids, batched_class_ids)])
+        total_rois += len(rois)
+        total_one_by_one_time += one_by_one_time
+        total_batched_time += batched_time
+        logger.info("batch {} rois = {} one by one = {:.1f} ms batched = {:.1f} ms".format(
+            start // batch_size, len(rois), 1000 * one_by_one_time, 1000 * batched_time))
+    logger.info("rois = {} one by one = {:.1f} ms batched = {:.1f} ms speedup = {:.2f} different classes = {}".format(
+        total_rois, 1000 * total_one_by_one_time, 1000 * total_batched_time,
+        total_one_by_one_time / max(total_batched_time, 1e-6), nr_different))
+
+
+if __name__ == "__main__":
+    log_util.config(__file__)
+    parser = argparse.ArgumentParser(description='Compares the classification of the rois one by one with the '
+                                                 'classification of all the rois of a batch at once.')
+    parser.add_argument(
+        "-i", "--input_path", type=str, required=True)
+    parser.add_argument(
+        "--max_number_of_images", type=int, required=False, default=100)
+    parser.add_argument(
+        "--cpu", action="store_true", help="run the networks in caffe CPU mode")
+    args = parser.parse_args()
+
+    logger = logging.getLogger(__name__)
+    if not utils.exists_paths(required_files + [args.input_path]):
+        logger.error("Paths missing {}".format(required_files + [args.input_path]))
+        sys.exit(-1)
+
+    benchmark(InferenceService(use_gpu=not args.cpu), args.input_path, args.max_number_of_images)
@@ -0,0 +1,105 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import argparse
+import logging
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import apollo_python_common.log_util as log_util
+import utils
+from inference_server import InferenceService, required_files
+
+
+def get_canonical_result(metadata):
+    """
+    Returns the images of a response sorted by path
+    :return: list of (image path, list of (roi rectangle, roi type))
+    """
+    return sorted([(image.metadata.image_path,
+                    [((roi.rect.tl.row, roi.rect.tl.col, roi.rect.br.row, roi.rect.br.col), roi.type)
+                     for roi in image.rois])
+                   for image in metadata.images])
+
+
+def get_nr_differences(expected, actual):
+    """
+    Compares two canonical results
+    :return: number of images or rectangles which differ, number of rois with the same rectangle and another type
+    """
+    if [image_path for image_path, _ in expected] != [image_path for image_path, _ in actual]:
+        return max(len(expected), len(actual)), 0
+    nr_differences, nr_type_differences = 0, 0
+    for (_, expected_rois), (_, actual_rois) in zip(expected, actual):
+        if [rect for rect, _ in expected_rois] != [rect for rect, _ in actual_rois]:
+            nr_differences += 1
+            continue
+        nr_type_differences += sum([expected_type != actual_type for (_, expected_type), (_, actual_type)
+                                    in zip(expected_rois, actual_rois)])
+    return nr_differences, nr_type_differences
+
+
+def check_concurrent_requests(service, input_paths, nr_requests_per_path):
+    """
+    Runs each folder alone, then all the folders at the same time, and compares the responses
+    :param service: InferenceService
+    :param input_paths: image folders, one request for each
+    :param nr_requests_per_path: number of concurrent requests with the same folder
+    :return: number of concurrent responses with other images or rectangles than the sequential response of their
+    folder
+    """
+    logger = logging.getLogger(__name__)
+    start = time.time()
+    expected = dict([(input_path, get_canonical_result(service.process(input_path))) for input_path in input_paths])
+    logger.info("Sequential requests {:.2f} s".format(time.time() - start))
+
+    requests = [input_path for input_path in input_paths for _ in range(nr_requests_per_path)]
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+        responses = list(executor.map(service.process, requests))
+    logger.info("Concurrent requests {:.2f} s".format(time.time() - start))
+    logger.info("Scheduler: {}".format(service.scheduler))
+
+    nr_mismatches = 0
+    for input_path, response in zip(requests, responses):
+        nr_differences, nr_type_differences = get_nr_differences(expected[input_path], get_canonical_result(response))
+        if nr_differences > 0:
+            logger.error("Concurrent response for {} differs from the sequential one in {} images".format(
+                input_path, nr_differences))
+            nr_mismatches += 1
+        if nr_type_differences > 0:
+            # the classification input is padded with random noise, so a few borderline rois can change their type
+            logger.warning("Concurrent response for {} has {} rois with another type".format(input_path,
+                                                                                          nr_type_differences))
+    return nr_mismatches
+
+
+if __name__ == "__main__":
+    log_util.config(__file__)
+    parser = argparse.ArgumentParser(description='Checks that concurrent requests get the same detections as '
+                                                 'sequential ones.')
+    parser.add_argument(
+        "-i", "--input_paths", type=str, nargs='+', required=True)
+    parser.add_argument(
+        "-n", "--nr_requests_per_path", type=int, required=False, default=2)
+    parser.add_argument(
+        "--cpu", action="store_true", help="run the networks in caffe CPU mode")
+    args = parser.parse_args()
+
+    logger = logging.getLogger(__name__)
+    if not utils.exists_paths(required_files + args.input_paths):
+        logger.error("Paths missing {}".format(required_files + args.input_paths))
+        sys.exit(-1)
+
+    nr_mismatches = check_concurrent_requests(InferenceService(use_gpu=not args.cpu), args.input_paths,
+                                              args.nr_requests_per_path)
+    if nr_mismatches > 0:
+        logger.error("{} concurrent responses differ".format(nr_mismatches))
+        sys.exit(-1)
+    logger.info("All concurrent responses match the sequential ones")
@@ -14,6 +14,7 @@ import time
 import sys
 
 from concurrent import futures
+from threading import Lock
 
 import orbb_metadata_pb2, orbb_definitions_pb2
 import apollo_python_common.proto_api as proto_api
@@ -35,6 +36,8 @@ CLASSIFICATION_PROTO_FILE = "./config/net_classification.prototxt"
 MEAN = "./config/mean.npy"
 SEGMENTATION_MODEL = "./config/segmmodel.caffemodel"
 MEAN_BLOB = "./config/mean.blob"
+# the classification input blob is reshaped to classify up to this many rois in one forward pass
+CLASSIFICATION_BATCH_SIZE = 32
 
 # Available on ftp
 required_files = [
@@ -52,7 +55,7 @@ class BatchHandler():
     def __init__(self, detector, classifier):
         """
         :param detector: lambda function that detects traffic signs
-        :param classifier: lambda function that classifies a traffic sign
+        :param classifier: lambda function that classifies a list of traffic signs
         """
         self.metadata = orbb_metadata_pb2.ImageSet()
         self.metadata.name = "caffe"
@@ -66,14 +69,7 @@ class BatchHandler():
         :param net_output: segmentation result
         :return:
         """
-        for i, elem in enumerate(image_batch):
-            # skip processing invalid images
-            if elem.image_data is None:
-                continue
-            mask = np.argmax(net_output[i], axis=0)
-            rects = image_operation.get_rects(mask)
-            rois = [image_operation.get_classification_roi(elem.image_data, r) for r in rects]
-            class_ids = list(map(self.classifier, rois))
+        for elem, rects, class_ids in get_batch_detections(image_batch, net_output, self.classifier):
             image = self.metadata.images.add()
             image.metadata.image_path = os.path.basename(elem.image_path)
             image.metadata.region = ""
@@ -100,7 +96,118 @@ class BatchHandler():
         return self.metadata
 
 
-# TODO: classify all rois at once
+class NetScheduler:
+    """
+    Serializes the forward passes of the requests running at the same time, the networks and their blobs are shared
+    by all the requests, while the image reading and the conversion of the results run in parallel
+    """
+
+    def __init__(self, use_gpu=True):
+        self.use_gpu = use_gpu
+        self.lock = Lock()
+        self.statistics_lock = Lock()
+        self.nr_forward_passes = 0
+        self.wait_time = 0.0
+        self.forward_time = 0.0
+
+    def run(self, forward, *args):
+        """
+        Runs a forward pass function when no other forward pass is running
+        :param forward: function filling the input blob of a network and running its forward pass, its result must not
+        reference the network blobs, as they are overwritten by the next forward pass
+        :return: result of the forward function
+        """
+        start = time.time()
+        with self.lock:
+            forward_start = time.time()
+            # caffe keeps the mode per thread
+            if self.use_gpu:
+                caffe.set_mode_gpu()
+            else:
+                caffe.set_mode_cpu()
+            result = forward(*args)
+            forward_end = time.time()
+        with self.statistics_lock:
+            self.nr_forward_passes += 1
+            self.wait_time += forward_start - start
+            self.forward_time += forward_end - forward_start
+        return result
+
+    def __str__(self):
+        with self.statistics_lock:
+            nr_forward_passes = max(self.nr_forward_passes, 1)
+            return "forward passes = {} mean wait = {:.1f} ms mean forward = {:.1f} ms".format(
+                self.nr_forward_passes, 1000 * self.wait_time / nr_forward_passes,
+                1000 * self.forward_time / nr_forward_passes)
+
+
+def get_batch_rois(image_batch, net_output):
+    """
+    Finds the traffic signs of the valid images of a batch
+    :param image_batch: batch of images
+    :param net_output: segmentation result
+    :return: valid batch elements, rectangles of each valid element, classification rois of all the rectangles
+    """
+    valid_elems, rects_per_elem, rois = [], [], []
+    for i, elem in enumerate(image_batch):
+        # skip processing invalid images
+        if elem.image_data is None:
+            continue
+        mask = np.argmax(net_output[i], axis=0)
+        rects = image_operation.get_rects(mask)
+        valid_elems.append(elem)
+        rects_per_elem.append(rects)
+        rois.extend([image_operation.get_classification_roi(elem.image_data, r) for r in rects])
+    return valid_elems, rects_per_elem, rois
+
+
+def get_batch_detections(image_batch, net_output, classifier):
+    """
+    Finds and classifies the traffic signs of the valid images of a batch
+    :param image_batch: batch of images
+    :param net_output: segmentation result
+    :param classifier: lambda function that classifies a list of traffic signs
+    :return: list of (batch element, rectangles, class ids) for the valid images
+    """
+    valid_elems, rects_per_elem, rois = get_batch_rois(image_batch, net_output)
+    # the rois of all the images of the batch are classified together
+    all_class_ids = classifier(rois)
+    detections = []
+    start = 0
+    for elem, rects in zip(valid_elems, rects_per_elem):
+        detections.append((elem, rects, all_class_ids[start:start + len(rects)]))
+        start += len(rects)
+    return detections
+
+
+def preprocess_rois(net, transformer, rois):
+    """
+    Transforms the rois in the classification network input
+    :param net: Classification network
+    :param transformer: Classification network transformer
+    :param rois: list of traffic sign regions of interest
+    :return: array with one network input for each roi
+    """
+    return np.array([transformer.preprocess(net.inputs[0], roi) for roi in rois], dtype=np.float32)
+
+
+def classify_batch(net, rois_data):
+    """
+    Classification network forward pass for several rois, the input blob is reshaped when their number changes
+    :param net: Classification network
+    :param rois_data: array with the network input of the rois, see preprocess_rois
+    :return: list of [class id, confidence score], one for each roi
+    """
+    input_blob = net.blobs[net.inputs[0]]
+    if input_blob.data.shape[0] != len(rois_data):
+        input_blob.reshape(len(rois_data), *input_blob.data.shape[1:])
+        net.reshape()
+    input_blob.data[...] = rois_data
+    results_array = net.forward()[net.outputs[0]].reshape(len(rois_data), -1)
+    best_class_ids = results_array.argmax(axis=1)
+    return [[best_class_id, results_array[i, best_class_id]] for i, best_class_id in enumerate(best_class_ids)]
+
+
 def classify(net, transformer, roi):
     """
     Classification network forward pass
@@ -109,12 +216,21 @@ def classify(net, transformer, roi):
     :param roi: Traffic sign region of interest
     :return: class id, confidence score
     """
-    caffe.set_mode_gpu()
-    net.blobs[net.inputs[0]].data[...] = transformer.preprocess(net.inputs[0], roi)
-    results_array = net.forward()[net.outputs[0]][0]
-    best_class_id = results_array.argmax()
-    best_score = results_array[best_class_id]
-    return [best_class_id, best_score]
+    return classify_batch(net, preprocess_rois(net, transformer, [roi]))[0]
+
+
+def classify_rois(scheduler, net, transformer, rois):
+    """
+    Classifies rois in forward passes of at most CLASSIFICATION_BATCH_SIZE rois, the rois are preprocessed outside the
+    scheduler, so that the other requests can use the networks meanwhile
+    :param scheduler: NetScheduler running the forward passes
+    :return: list of [class id, confidence score], one for each roi
+    """
+    rois_data = preprocess_rois(net, transformer, rois)
+    class_ids = []
+    for start in range(0, len(rois_data), CLASSIFICATION_BATCH_SIZE):
+        class_ids.extend(scheduler.run(classify_batch, net, rois_data[start:start + CLASSIFICATION_BATCH_SIZE]))
+    return class_ids
 
 def detect_batch(net, current_batch):
     """
@@ -123,12 +239,12 @@ def detect_batch(net, current_batch):
     :param current_batch: image batch
     :return: segmentation output
     """
-    caffe.set_mode_gpu()
     for i, elem in enumerate(current_batch):
         # skip processing invalid images
         if elem.image_data is not None:
             net.blobs[net.inputs[0]].data[i] = elem.image_data
-    return net.forward()[net.outputs[0]]
+    # the output blob is overwritten by the next forward pass, which can belong to another request
+    return net.forward()[net.outputs[0]].copy()
 
 
 def add_detections(image, rects, class_ids):
@@ -184,10 +300,10 @@ def transform_detections(rois, transformer, shape):
 
 class InferenceService:
     """
-    Inference Service class
+    Inference Service class, it can process several requests at the same time
     """
 
-    def __init__(self):
+    def __init__(self, use_gpu=True):
         self.net_segm, self.transformer_segm = network_setup.make_network(
             SEGMENTATION_PROTO_FILE,
             SEGMENTATION_MODEL,
@@ -197,6 +313,7 @@ class InferenceService:
             CLASSIFICATION_MODEL,
             MEAN)
         network_setup.convert_mean(MEAN_BLOB, MEAN)
+        self.scheduler = NetScheduler(use_gpu)
 
     def process(self, images_path):
         """
@@ -209,20 +326,28 @@ class InferenceService:
             logger.info("Request path missing {}.".format(images_path))
             return None
         
-        classifier = lambda x: classify(
-            self.net_class, self.transformer_class, x)
-        detector = lambda x: detect_batch(self.net_segm, x)
+        classifier = lambda x: classify_rois(
+            self.scheduler, self.net_class, self.transformer_class, x)
+        detector = lambda x: self.scheduler.run(detect_batch, self.net_segm, x)
 
+        # the reader, the processor and their queue belong to this request
+        batch_queue = batch.BatchQueue()
         batch_reader = batch.BatchReader(
             images_path,
             self.transformer_segm,
-            network_setup.get_batch_size(self.net_segm))
+            network_setup.get_batch_size(self.net_segm),
+            batch_queue)
         batch_handler = BatchHandler(detector, classifier)
-        batch_processor = batch.BatchProcessor(batch_handler)
+        batch_processor = batch.BatchProcessor(batch_handler, batch_queue)
         batch_reader.start()
         batch_processor.start()
         batch_reader.join()
         batch_processor.join()
+        logger.debug("Request {} maximum batches being read {} maximum batches queued {}".format(
+            images_path, batch_reader.max_nr_pending_reads, batch_queue.max_depth))
+        for error in [batch_reader.error, batch_processor.error]:
+            if error is not None:
+                raise error
         return batch_handler.get_result()
 
 if __name__ == "__main__":
@@ -0,0 +1,85 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import argparse
+import logging
+import sys
+import time
+
+import apollo_python_common.log_util as log_util
+import apollo_python_common.proto_api as proto_api
+from apollo_python_common.ml_pipeline.pipeline import PipelineComponent, run_pipeline
+import batch
+import network_setup
+import utils
+from inference_server import InferenceService, required_files, detect_batch, get_batch_detections, classify_rois, \
+    add_detections, transform_detections
+
+
+class SegmentationComponent(PipelineComponent):
+    """
+    Segmentation and classification of the image of a serialized Image protobuf, the detections are added to the
+    protobuf
+    """
+
+    def __init__(self, service):
+        """
+        :param service: InferenceService with the networks and their scheduler
+        """
+        self.service = service
+        self.image_reader = batch.ImageBatchReader(service.transformer_segm)
+        self.segmentation_batch_size = network_setup.get_batch_size(service.net_segm)
+
+    def preprocess(self, envelope):
+        image_proto = proto_api.read_image_proto(envelope.body)
+        with envelope.step_timer("decode"):
+            elem = self.image_reader([image_proto.metadata.image_path])[0]
+        return envelope.get_with_new_body((image_proto, elem))
+
+    def predict(self, envelopes):
+        classifier = lambda x: classify_rois(
+            self.service.scheduler, self.service.net_class, self.service.transformer_class, x)
+        # several messages can have the same image path, so the batch elements are matched by identity
+        image_protos = dict([(id(envelope.body[1]), envelope.body[0]) for envelope in envelopes])
+        # the segmentation batch size is fixed by the network
+        for start_index in range(0, len(envelopes), self.segmentation_batch_size):
+            image_batch = [envelope.body[1]
+                           for envelope in envelopes[start_index:start_index + self.segmentation_batch_size]]
+            start = time.monotonic()
+            net_output = self.service.scheduler.run(detect_batch, self.service.net_segm, image_batch)
+            segmentation_time = time.monotonic() - start
+            start = time.monotonic()
+            detections = get_batch_detections(image_batch, net_output, classifier)
+            classification_time = time.monotonic() - start
+            for envelope in envelopes[start_index:start_index + self.segmentation_batch_size]:
+                envelope.add_step_time("segmentation", segmentation_time)
+                envelope.add_step_time("classification", classification_time)
+            for elem, rects, class_ids in detections:
+                image_proto = image_protos[id(elem)]
+                add_detections(image_proto, rects, class_ids)
+                transform_detections(image_proto.rois, elem.scale_factors, elem.image_data.shape)
+        return [envelope.get_with_new_body(envelope.body[0]) for envelope in envelopes]
+
+    def serialize(self, envelope):
+        return envelope.body.SerializeToString()
+
+
+if __name__ == "__main__":
+    log_util.config(__file__)
+    parser = argparse.ArgumentParser(description='Traffic signs segmentation message queue pipeline.')
+    parser.add_argument(
+        "--config_file", type=str, required=True, help="json file with the message queue settings")
+    parser.add_argument(
+        "--cpu", action="store_true", help="run the networks in caffe CPU mode")
+    args = parser.parse_args()
+
+    logger = logging.getLogger(__name__)
+    if not utils.exists_paths(required_files + [args.config_file]):
+        logger.error("Paths missing {}".format(required_files + [args.config_file]))
+        sys.exit(-1)
+
+    run_pipeline(SegmentationComponent(InferenceService(use_gpu=not args.cpu)), args.config_file)
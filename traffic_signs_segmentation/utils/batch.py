@@ -5,10 +5,9 @@ This Source Code Form is subject to the terms of the Mozilla Public
 License, v. 2.0. If a copy of the MPL was not distributed with this
 file, You can obtain one at http://mozilla.org/MPL/2.0/.
 """
-from collections import namedtuple
+from collections import deque, namedtuple
 from queue import Queue
 from threading import Thread, Lock
-from time import sleep
 
 from multiprocessing.pool import ThreadPool
 
@@ -21,16 +20,50 @@ BatchElem = namedtuple('Batch', ['image_path', 'scale_factors', 'image_data'])
 ImageTransformation = namedtuple(
     'ImageTransformation', ['scale_rows', 'scale_cols', 'width_crop_size'])
 
-__BatchQueue__ = Queue(maxsize=16)
-__FinishBatch__ = False
-__FinishBatchLock__ = Lock()
-
-SLEEP_TIME=0.01
 NUM_THREADS=8
+QUEUE_SIZE=16
+# batches read in advance by the reading threads, waiting for their turn to be queued
+MAX_PENDING_READS=2 * NUM_THREADS
+
+# marks the end of the batches in the queue
+_SENTINEL = None
 
 conf = configuration.load_configuration()
 
-# TODO: it would probably be faster if the image reading would be parallelized 
+class BatchQueue:
+    """
+    Bounded queue of the batches read for one request, it keeps its maximum depth
+    """
+
+    def __init__(self, maxsize=QUEUE_SIZE):
+        self.queue = Queue(maxsize=maxsize)
+        self.max_depth = 0
+        self.depth_lock = Lock()
+
+    def put(self, batch):
+        """
+        Adds a batch, waiting while the queue is full
+        """
+        self.queue.put(batch)
+        with self.depth_lock:
+            self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def finish(self):
+        """
+        Marks that no other batch follows
+        """
+        self.queue.put(_SENTINEL)
+
+    def get(self):
+        """
+        Returns the next batch, or None when all the batches were returned
+        """
+        return self.queue.get()
+
+    def depth(self):
+        return self.queue.qsize()
+
+
 class ImageBatchReader:
     """
     Image reader class transforms the images in the shape required by the networks
@@ -65,63 +98,85 @@ class ImageBatchReader:
             scale_cols = cropped_image.shape[1] / (transformed_image.shape[2] * 1.0)
             image_transformation = ImageTransformation(scale_rows, scale_cols, width_crop_size)
             batch.append(BatchElem(image_path, image_transformation, transformed_image))
-        __BatchQueue__.put(batch)
+        return batch
 
 
 class BatchReader(Thread):
     """
-    Subclass of Thread, specialized in reading batches of images
+    Subclass of Thread, specialized in reading batches of images. The batches are read in parallel and queued in the
+    order of the images.
     """
 
-    def __init__(self, input_path, transformer, batch_size):
+    def __init__(self, input_path, transformer, batch_size, batch_queue, max_pending_reads=MAX_PENDING_READS):
         Thread.__init__(self)
         self.input_path = input_path
         self.transformer = transformer
         self.batch_size = batch_size
-        self.pool = ThreadPool(NUM_THREADS)
+        self.batch_queue = batch_queue
+        self.max_pending_reads = max_pending_reads
+        self.pending_reads = deque()
+        self.max_nr_pending_reads = 0
+        self.error = None
 
-    def run(self):
-        images = utils.collect_images(self.input_path)
-        images_batches = [images[i:i + self.batch_size]
-                          for i in range(0, len(images), self.batch_size)]
+    def __queue_oldest_read(self):
+        self.batch_queue.put(self.pending_reads.popleft().get())
 
-        image_reader = ImageBatchReader(self.transformer)
-        self.pool.map(image_reader, images_batches)
-        with __FinishBatchLock__:
-            global __FinishBatch__
-            __FinishBatch__ = True
+    def run(self):
+        # each request has its own pool, which is released when all its images are read
+        pool = ThreadPool(NUM_THREADS)
+        try:
+            images = sorted(utils.collect_images(self.input_path))
+            images_batches = [images[i:i + self.batch_size]
+                              for i in range(0, len(images), self.batch_size)]
+            image_reader = ImageBatchReader(self.transformer)
+            for images_batch in images_batches:
+                # waits for the oldest batch, and for room in the queue, before reading more batches
+                if len(self.pending_reads) >= self.max_pending_reads:
+                    self.__queue_oldest_read()
+                self.pending_reads.append(pool.apply_async(image_reader, (images_batch,)))
+                self.max_nr_pending_reads = max(self.max_nr_pending_reads, len(self.pending_reads))
+            while len(self.pending_reads) > 0:
+                self.__queue_oldest_read()
+        except Exception as err:
+            logging.getLogger(__name__).error(err, exc_info=True)
+            self.error = err
+        finally:
+            self.batch_queue.finish()
+            pool.close()
+            pool.join()
 
         return
 
+    def get_queue_depths(self):
+        """
+        Returns the number of batches in each stage of the pipeline: being read and waiting to be processed
+        """
+        return {"reading": len(self.pending_reads), "queued": self.batch_queue.depth()}
+
 
 class BatchProcessor(Thread):
     """
     Subclass of Thread specialized in processing batches of images
     """
 
-    def __init__(self, batch_handler):
+    def __init__(self, batch_handler, batch_queue):
         Thread.__init__(self)
         self.batch_handler = batch_handler
-
-    def __del__(self):
-        global __FinishBatch__
-        __FinishBatch__ = False
-
-    def __do_work(self):
-        batch = __BatchQueue__.get()
-        self.batch_handler(batch)
-        __BatchQueue__.task_done()
+        self.batch_queue = batch_queue
+        self.error = None
 
     def run(self):
         while True:
-            if not __BatchQueue__.empty():
-                self.__do_work()
-            else:
-                sleep(SLEEP_TIME)
-            with __FinishBatchLock__:
-                if __FinishBatch__:
-                    while not __BatchQueue__.empty():
-                        self.__do_work()
-                    break
+            batch = self.batch_queue.get()
+            if batch is _SENTINEL:
+                break
+            # after an error the remaining batches are consumed, so that the reader does not wait for room
+            if self.error is not None:
+                continue
+            try:
+                self.batch_handler(batch)
+            except Exception as err:
+                logging.getLogger(__name__).error(err, exc_info=True)
+                self.error = err
 
         return
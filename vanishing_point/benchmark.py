@@ -0,0 +1,129 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import argparse
+import logging
+import sys
+import time
+
+import numpy as np
+from sklearn.cluster import DBSCAN
+
+import apollo_python_common.io_utils as io_utils
+import apollo_python_common.image
+import apollo_python_common.log_util as log_util
+from apollo_python_common.geometry.line_segment import LineSegment
+from apollo_python_common.lightweight_types import Point
+from vanishing_point.vanishing_point import VanishingPointDetector, DBSCAN_CLUSTERING, GRID_CLUSTERING
+
+PIXEL_TOLERANCE = 1
+REGION_WIDTH = 640
+REGION_HEIGHT = 240
+
+
+def pairwise_best_solution(lines, region_width, angle_threshold=VanishingPointDetector.ANGLE_THRESHOLD):
+    '''
+    Previous implementation looping over all line pairs, kept as reference for timing and agreement
+    '''
+    segments = [LineSegment(Point(x1, y1), Point(x2, y2)) for x1, y1, x2, y2 in lines]
+    intersections = []
+    for i in range(len(segments) - 1):
+        for j in range(i + 1, len(segments)):
+            if not segments[i].is_parallel_with_line(segments[j], angle_threshold):
+                intersection = segments[i].get_intersection_with_line(segments[j])
+                if intersection is not None:
+                    intersections.append(intersection)
+    if len(intersections) == 0:
+        return None, 0
+    labels = DBSCAN(eps=region_width / 80, min_samples=1).fit(intersections).labels_
+    n_clusters_ = len(set(labels)) - (1 if -1 in labels else 0)
+    intersections = np.array(intersections)
+    clusters = sorted([intersections[labels == i] for i in range(n_clusters_)], key=len)
+    largest_cluster = clusters[-1]
+    sum_x, sum_y = [sum(idx) for idx in zip(*largest_cluster)]
+    return Point(round(sum_x / len(largest_cluster)), round(sum_y / len(largest_cluster))), len(largest_cluster)
+
+
+def get_synthetic_lines(nr_lines, nr_outliers, random_state):
+    '''
+    Generates road like segments converging to a random vanishing point, plus random outlier segments
+    '''
+    vp = random_state.uniform((REGION_WIDTH * 0.3, 0), (REGION_WIDTH * 0.7, REGION_HEIGHT * 0.3))
+    ends = np.column_stack([random_state.uniform(0, REGION_WIDTH, nr_lines), np.full(nr_lines, REGION_HEIGHT)])
+    starts_ratio = random_state.uniform(0.1, 0.6, size=(nr_lines, 1))
+    starts = vp + (ends - vp) * starts_ratio + random_state.normal(0, 1, size=(nr_lines, 2))
+    lines = np.hstack([starts, ends])
+    outliers = random_state.uniform((0, 0, 0, 0), (REGION_WIDTH, REGION_HEIGHT, REGION_WIDTH, REGION_HEIGHT),
+                                    size=(nr_outliers, 4))
+    return np.round(np.vstack([lines, outliers]))
+
+
+def get_distance(point_a, point_b):
+    if point_a is None or point_b is None:
+        return 0 if point_a is None and point_b is None else np.inf
+    return max(abs(point_a.x - point_b.x), abs(point_a.y - point_b.y))
+
+
+def benchmark_line_sets(nr_sets, nr_lines, nr_outliers, seed):
+    logger = logging.getLogger(__name__)
+    random_state = np.random.RandomState(seed)
+    line_sets = [get_synthetic_lines(nr_lines, nr_outliers, random_state) for _ in range(nr_sets)]
+    start = time.time()
+    reference_results = [pairwise_best_solution(lines, REGION_WIDTH) for lines in line_sets]
+    reference_time = (time.time() - start) / nr_sets
+    logger.info("pairwise reference {:.3f} ms/set".format(reference_time * 1000))
+    for clustering in [DBSCAN_CLUSTERING, GRID_CLUSTERING]:
+        detector = VanishingPointDetector(clustering=clustering)
+        start = time.time()
+        results = [detector.compute_best_solution(lines, REGION_WIDTH) for lines in line_sets]
+        elapsed_time = (time.time() - start) / nr_sets
+        distances = np.array([get_distance(result[0], reference[0])
+                              for result, reference in zip(results, reference_results)])
+        logger.info("vectorized {:6s} {:.3f} ms/set speedup {:.1f}x within {} px {:.2%} max distance {}".format(
+            clustering, elapsed_time * 1000, reference_time / elapsed_time, PIXEL_TOLERANCE,
+            np.mean(distances <= PIXEL_TOLERANCE), distances.max()))
+
+
+def benchmark_folder(input_folder, max_number_of_images):
+    logger = logging.getLogger(__name__)
+    images = [apollo_python_common.image.get_bgr(file_name)
+              for file_name in io_utils.get_images_from_folder(input_folder)[:max_number_of_images]]
+    results = dict()
+    for clustering in [DBSCAN_CLUSTERING, GRID_CLUSTERING]:
+        detector = VanishingPointDetector(clustering=clustering)
+        start = time.time()
+        results[clustering] = [detector.get_vanishing_point(image)[0] for image in images]
+        logger.info("{:6s} {:.3f} ms/image".format(clustering, (time.time() - start) * 1000 / max(len(images), 1)))
+    distances = np.array([get_distance(grid_vp, dbscan_vp) for grid_vp, dbscan_vp in
+                          zip(results[GRID_CLUSTERING], results[DBSCAN_CLUSTERING])])
+    # the images are full size, so the tolerance is scaled from the reference width
+    tolerance = PIXEL_TOLERANCE * max([image.shape[1] for image in images] + [REGION_WIDTH]) / REGION_WIDTH
+    logger.info("grid vs dbscan within {:.1f} px {:.2%}".format(tolerance, np.mean(distances <= tolerance)))
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Benchmark for the vanishing point intersections and clustering.')
+    parser.add_argument('--nr_sets', type=int, default=200, help='Number of synthetic line sets.')
+    parser.add_argument('--nr_lines', type=int, default=14, help='Converging lines in a synthetic set.')
+    parser.add_argument('--nr_outliers', type=int, default=6, help='Random lines in a synthetic set.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--input_folder', type=str, default=None,
+                        help='Optional folder with images on which the clustering methods are also compared.')
+    parser.add_argument('--max_number_of_images', type=int, default=100)
+    return parser.parse_args(args)
+
+
+def main():
+    log_util.config(__file__)
+    args = parse_args(sys.argv[1:])
+    benchmark_line_sets(args.nr_sets, args.nr_lines, args.nr_outliers, args.seed)
+    if args.input_folder is not None:
+        benchmark_folder(args.input_folder, args.max_number_of_images)
+
+
+if __name__ == '__main__':
+    main()
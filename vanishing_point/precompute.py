@@ -0,0 +1,136 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+from multiprocessing import Pool
+
+from tqdm import tqdm
+
+import apollo_python_common.image
+import apollo_python_common.io_utils as io_utils
+import apollo_python_common.log_util as log_util
+import apollo_python_common.proto_api as proto_api
+from apollo_python_common.lightweight_types import Point
+from vanishing_point.vanishing_point import VanishingPointDetector
+
+# stored for the images where no vanishing point was found, so that they are not processed again
+NO_VANISHING_POINT = Point(0, 0)
+
+# detector of the current worker process
+_vp_detector = None
+
+
+def __init_worker():
+    global _vp_detector
+    _vp_detector = VanishingPointDetector()
+
+
+def compute_vanishing_point(image_path):
+    '''
+    Computes the vanishing point of an image file in a worker process
+    :return: image path, vanishing point and confidence
+    '''
+    logger = logging.getLogger(__name__)
+    try:
+        vp, confidence = _vp_detector.get_vanishing_point(apollo_python_common.image.get_bgr(image_path))
+    except Exception as err:
+        logger.warning('Image {} could not be processed: {}'.format(image_path, err))
+        return image_path, None, 0
+    if vp is None:
+        return image_path, NO_VANISHING_POINT, 0
+    return image_path, vp, confidence
+
+
+def compute_vanishing_points(image_paths, nr_processes):
+    '''
+    Computes the vanishing points of the images using a process pool
+    :return: dictionary image path -> (vanishing point, confidence) for the images that could be read
+    '''
+    vanishing_points = dict()
+    with Pool(nr_processes, initializer=__init_worker) as pool:
+        for image_path, vp, confidence in tqdm(pool.imap_unordered(compute_vanishing_point, image_paths,
+                                                                   chunksize=8), total=len(image_paths)):
+            if vp is not None:
+                vanishing_points[image_path] = (vp, confidence)
+    return vanishing_points
+
+
+def precompute_metadata(metadata, images_folder, nr_processes, overwrite=False):
+    '''
+    Stores the vanishing point of every image of an ImageSet in its features
+    :param metadata: ImageSet protobuf, updated in place
+    :param images_folder: folder where the images of the ImageSet are located
+    :param nr_processes: number of worker processes
+    :param overwrite: when False, the images already having a vanishing point are skipped
+    :return: the updated metadata
+    '''
+    image_protos = dict()
+    for image_proto in metadata.images:
+        if overwrite or proto_api.get_vanishing_point(image_proto)[0] is None:
+            image_path = os.path.join(images_folder, os.path.basename(image_proto.metadata.image_path))
+            image_protos.setdefault(image_path, []).append(image_proto)
+    vanishing_points = compute_vanishing_points(list(image_protos.keys()), nr_processes)
+    for image_path, (vp, confidence) in vanishing_points.items():
+        for image_proto in image_protos[image_path]:
+            proto_api.set_vanishing_point(image_proto, vp, confidence)
+    return metadata
+
+
+def precompute_folder(input_folder, nr_processes):
+    '''
+    Creates an ImageSet with the vanishing points of all images of a folder
+    '''
+    metadata = proto_api.get_new_metadata_file()
+    image_paths = sorted(io_utils.get_images_from_folder(input_folder))
+    vanishing_points = compute_vanishing_points(image_paths, nr_processes)
+    for image_path in image_paths:
+        if image_path in vanishing_points:
+            image_proto = metadata.images.add()
+            image_proto.metadata.image_path = os.path.basename(image_path)
+            image_proto.metadata.region = ""
+            image_proto.metadata.trip_id = ""
+            image_proto.metadata.image_index = 0
+            vp, confidence = vanishing_points[image_path]
+            proto_api.set_vanishing_point(image_proto, vp, confidence)
+    return metadata
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Precomputes the vanishing points of images into metadata.')
+    parser.add_argument('-i', '--input_path', type=str, required=True,
+                        help='Folder with the images.')
+    parser.add_argument('-r', '--rois_file', type=str, required=False, default=None,
+                        help='Optional metadata file whose images are updated (e.g. rois.bin). When missing, '
+                             'a new metadata file is created with all the images from the input folder.')
+    parser.add_argument('-o', '--output_path', type=str, required=False, default='./')
+    parser.add_argument('-n', '--output_name', type=str, required=False, default='rois_vp',
+                        help='Name of the output metadata file, without extension.')
+    parser.add_argument('-p', '--nr_processes', type=int, required=False, default=multiprocessing.cpu_count())
+    parser.add_argument('--overwrite', action='store_true',
+                        help='Recompute the vanishing points already present in the metadata file.')
+    return parser.parse_args(args)
+
+
+def main():
+    log_util.config(__file__)
+    logger = logging.getLogger(__name__)
+    args = parse_args(sys.argv[1:])
+    if args.rois_file is not None:
+        metadata = precompute_metadata(proto_api.read_metadata(args.rois_file), args.input_path,
+                                       args.nr_processes, args.overwrite)
+    else:
+        metadata = precompute_folder(args.input_path, args.nr_processes)
+    proto_api.serialize_metadata(metadata, args.output_path, args.output_name)
+    logger.info('Vanishing points of {} images saved in {}'.format(len(metadata.images), args.output_path))
+
+
+if __name__ == '__main__':
+    main()
@@ -7,14 +7,15 @@ file, You can obtain one at http://mozilla.org/MPL/2.0/.
 """
 import math
 import numpy as np
-from operator import methodcaller
 
 import cv2
 from sklearn.cluster import DBSCAN
 
-from apollo_python_common.geometry.line_segment import LineSegment
 from apollo_python_common.lightweight_types import Point
 
+DBSCAN_CLUSTERING = "dbscan"
+GRID_CLUSTERING = "grid"
+
 
 class VanishingPointDetector(object):
     # thresholds for almost vertical
@@ -26,14 +27,18 @@ class VanishingPointDetector(object):
     # angle threshold for 2 lines to be considered parallel
     ANGLE_THRESHOLD = math.cos(3 * np.pi / 180)
 
-    def __init__(self, image_width_reference_size=640, nr_used_lines=20):
+    def __init__(self, image_width_reference_size=640, nr_used_lines=20, clustering=DBSCAN_CLUSTERING):
         '''
         Constructor for the vanishing point detector
         :param image_width_reference_size: image width for scale at which computations should be done
         :param nr_used_lines: number of lines used in computing the vanishing point
+        :param clustering: DBSCAN_CLUSTERING or GRID_CLUSTERING, the method used to group line intersections
         '''
+        if clustering not in (DBSCAN_CLUSTERING, GRID_CLUSTERING):
+            raise ValueError("Clustering method {} is not supported".format(clustering))
         self.image_width_reference_size = image_width_reference_size
         self.nr_used_lines = nr_used_lines
+        self.clustering = clustering
         self.gray_image = None
         self.resized_gray_image = None
         self.edges_image = None
@@ -47,52 +52,86 @@ class VanishingPointDetector(object):
         lines = cv2.HoughLinesP(binary_image, rho_resolution, theta_resolution,
                                 bin_threshold, minLineLength=min_line_length, maxLineGap=max_line_gap)
         if lines is None:
-            return []
-        segment_lines = []
-        for line in lines:
-            x1, y1, x2, y2 = line[0]
-            segment_lines.append(LineSegment(Point(x1, y1), Point(x2, y2)))
-        return segment_lines
-
-    def __is_valid_orientation(self, line):
-        slope = line.slope()
-        if slope == None:
-            return False
-        return (slope < self.LIMIT1 and slope > self.LIMIT3) or (slope < self.LIMIT4 and slope > self.LIMIT2)
+            return np.zeros((0, 4))
+        # one line per row: x1, y1, x2, y2
+        return lines.reshape(-1, 4).astype(np.float64)
 
     def __filter_lines(self, lines):
-        filtered_lines = [line for line in lines if self.__is_valid_orientation(line)]
-        return filtered_lines
-
-    def __get_clusters(self, intersections, region_width):
-        if len(intersections) == 0:
-            return []
-        distance_threshold = region_width / 80
-        db = DBSCAN(distance_threshold, 1).fit(intersections)
-        labels = db.labels_
+        dx = lines[:, 2] - lines[:, 0]
+        dy = lines[:, 3] - lines[:, 1]
+        not_vertical = dx != 0
+        slopes = np.zeros(len(lines))
+        slopes[not_vertical] = dy[not_vertical] / dx[not_vertical]
+        valid_orientation = ((slopes < self.LIMIT1) & (slopes > self.LIMIT3)) | \
+                            ((slopes < self.LIMIT4) & (slopes > self.LIMIT2))
+        return lines[not_vertical & valid_orientation]
+
+    def __get_dbscan_clusters(self, intersections, distance_threshold):
+        labels = DBSCAN(eps=distance_threshold, min_samples=1).fit(intersections).labels_
         # Number of clusters in labels, ignoring noise if present.
         n_clusters_ = len(set(labels)) - (1 if -1 in labels else 0)
-        intersections = np.array(intersections)
         clusters = [intersections[labels == i] for i in range(n_clusters_)]
         clusters.sort(key=len)
         return clusters
 
-    def __compute_best_solution(self, lines, region_width):
-        intersections = []
-        for i in range(len(lines) - 1):
-            for j in range(i+1, len(lines)):
-                if not lines[i].is_parallel_with_line(lines[j], self.ANGLE_THRESHOLD):
-                    intersection = lines[i].get_intersection_with_line(lines[j])
-                    if intersection is not None:
-                        intersections.append(intersection)
+    def __get_grid_clusters(self, intersections, cell_size):
+        '''
+        Approximates the DBSCAN clustering with a histogram over a grid of cell_size cells: the largest cluster is
+        made of the points of the 3x3 cells block holding the most intersections
+        '''
+        cells = np.floor(intersections / cell_size).astype(np.int64)
+        unique_cells, cell_indexes, cell_counts = np.unique(cells, axis=0, return_inverse=True, return_counts=True)
+        cell_indexes = cell_indexes.reshape(-1)
+        neighbours = np.abs(unique_cells[:, None, :] - unique_cells[None, :, :]).max(axis=2) <= 1
+        block_counts = neighbours.dot(cell_counts)
+        best_cell = np.argmax(block_counts)
+        return [intersections[neighbours[best_cell][cell_indexes]]]
+
+    def __get_clusters(self, intersections, region_width):
+        if len(intersections) == 0:
+            return []
+        distance_threshold = region_width / 80
+        if self.clustering == GRID_CLUSTERING:
+            return self.__get_grid_clusters(intersections, distance_threshold)
+        return self.__get_dbscan_clusters(intersections, distance_threshold)
+
+    def get_line_intersections(self, lines):
+        '''
+        Computes the intersections of all pairs of non parallel lines
+        :param lines: (N, 4) array with one x1, y1, x2, y2 line per row
+        :return: (M, 2) array with the intersection points, in the order of the (i, j), i < j line pairs
+        '''
+        first, second = np.triu_indices(len(lines), 1)
+        line_a, line_b = lines[first], lines[second]
+        ux, uy = line_a[:, 2] - line_a[:, 0], line_a[:, 3] - line_a[:, 1]
+        vx, vy = line_b[:, 2] - line_b[:, 0], line_b[:, 3] - line_b[:, 1]
+        # lines with a difference of ANGLE_THRESHOLD degrees (or less) are considered parallel
+        dot_product = ux * vx + uy * vy
+        parallel = dot_product ** 2 > (ux ** 2 + uy ** 2) * (vx ** 2 + vy ** 2) * self.ANGLE_THRESHOLD ** 2
+        d = ux * vy - uy * vx
+        valid = ~parallel & (d != 0)
+        line_a, line_b, ux, uy, vx, vy, d = line_a[valid], line_b[valid], ux[valid], uy[valid], vx[valid], \
+                                            vy[valid], d[valid]
+        pre = line_a[:, 0] * line_a[:, 3] - line_a[:, 2] * line_a[:, 1]
+        post = line_b[:, 0] * line_b[:, 3] - line_b[:, 2] * line_b[:, 1]
+        x = (pre * -vx + ux * post) / d
+        y = (pre * -vy + uy * post) / d
+        return np.stack([x, y], axis=1)
+
+    def compute_best_solution(self, lines, region_width):
+        '''
+        Computes the vanishing point as the center of the largest cluster of line intersections
+        :param lines: (N, 4) array with one x1, y1, x2, y2 line per row
+        :param region_width: width of the image the lines were detected in
+        :return: vanishing point and the number of intersections in its cluster
+        '''
+        intersections = self.get_line_intersections(lines)
         clusters = self.__get_clusters(intersections, region_width)
         if len(clusters) > 0:
             # compute the vanishing point by getting an average center of the cluster
             largest_cluster = clusters[-1]
-            sum_x, sum_y = [sum(idx) for idx in zip(*largest_cluster)]
             solution_cluster_size = len(largest_cluster)
-            solution_x = round(sum_x / solution_cluster_size)
-            solution_y = round(sum_y / solution_cluster_size)
+            solution_x, solution_y = np.round(largest_cluster.mean(axis=0))
             return Point(solution_x, solution_y), solution_cluster_size
         return None, 0
 
@@ -128,11 +167,12 @@ class VanishingPointDetector(object):
         if len(filtered_lines) == 0:
             return None, 0
 
-        filtered_lines = sorted(filtered_lines, key=methodcaller('approx_length'), reverse=True)
-        filtered_used_lines = filtered_lines[:self.nr_used_lines]
+        approx_lengths = np.abs(filtered_lines[:, 0] - filtered_lines[:, 2]) + \
+                         np.abs(filtered_lines[:, 1] - filtered_lines[:, 3])
+        filtered_used_lines = filtered_lines[np.argsort(-approx_lengths, kind='mergesort')[:self.nr_used_lines]]
 
         resized_frame_width = self.resized_gray_image.shape[1]
-        vp_result, solution_cluster_size = self.__compute_best_solution(filtered_used_lines, resized_frame_width)
+        vp_result, solution_cluster_size = self.compute_best_solution(filtered_used_lines, resized_frame_width)
 
         if vp_result is None:
             return None, 0
@@ -0,0 +1,157 @@
+"""
+Copyright 2018-2019 Telenav (http://telenav.com)
+
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0. If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+import apollo_python_common.proto_api as proto_api
+from apollo_python_common.lightweight_types import Point
+from vanishing_point.vanishing_point import VanishingPointDetector
+
+DEFAULT_TRIP_ID = ""
+
+
+class TripState(object):
+    def __init__(self):
+        self.vp_x = None
+        self.vp_y = None
+        self.confidence = 0
+        self.frame_shape = None
+        self.last_image_index = None
+        self.frames_since_detection = 0
+        self.thumbnail = None
+
+    def has_estimate(self):
+        return self.vp_x is not None
+
+
+class VanishingPointTracker(object):
+    '''
+    Reuses the vanishing point between consecutive frames of a trip. The images of a trip come from the same
+    dashboard mount, so the full detector is run only every redetect_interval frames, or when the cheap check fails:
+    a change of the frame size, a gap in the image indexes or a large change of the frame thumbnail. The
+    detections of a trip are smoothed with an exponential moving average.
+    The tracker keeps per trip state, so it should be used by one thread, on frames given in trip order.
+    '''
+
+    def __init__(self, detector=None, redetect_interval=10, smoothing_factor=0.3, min_confidence=0.2,
+                 max_image_index_gap=5, max_thumbnail_difference=40, confidence_decay=0.9, max_trips=64):
+        '''
+        :param detector: vanishing point detector used for the full detections
+        :param redetect_interval: number of frames after which the full detector is run again
+        :param smoothing_factor: weight of a new detection in the smoothed estimate
+        :param min_confidence: detections below this confidence do not update the estimate
+        :param max_image_index_gap: larger gaps between consecutive image indexes trigger a full detection
+        :param max_thumbnail_difference: mean gray level difference of the frame thumbnails which triggers a full
+        detection
+        :param confidence_decay: factor applied to the confidence of the estimate when a full detection fails
+        :param max_trips: number of trips for which the state is kept
+        '''
+        self.detector = detector if detector is not None else VanishingPointDetector()
+        self.redetect_interval = redetect_interval
+        self.smoothing_factor = smoothing_factor
+        self.min_confidence = min_confidence
+        self.max_image_index_gap = max_image_index_gap
+        self.max_thumbnail_difference = max_thumbnail_difference
+        self.confidence_decay = confidence_decay
+        self.max_trips = max_trips
+        self.trip_states = OrderedDict()
+        self.nr_detections = 0
+        self.nr_reused = 0
+
+    def __get_trip_state(self, trip_id):
+        if trip_id in self.trip_states:
+            self.trip_states.move_to_end(trip_id)
+        else:
+            self.trip_states[trip_id] = TripState()
+            if len(self.trip_states) > self.max_trips:
+                self.trip_states.popitem(last=False)
+        return self.trip_states[trip_id]
+
+    @staticmethod
+    def __get_thumbnail(frame):
+        # the lower half holds the road, which changes slowly between consecutive frames of a trip
+        lower_half = frame[frame.shape[0] // 2:, :]
+        thumbnail = cv2.resize(lower_half, (32, 16), interpolation=cv2.INTER_AREA).astype(np.float32)
+        return thumbnail.mean(axis=2) if thumbnail.ndim > 2 else thumbnail
+
+    def __needs_detection(self, state, frame, image_index, thumbnail):
+        if not state.has_estimate() or state.frames_since_detection >= self.redetect_interval:
+            return True
+        if state.frame_shape != frame.shape[:2]:
+            return True
+        if image_index is not None and state.last_image_index is not None and \
+                abs(image_index - state.last_image_index) > self.max_image_index_gap:
+            return True
+        return np.abs(thumbnail - state.thumbnail).mean() > self.max_thumbnail_difference
+
+    def __update_estimate(self, state, vp, confidence):
+        if vp is None or confidence < self.min_confidence:
+            state.confidence *= self.confidence_decay
+            return
+        if state.has_estimate():
+            state.vp_x += self.smoothing_factor * (vp.x - state.vp_x)
+            state.vp_y += self.smoothing_factor * (vp.y - state.vp_y)
+            state.confidence += self.smoothing_factor * (confidence - state.confidence)
+        else:
+            state.vp_x, state.vp_y, state.confidence = float(vp.x), float(vp.y), confidence
+
+    def get_vanishing_point(self, frame, trip_id=DEFAULT_TRIP_ID, image_index=None):
+        '''
+        Computes or reuses the vanishing point of a frame
+        :param frame: BGR or Grayscale image
+        :param trip_id: id of the trip the frame belongs to
+        :param image_index: index of the frame in the trip
+        :return: vanishing point and confidence
+        '''
+        state = self.__get_trip_state(trip_id)
+        thumbnail = self.__get_thumbnail(frame)
+        if self.__needs_detection(state, frame, image_index, thumbnail):
+            vp, confidence = self.detector.get_vanishing_point(frame)
+            self.nr_detections += 1
+            if state.frame_shape != frame.shape[:2]:
+                # the estimate of another frame size can not be reused
+                state = self.trip_states[trip_id] = TripState()
+            self.__update_estimate(state, vp, confidence)
+            state.frame_shape = frame.shape[:2]
+            state.frames_since_detection = 0
+            state.thumbnail = thumbnail
+        else:
+            self.nr_reused += 1
+            state.frames_since_detection += 1
+        state.last_image_index = image_index
+        if not state.has_estimate():
+            return vp, confidence
+        return Point(int(round(state.vp_x)), int(round(state.vp_y))), state.confidence
+
+    def reset(self):
+        '''
+        Forgets the state of all trips, e.g. before the frames of another folder whose trip ids are not known
+        '''
+        self.trip_states = OrderedDict()
+
+    def update_image_proto(self, image_proto, frame):
+        '''
+        Computes the vanishing point of a frame, using the trip id and image index from its metadata, and stores it
+        in the image features
+        :return: vanishing point and confidence
+        '''
+        vp, confidence = self.get_vanishing_point(frame, image_proto.metadata.trip_id,
+                                                  image_proto.metadata.image_index)
+        if vp is not None:
+            proto_api.set_vanishing_point(image_proto, vp, confidence)
+        return vp, confidence
+
+    def reuse_ratio(self):
+        nr_frames = self.nr_detections + self.nr_reused
+        return self.nr_reused / nr_frames if nr_frames > 0 else 0
+
+    def __str__(self):
+        return "full detections = {} reused = {} reuse ratio = {:.2%}".format(self.nr_detections, self.nr_reused,
+                                                                              self.reuse_ratio())